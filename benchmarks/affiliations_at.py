@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Benchmark of point-in-time affiliation lookups.
+
+It measures the time needed by utils.EnrollmentsIndex, the structure
+behind api.affiliations_at, to resolve (uuid, date) pairs over a
+synthetic set of enrollments. As a reference, the same pairs are
+resolved scanning the list of enrollments of each unique identity,
+like the callers of api.enrollments do, but without querying
+the database.
+"""
+
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sortinghat.db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE
+from sortinghat.utils import EnrollmentsIndex
+
+
+ORGANIZATIONS = ['Organization %d' % i for i in range(100)]
+
+
+def generate_enrollments(nuids, max_enrollments, rnd):
+    """Generate consecutive enrollment periods for each unique identity"""
+
+    enrollments = {}
+
+    for i in range(nuids):
+        uuid = '%040x' % i
+        periods = []
+
+        nperiods = rnd.randint(1, max_enrollments)
+        years = sorted(rnd.sample(range(1990, 2020), nperiods - 1))
+        start = MIN_PERIOD_DATE
+
+        for year in years + [None]:
+            end = datetime.datetime(year, 1, 1) if year else MAX_PERIOD_DATE
+            periods.append((start, end, rnd.choice(ORGANIZATIONS)))
+            start = end + datetime.timedelta(days=1)
+
+        enrollments[uuid] = periods
+
+    return enrollments
+
+
+def generate_pairs(uuids, nlookups, rnd):
+    start = datetime.datetime(1985, 1, 1)
+    days = 365 * 40
+
+    return [(rnd.choice(uuids), start + datetime.timedelta(days=rnd.randrange(days)))
+            for _ in range(nlookups)]
+
+
+def scan(enrollments, pairs):
+    results = []
+
+    for uuid, date in pairs:
+        org = None
+        for start, end, name in enrollments.get(uuid, []):
+            if start <= date <= end:
+                org = name
+                break
+        results.append(org)
+
+    return results
+
+
+def lookup(enrollments, pairs):
+    index = EnrollmentsIndex()
+
+    for uuid, periods in enrollments.items():
+        for start, end, name in periods:
+            index.add(uuid, start, end, name)
+
+    return index.find_all(pairs)
+
+
+def main():
+    args = parse_args()
+    rnd = random.Random(args.seed)
+
+    enrollments = generate_enrollments(args.uidentities, args.enrollments, rnd)
+    pairs = generate_pairs(list(enrollments), args.lookups, rnd)
+
+    print("%d unique identities; %d lookups" % (len(enrollments), len(pairs)))
+
+    t0 = time.perf_counter()
+    result = lookup(enrollments, pairs)
+    elapsed = time.perf_counter() - t0
+    print("%-8s %10.2f s %12.0f lookups/s" % ('index', elapsed, len(pairs) / elapsed))
+
+    if not args.no_scan:
+        t0 = time.perf_counter()
+        expected = scan(enrollments, pairs)
+        elapsed = time.perf_counter() - t0
+        print("%-8s %10.2f s %12.0f lookups/s" % ('scan', elapsed, len(pairs) / elapsed))
+
+        if result != expected:
+            raise RuntimeError("results do not match")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--lookups', type=int, default=10000000,
+                        help="number of (uuid, date) pairs to resolve")
+    parser.add_argument('-u', '--uidentities', type=int, default=200000,
+                        help="number of unique identities")
+    parser.add_argument('-e', '--enrollments', type=int, default=5,
+                        help="maximum number of enrollments per unique identity")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="seed of the random generator")
+    parser.add_argument('--no-scan', action='store_true',
+                        help="do not run the linear scan reference")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""Micro-benchmark of utils.str_to_datetime.
+
+It compares the time needed to convert the dates written by the
+exporter (i.e. '2100-01-01T00:00:00') and other formats against
+calling dateutil directly, which was the former implementation.
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+import dateutil.parser
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sortinghat.utils import str_to_datetime
+
+
+DATES = {
+    'iso': '2100-01-01T00:00:00',
+    'iso-date': '2001-12-01',
+    'iso-microseconds': '2013-06-01T12:30:45.123456',
+    'iso-timezone': '2013-06-01T12:30:45+02:00',
+    'other': '13-01-2001'
+}
+
+
+def dateutil_to_datetime(ts):
+    return dateutil.parser.parse(ts).replace(tzinfo=None)
+
+
+def main():
+    args = parse_args()
+
+    print("%-18s %14s %15s %8s" % ('format', 'dateutil (us)', 'sortinghat (us)', 'speedup'))
+
+    for name, ts in DATES.items():
+        before = bench(dateutil_to_datetime, ts, args.number, args.repeat)
+        after = bench(str_to_datetime, ts, args.number, args.repeat)
+        print("%-18s %14.2f %15.2f %7.1fx" % (name, before, after, before / after))
+
+
+def bench(func, ts, number, repeat):
+    """Return the best time of a call, in microseconds"""
+
+    timer = timeit.Timer(lambda: func(ts))
+    best = min(timer.repeat(repeat=repeat, number=number))
+    return best / number * 1000000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help="calls on each round")
+    parser.add_argument('-r', '--repeat', type=int, default=5,
+                        help="number of rounds")
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    main()
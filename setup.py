@@ -116,6 +116,9 @@ setup(name="sortinghat",
           'requests>=2.9',
           'urllib3>=1.22'
       ],
+      extras_require={
+          'msgpack': ['msgpack>=1.0']
+      },
       cmdclass=cmdclass,
       zip_safe=False
       )
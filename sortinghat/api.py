@@ -19,8 +19,12 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import collections
+import functools
 import logging
 
+from sqlalchemy import distinct, func, select
+
 from . import utils
 from .db.api import (add_unique_identity as add_unique_identity_db,
                      add_identity as add_identity_db,
@@ -41,16 +45,69 @@ from .db.api import (add_unique_identity as add_unique_identity_db,
                      find_unique_identity,
                      find_identity,
                      find_organization,
-                     find_domain)
+                     find_domain,
+                     search_identities_ngrams)
 from .db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE, \
     UniqueIdentity, Identity, Profile, Organization, Domain, Country, Enrollment, \
-    MatchingBlacklist
+    MatchingBlacklist, DeletedUniqueIdentity
 from .exceptions import AlreadyExistsError, NotFoundError, InvalidValueError
 
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of unique identities on each query
+AFFILIATIONS_QUERY_SIZE = 1000
+
+# Number of rows fetched at once by iterators
+ITER_FETCH_SIZE = 10000
+
+# Number of unique identities read on each batch
+ITER_UIDENTITIES_BATCH_SIZE = 1000
+
+# Columns available on identity and enrollment records
+IDENTITY_COLUMNS = ('id', 'uuid', 'name', 'email', 'username', 'source', 'last_modified')
+ENROLLMENT_COLUMNS = ('uuid', 'organization', 'start', 'end')
 
+
+def _read_through(entity, key):
+    """Cache the results of a lookup when the database cache is enabled.
+
+    `key` receives the same arguments of the decorated function and
+    returns the key of the entry; when it returns `None` the cache is
+    bypassed. A copy of the cached list is returned on each call.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(db, *args, **kwargs):
+            cache = getattr(db, 'cache', None)
+            entry = key(db, *args, **kwargs) if cache is not None else None
+
+            if entry is None:
+                return func(db, *args, **kwargs)
+
+            return list(cache.get(entity, entry,
+                                  lambda: func(db, *args, **kwargs)))
+        return wrapper
+    return decorator
+
+
+def _invalidates(*entities):
+    """Invalidate the cached entities modified by a write function"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(db, *args, **kwargs):
+            try:
+                return func(db, *args, **kwargs)
+            finally:
+                cache = getattr(db, 'cache', None)
+                if cache is not None:
+                    cache.invalidate(*entities)
+        return wrapper
+    return decorator
+
+
+@_invalidates('uidentities')
 def add_unique_identity(db, uuid):
     """Add a unique identity to the registry.
 
@@ -73,6 +130,7 @@ def add_unique_identity(db, uuid):
             raise InvalidValueError(e)
 
 
+@_invalidates('uidentities', 'search_totals')
 def add_identity(db, source, email=None, name=None, username=None, uuid=None):
     """Add an identity to the registry.
 
@@ -137,6 +195,7 @@ def add_identity(db, source, email=None, name=None, username=None, uuid=None):
         return identity_id
 
 
+@_invalidates('organizations')
 def add_organization(db, organization):
     """Add an organization to the registry.
 
@@ -160,6 +219,7 @@ def add_organization(db, organization):
             raise InvalidValueError(e)
 
 
+@_invalidates('organizations', 'domains')
 def add_domain(db, organization, domain, is_top_domain=False, overwrite=False):
     """Add a domain to the registry.
 
@@ -215,6 +275,7 @@ def add_domain(db, organization, domain, is_top_domain=False, overwrite=False):
             raise InvalidValueError(e)
 
 
+@_invalidates('uidentities')
 def add_enrollment(db, uuid, organization, from_date=None, to_date=None):
     """Enroll a unique identity to an organization.
 
@@ -276,6 +337,7 @@ def add_enrollment(db, uuid, organization, from_date=None, to_date=None):
             raise InvalidValueError(e)
 
 
+@_invalidates('blacklist')
 def add_to_matching_blacklist(db, entity):
     """Add entity to the matching blacklist.
 
@@ -298,6 +360,7 @@ def add_to_matching_blacklist(db, entity):
             raise InvalidValueError(e)
 
 
+@_invalidates('uidentities')
 def edit_profile(db, uuid, **kwargs):
     """Edit unique identity profile.
 
@@ -336,6 +399,7 @@ def edit_profile(db, uuid, **kwargs):
             raise InvalidValueError(e)
 
 
+@_invalidates('uidentities', 'search_totals')
 def delete_unique_identity(db, uuid):
     """Remove a unique identity from the registry.
 
@@ -363,6 +427,7 @@ def delete_unique_identity(db, uuid):
         delete_unique_identity_db(session, uidentity)
 
 
+@_invalidates('uidentities', 'search_totals')
 def delete_identity(db, identity_id):
     """Remove an identity from the registry.
 
@@ -389,6 +454,7 @@ def delete_identity(db, identity_id):
         delete_identity_db(session, identity)
 
 
+@_invalidates('uidentities', 'organizations', 'domains')
 def delete_organization(db, organization):
     """Remove an organization from the registry.
 
@@ -413,6 +479,7 @@ def delete_organization(db, organization):
         delete_organization_db(session, org)
 
 
+@_invalidates('organizations', 'domains')
 def delete_domain(db, organization, domain):
     """Remove an organization from the registry.
 
@@ -443,6 +510,7 @@ def delete_domain(db, organization, domain):
         delete_domain_db(session, dom)
 
 
+@_invalidates('uidentities')
 def delete_enrollment(db, uuid, organization, from_date=None, to_date=None):
     """Withdraw a unique identity from an organization.
 
@@ -506,6 +574,7 @@ def delete_enrollment(db, uuid, organization, from_date=None, to_date=None):
             raise NotFoundError(entity=entity)
 
 
+@_invalidates('blacklist')
 def delete_from_matching_blacklist(db, entity):
     """Remove an blacklisted entity from the registry.
 
@@ -530,6 +599,7 @@ def delete_from_matching_blacklist(db, entity):
         delete_from_matching_blacklist_db(session, mb)
 
 
+@_invalidates('uidentities', 'search_totals')
 def merge_unique_identities(db, from_uuid, to_uuid):
     """Merge one unique identity into another.
 
@@ -614,7 +684,7 @@ def merge_unique_identities(db, from_uuid, to_uuid):
         # to avoid deletion of identities when removing 'fuid'
         session.commit()
 
-        delete_unique_identity_db(session, fuid)
+        delete_unique_identity_db(session, fuid, merged_into=tuid.uuid)
 
         # Retrieve of organizations to merge the enrollments,
         # before closing the session
@@ -629,6 +699,7 @@ def merge_unique_identities(db, from_uuid, to_uuid):
         merge_enrollments(db, to_uuid, org)
 
 
+@_invalidates('uidentities')
 def merge_enrollments(db, uuid, organization):
     """Merge overlapping enrollments.
 
@@ -703,6 +774,7 @@ def merge_enrollments(db, uuid, organization):
             delete_enrollment_db(session, enr)
 
 
+@_invalidates('uidentities', 'search_totals')
 def move_identity(db, from_id, to_uuid):
     """Move an identity to a unique identity.
 
@@ -786,6 +858,7 @@ def match_identities(db, uuid, matcher):
     return uidentities
 
 
+@_read_through('uidentities', lambda db, uuid=None, source=None: (uuid, source) if uuid else None)
 def unique_identities(db, uuid=None, source=None):
     """List the unique identities available in the registry.
 
@@ -833,6 +906,65 @@ def unique_identities(db, uuid=None, source=None):
     return uidentities
 
 
+def iter_unique_identities(db, source=None, batch_size=ITER_UIDENTITIES_BATCH_SIZE):
+    """Iterate over the unique identities of the registry.
+
+    The function generates the same unique identities returned by
+    `unique_identities`, sorted by UUID, but they are read in batches
+    of `batch_size` unique identities. Each batch is read on its own
+    session using the UUID of the last unique identity of the previous
+    batch as the starting point, so only one batch of objects is
+    loaded at a time. When `source` is given, only those unique
+    identities with one or more identities related to that source
+    will be returned.
+
+    Take into account changes made while the iterator is consumed
+    might be visible on the next batches.
+
+    :param db: database manager
+    :param source: source of the identities
+    :param batch_size: number of unique identities read on each batch
+
+    :returns: a generator of unique identities
+
+    :raises InvalidValueError: raised when `batch_size` is lower than one
+    """
+    if batch_size < 1:
+        raise InvalidValueError('batch_size must be greater than 0 - %s given'
+                                % str(batch_size))
+
+    return _iter_unique_identities(db, source, batch_size)
+
+
+def _iter_unique_identities(db, source, batch_size):
+    after = None
+
+    while True:
+        with db.connect() as session:
+            query = session.query(UniqueIdentity)
+
+            if source:
+                uuids = session.query(Identity.uuid).\
+                    filter(Identity.source == source)
+                query = query.filter(UniqueIdentity.uuid.in_(uuids.subquery()))
+            if after is not None:
+                query = query.filter(UniqueIdentity.uuid > after)
+
+            uidentities = query.order_by(UniqueIdentity.uuid).\
+                limit(batch_size).all()
+
+            # Detach objects from the session
+            session.expunge_all()
+
+        for uidentity in uidentities:
+            yield uidentity
+
+        if len(uidentities) < batch_size:
+            break
+
+        after = uidentities[-1].uuid
+
+
 def search_unique_identities(db, term, source=None):
     """Look for unique identities.
 
@@ -849,7 +981,6 @@ def search_unique_identities(db, term, source=None):
         any unique identity from the registry
     """
     uidentities = []
-    pattern = '%' + term + '%' if term else None
 
     with db.connect() as session:
         query = session.query(UniqueIdentity).\
@@ -859,11 +990,8 @@ def search_unique_identities(db, term, source=None):
         if source:
             query = query.filter(Identity.source == source)
 
-        if pattern:
-            query = query.filter(Identity.name.like(pattern) |
-                                 Identity.email.like(pattern) |
-                                 Identity.username.like(pattern) |
-                                 Identity.source.like(pattern))
+        if term:
+            query = _filter_by_term(query, term)
         else:
             query = query.filter((Identity.name.is_(None)) |
                                  (Identity.email.is_(None)) |
@@ -902,7 +1030,6 @@ def search_unique_identities_slice(db, term, offset, limit):
         `offset` or `limit` is lower than zero
     """
     uidentities = []
-    pattern = '%' + term + '%' if term else None
 
     if offset < 0:
         raise InvalidValueError('offset must be greater than 0 - %s given'
@@ -916,11 +1043,8 @@ def search_unique_identities_slice(db, term, offset, limit):
             join(Identity).\
             filter(UniqueIdentity.uuid == Identity.uuid)
 
-        if pattern:
-            query = query.filter(Identity.name.like(pattern) |
-                                 Identity.email.like(pattern) |
-                                 Identity.username.like(pattern) |
-                                 Identity.source.like(pattern))
+        if term:
+            query = _filter_by_term(query, term)
 
         query = query.group_by(UniqueIdentity).\
             order_by(UniqueIdentity.uuid)
@@ -939,6 +1063,103 @@ def search_unique_identities_slice(db, term, offset, limit):
     return uidentities, nuids
 
 
+def search_unique_identities_after(db, term, after=None, limit=100, total=False):
+    """Look for unique identities using a cursor.
+
+    This function returns up to `limit` unique identities which match
+    with the given `term`, sorted by UUID. The term will be compared
+    with name, email, username and source values of each identity.
+    When an empty term is given, all unique identities will be returned.
+
+    Only the unique identities with a UUID greater than `after` are
+    returned. To get the next page of results, pass the UUID of the
+    last unique identity returned. Unlike `search_unique_identities_slice`,
+    the cost of each page does not depend on its position.
+
+    When `total` is set, the function also returns the number of unique
+    identities that match `term`. When the database cache is enabled,
+    totals are cached for each term until identities are modified, so
+    they are only counted on the first page.
+
+    :param db: database manager
+    :param term: term to match with unique identities data
+    :param after: return the unique identities after this UUID; when
+        it is `None`, results start on the first unique identity
+    :param limit: maximum number of unique identities to return
+    :param total: return also the number of matching unique identities
+
+    :returns: a tuple with the list of unique identities and their
+        total; the total is `None` when `total` is not set
+
+    :raises InvalidValueError: raised when the given value of `limit`
+        is lower than zero
+    """
+
+    if limit < 0:
+        raise InvalidValueError('limit must be greater than 0 - %s given'
+                                % str(limit))
+
+    with db.connect() as session:
+        uuids = session.query(Identity.uuid)
+
+        if term:
+            uuids = _filter_by_term(uuids, term)
+
+        query = session.query(UniqueIdentity).\
+            filter(UniqueIdentity.uuid.in_(uuids.subquery()))
+
+        if after is not None:
+            query = query.filter(UniqueIdentity.uuid > after)
+
+        uidentities = query.order_by(UniqueIdentity.uuid).\
+            limit(limit).all()
+
+        nuids = None
+
+        if total:
+            nuids = _search_total(db, uuids, term)
+
+        # Detach objects from the session
+        session.expunge_all()
+
+    return uidentities, nuids
+
+
+def _filter_by_term(query, term):
+    """Filter a query on identities by a term.
+
+    Identities match when `term` is part of their name, email,
+    username or source. When possible, the candidates are
+    first reduced using the n-grams index.
+    """
+    pattern = '%' + term + '%'
+    candidates = search_identities_ngrams(query.session, term)
+
+    if candidates is not None:
+        query = query.filter(Identity.id.in_(candidates.subquery()))
+
+    query = query.filter(Identity.name.like(pattern) |
+                         Identity.email.like(pattern) |
+                         Identity.username.like(pattern) |
+                         Identity.source.like(pattern))
+
+    return query
+
+
+def _search_total(db, uuids, term):
+    """Count the unique identities of a search, using the cache when enabled"""
+
+    def count():
+        return uuids.with_entities(func.count(distinct(Identity.uuid))).scalar()
+
+    cache = getattr(db, 'cache', None)
+
+    if cache is None:
+        return count()
+
+    return cache.get('search_totals', term or '', count)
+
+
 def search_last_modified_identities(db, after):
     """Look for the uuids of identities modified on or after a given date.
 
@@ -980,6 +1201,31 @@ def search_last_modified_unique_identities(db, after):
     return uids
 
 
+def search_deleted_unique_identities(db, after):
+    """Look for the unique identities deleted on or after a given date.
+
+    This function returns the unique identities removed from the
+    registry on the given date or after it, including those that
+    were merged into other unique identities. The result is a list
+    of `DeletedUniqueIdentity` objects sorted by date of deletion.
+
+    :param db: database manager
+    :param after: look for unique identities deleted on or after this date
+
+    :returns: a list of deleted unique identities
+    """
+    with db.connect() as session:
+        query = session.query(DeletedUniqueIdentity).\
+            filter(DeletedUniqueIdentity.deleted_at >= after).\
+            order_by(DeletedUniqueIdentity.deleted_at, DeletedUniqueIdentity.id)
+        deleted = query.all()
+
+        # Detach objects from the session
+        session.expunge_all()
+
+    return deleted
+
+
 def search_profiles(db, no_gender=False):
     """List unique identities profiles.
 
@@ -1008,6 +1254,7 @@ def search_profiles(db, no_gender=False):
     return profiles
 
 
+@_read_through('organizations', lambda db, term=None: term or '')
 def registry(db, term=None):
     """List the organizations available in the registry.
 
@@ -1045,6 +1292,7 @@ def registry(db, term=None):
     return orgs
 
 
+@_read_through('domains', lambda db, domain=None, top=False: (domain, bool(top)))
 def domains(db, domain=None, top=False):
     """List the domains available in the registry.
 
@@ -1107,6 +1355,33 @@ def domains(db, domain=None, top=False):
     return doms
 
 
+def domains_trie(db):
+    """Load the domains available in the registry into a trie.
+
+    The function returns a `DomainsTrie` object with the domains of
+    the registry. Looking up a domain on the trie gives the same
+    results that `domains(db, domain=domain, top=True)` but without
+    querying the database each time, so it is suitable when many
+    domains have to be checked. Take into account the trie will not
+    include the changes done to the registry after loading it.
+
+    :param db: database manager
+
+    :returns: a `DomainsTrie` object which maps domain names to
+        `Domain` objects
+    """
+    trie = utils.DomainsTrie()
+
+    with db.connect() as session:
+        for dom in session.query(Domain).order_by(Domain.domain):
+            trie.add(dom.domain, dom, is_top=dom.is_top_domain)
+
+        # Detach objects from the session
+        session.expunge_all()
+
+    return trie
+
+
 def countries(db, code=None, term=None):
     """List the countries available in the registry.
 
@@ -1201,19 +1476,7 @@ def enrollments(db, uuid=None, organization=None, from_date=None, to_date=None):
     :raises InvalidValeError: it is raised in two cases, when "from_date" < 1900-01-01 or
         "to_date" > 2100-01-01; when "from_date > to_date".
     """
-    if not from_date:
-        from_date = MIN_PERIOD_DATE
-    if not to_date:
-        to_date = MAX_PERIOD_DATE
-
-    if from_date < MIN_PERIOD_DATE or from_date > MAX_PERIOD_DATE:
-        raise InvalidValueError("'from_date' %s is out of bounds" % str(from_date))
-    if to_date < MIN_PERIOD_DATE or to_date > MAX_PERIOD_DATE:
-        raise InvalidValueError("'to_date' %s is out of bounds" % str(to_date))
-
-    if from_date and to_date and from_date > to_date:
-        raise InvalidValueError("'from_date' %s cannot be greater than %s"
-                                % (from_date, to_date))
+    from_date, to_date = _check_period(from_date, to_date)
 
     enrollments = []
 
@@ -1253,6 +1516,210 @@ def enrollments(db, uuid=None, organization=None, from_date=None, to_date=None):
     return enrollments
 
 
+def iter_identities(db, source=None, uuid=None, columns=None):
+    """Iterate over the identities of the registry.
+
+    Instead of objects of the model, the function generates light
+    records (named tuples) with the values of the given `columns`
+    (see `IDENTITY_COLUMNS`); only these columns are read. Records
+    are read from the database in chunks of `ITER_FETCH_SIZE` rows
+    while they are generated, so this function is suitable to process
+    large registries. Identities are sorted by unique identity and id.
+
+    Take into account the session used to read the identities is
+    not closed until the iterator is exhausted or destroyed.
+
+    :param db: database manager
+    :param source: only return the identities from this source
+    :param uuid: only return the identities of this unique identity
+    :param columns: list of columns of each record; by default,
+        all the columns are returned
+
+    :returns: a generator of identity records
+
+    :raises InvalidValueError: raised when any of the columns
+        is not valid
+    """
+    identities = Identity.__table__
+
+    table_columns = {name: identities.c[name] for name in IDENTITY_COLUMNS}
+    columns = _check_columns(columns, IDENTITY_COLUMNS)
+
+    query = select([table_columns[name] for name in columns]).\
+        order_by(identities.c.uuid, identities.c.id)
+
+    if source:
+        query = query.where(identities.c.source == source)
+    if uuid:
+        query = query.where(identities.c.uuid == uuid)
+
+    return _iter_records(db, query, _record_type('IdentityRecord', columns))
+
+
+def iter_enrollments(db, uuid=None, organization=None, from_date=None, to_date=None,
+                     columns=None):
+    """Iterate over the enrollments of the registry.
+
+    Instead of objects of the model, the function generates light
+    records (named tuples) with the values of the given `columns`
+    (see `ENROLLMENT_COLUMNS`). Enrollments are filtered the same way
+    `enrollments` does and they are also sorted by unique identity,
+    organization, start and end dates. Unlike `enrollments`, it does
+    not check whether `uuid` or `organization` exist.
+
+    Records are read from the database in chunks of `ITER_FETCH_SIZE`
+    rows while they are generated. Take into account the session used
+    to read the enrollments is not closed until the iterator is
+    exhausted or destroyed.
+
+    :param db: database manager
+    :param uuid: unique identifier
+    :param organization: name of the organization
+    :param from_date: date when the enrollment starts
+    :param to_date: date when the enrollment ends
+    :param columns: list of columns of each record; by default,
+        all the columns are returned
+
+    :returns: a generator of enrollment records
+
+    :raises InvalidValueError: raised when any of the columns is not
+        valid; when "from_date" < 1900-01-01 or "to_date" > 2100-01-01;
+        when "from_date > to_date".
+    """
+    enrollments = Enrollment.__table__
+    organizations = Organization.__table__
+
+    from_date, to_date = _check_period(from_date, to_date)
+
+    table_columns = {
+        'uuid': enrollments.c.uuid,
+        'organization': organizations.c.name,
+        'start': enrollments.c.start,
+        'end': enrollments.c.end
+    }
+    columns = _check_columns(columns, ENROLLMENT_COLUMNS)
+
+    query = select([table_columns[name] for name in columns]).\
+        select_from(enrollments.join(organizations,
+                                     enrollments.c.organization_id == organizations.c.id)).\
+        where(enrollments.c.start >= from_date).\
+        where(enrollments.c.end <= to_date).\
+        order_by(enrollments.c.uuid, organizations.c.name,
+                 enrollments.c.start, enrollments.c.end)
+
+    if uuid:
+        query = query.where(enrollments.c.uuid == uuid)
+    if organization:
+        query = query.where(organizations.c.name == organization)
+
+    return _iter_records(db, query, _record_type('EnrollmentRecord', columns))
+
+
+def _iter_records(db, query, record):
+    """Generate records from the rows of a query"""
+
+    with db.connect() as session:
+        result = session.execute(query.execution_options(stream_results=True))
+
+        while True:
+            rows = result.fetchmany(ITER_FETCH_SIZE)
+
+            if not rows:
+                break
+
+            for row in rows:
+                yield record._make(row)
+
+
+def _check_columns(columns, valid_columns):
+    """Check the columns requested for a record"""
+
+    if columns is None:
+        return valid_columns
+
+    columns = tuple(columns)
+
+    if not columns:
+        raise InvalidValueError("columns cannot be empty")
+
+    for column in columns:
+        if column not in valid_columns:
+            raise InvalidValueError("'%s' is not a valid column; valid columns are: %s"
+                                    % (column, ', '.join(valid_columns)))
+
+    return columns
+
+
+@functools.lru_cache(maxsize=None)
+def _record_type(name, columns):
+    return collections.namedtuple(name, columns)
+
+
+def _check_period(from_date, to_date):
+    """Check a period of time, setting its default limits"""
+
+    if not from_date:
+        from_date = MIN_PERIOD_DATE
+    if not to_date:
+        to_date = MAX_PERIOD_DATE
+
+    if from_date < MIN_PERIOD_DATE or from_date > MAX_PERIOD_DATE:
+        raise InvalidValueError("'from_date' %s is out of bounds" % str(from_date))
+    if to_date < MIN_PERIOD_DATE or to_date > MAX_PERIOD_DATE:
+        raise InvalidValueError("'to_date' %s is out of bounds" % str(to_date))
+
+    if from_date and to_date and from_date > to_date:
+        raise InvalidValueError("'from_date' %s cannot be greater than %s"
+                                % (from_date, to_date))
+
+    return from_date, to_date
+
+
+def affiliations_at(db, pairs):
+    """Find the organizations where unique identities were enrolled on some dates.
+
+    For each pair of unique identifier and date, the function returns
+    the name of the organization where that unique identity was enrolled
+    on that date. When the unique identity was not enrolled on any
+    organization or it does not exist, the result for that pair will be
+    `None`. Results are returned in the same order of the input pairs.
+
+    The enrollments of the unique identities are read only once, so this
+    function is suitable to resolve large number of pairs. When a unique
+    identity was enrolled in several organizations on the same date, the
+    first one in the order given by 'enrollments' (organization name,
+    start and end dates) is selected.
+
+    :param db: database manager
+    :param pairs: iterable of (uuid, date) tuples
+
+    :returns: a list with the names of the organizations
+    """
+    pairs = list(pairs)
+    uuids = sorted({uuid for uuid, _ in pairs})
+
+    index = utils.EnrollmentsIndex()
+
+    with db.connect() as session:
+        for i in range(0, len(uuids), AFFILIATIONS_QUERY_SIZE):
+            chunk = uuids[i:i + AFFILIATIONS_QUERY_SIZE]
+
+            query = session.query(Enrollment.uuid, Organization.name,
+                                  Enrollment.start, Enrollment.end).\
+                join(Organization).\
+                filter(Enrollment.uuid.in_(chunk)).\
+                order_by(Enrollment.uuid,
+                         Organization.name,
+                         Enrollment.start,
+                         Enrollment.end)
+
+            for uuid, name, start, end in query:
+                index.add(uuid, start, end, name)
+
+    return index.find_all(pairs)
+
+
+@_read_through('blacklist', lambda db, term=None: term or '')
 def blacklist(db, term=None):
     """List the blacklisted entities available in the registry.
 
@@ -23,17 +23,21 @@
 import argparse
 import sys
 
+from sqlalchemy import LargeBinary, cast, select
+from sqlalchemy.exc import OperationalError
+
 import sortinghat.db.database as db
 
 from sortinghat.db.model import MetricsGrimoireIdentity
 from sortinghat.exceptions import DatabaseError
 from sortinghat.utils import to_unicode
+from sortinghat.writer import SortingHatJSONWriter
 
 
 MG2SH_USAGE_MSG = \
     """%(prog)s [--help] [-u <user>] [-p <password>]
              [--host <host>] [--port <port>] -d <name>
-             -s <source> [-o <output>]"""
+             -s <source> [-o <output>] [--compact]"""
 
 MG2SH_DESC_MSG = \
     """Export identities information from Metrics Grimoire databases to
@@ -52,6 +56,7 @@ General options:
                         name of the identities source
   -o FILE, --output FILE
                         output file
+  --compact             write a compact JSON document, with no indentation
 """
 
 
@@ -61,18 +66,15 @@ def main():
     args = parse_args()
 
     try:
-        identities = fetch_identities(args.user, args.password,
-                                      args.database,
-                                      args.host, args.port)
-    except DatabaseError as e:
-        raise RuntimeError(str(e))
+        engine = db.create_database_engine(args.user, args.password,
+                                           args.database,
+                                           args.host, args.port)
+        identities = fetch_identities(engine)
 
-    json = to_json(identities, args.source)
-
-    try:
-        args.outfile.write(json)
+        write_json(args.outfile, identities, args.source,
+                   compact=args.compact)
         args.outfile.write('\n')
-    except IOError as e:
+    except (DatabaseError, IOError) as e:
         raise RuntimeError(str(e))
 
 
@@ -101,65 +103,106 @@ def parse_args():
     parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'),
                         default=sys.stdout,
                         help=argparse.SUPPRESS)
+    parser.add_argument('--compact', dest='compact', action='store_true',
+                        help=argparse.SUPPRESS)
 
     return parser.parse_args()
 
 
-def fetch_identities(user, password, database, host, port):
-    """Retrieve identities from a database"""
+def fetch_identities(engine):
+    """Retrieve identities from a database.
+
+    Identities are streamed from the database using a server-side
+    cursor and sorted by their identifiers, as strings. Each identity
+    is returned as a dict with its 'mg_id', 'name', 'email' and
+    'username' values.
 
-    engine = db.create_database_engine(user, password, database,
-                                       host, port)
-    session = db.create_database_session(engine)
+    The table is reflected and the query is run before returning the
+    iterator, so schema and database errors are raised before any
+    output is written.
+    """
     table = db.reflect_table(engine, MetricsGrimoireIdentity)
+    columns = MetricsGrimoireIdentity.map_columns(table)
 
-    query = session.query(MetricsGrimoireIdentity)
+    mg_id = columns['mg_id']
 
-    # Specific case for IRC or Wiki databases
-    if table.name == 'irclog' and 'nick' in table.columns:
-        query = query.filter(MetricsGrimoireIdentity._nick.isnot(None))
-        query = query.group_by(MetricsGrimoireIdentity._nick)
-    elif table.name == 'wiki_pages_revs' and 'user' in table.columns:
-        query = query.filter(MetricsGrimoireIdentity._user.isnot(None))
-        query = query.group_by(MetricsGrimoireIdentity._user)
+    if mg_id is None:
+        raise DatabaseError(error="Invalid schema. Identifier column not found",
+                            code="-1")
 
-    identities = query.all()
+    fields = [column.label(attr) for attr, column in columns.items()
+              if column is not None]
 
-    db.close_database_session(session)
+    # Casting to binary, the order of the identifiers is the
+    # same as the one of their string representation
+    query = select(fields).order_by(cast(mg_id, LargeBinary))
 
-    return identities
+    # Specific case for IRC or Wiki databases
+    if table.name == 'irclog' and 'nick' in table.columns:
+        query = query.where(table.c.nick.isnot(None))
+        query = query.group_by(table.c.nick)
+    elif table.name == 'wiki_pages_revs' and 'user' in table.columns:
+        query = query.where(table.c.user.isnot(None))
+        query = query.group_by(table.c.user)
 
+    conn = None
 
-def to_json(identities, source):
-    """Convert identities to Sorting Hat JSON format"""
+    try:
+        conn = engine.connect()
+        result = conn.execution_options(stream_results=True).execute(query)
+    except OperationalError as e:
+        if conn:
+            conn.close()
+        raise DatabaseError(error=e.orig.args[1], code=e.orig.args[0])
 
-    import datetime
-    import json
+    return _iter_identities(conn, result, columns)
 
-    uids = {}
 
-    for identity in identities:
-        uuid = to_unicode(identity.mg_id)
+def _iter_identities(conn, result, columns):
+    """Iterate over the rows of a result, closing the connection at the end"""
 
-        x = identity.to_dict()
-        x['id'] = uuid
-        x['uuid'] = uuid
-        x['source'] = source
+    try:
+        for row in result:
+            yield {attr: row[attr] if column is not None and row[attr] else None
+                   for attr, column in columns.items()}
+    except OperationalError as e:
+        raise DatabaseError(error=e.orig.args[1], code=e.orig.args[0])
+    finally:
+        conn.close()
 
-        uid = {'uuid': uuid,
-               'profile': None,
-               'enrollments': [],
-               'identities': [x]}
 
-        uids[uuid] = uid
+def write_json(outfile, identities, source, compact=False):
+    """Write identities to a file using Sorting Hat JSON format.
 
-    obj = {'time': str(datetime.datetime.now()),
-           'source': source,
-           'blacklist': [],
-           'organizations': {},
-           'uidentities': uids}
+    Identities must be sorted by the string representation of
+    their identifiers, which are used as UUIDs.
+    """
+    import datetime
 
-    return json.dumps(obj, indent=4, sort_keys=True)
+    header = {
+        'time': str(datetime.datetime.now()),
+        'source': source,
+        'blacklist': [],
+        'organizations': {}
+    }
+
+    with SortingHatJSONWriter(outfile, header, compact=compact) as writer:
+        for identity in identities:
+            uuid = to_unicode(identity['mg_id'])
+
+            x = {'name': identity['name'],
+                 'email': identity['email'],
+                 'username': identity['username'],
+                 'id': uuid,
+                 'uuid': uuid,
+                 'source': source}
+
+            uid = {'uuid': uuid,
+                   'profile': None,
+                   'enrollments': [],
+                   'identities': [x]}
+
+            writer.write(uuid, uid)
 
 
 if __name__ == '__main__':
@@ -61,6 +61,9 @@ Required parameters:
 
 Identity = collections.namedtuple('Identity', 'id uuid')
 
+# Number of rows inserted on each multi-row statement
+LOAD_BATCH_SIZE = 5000
+
 
 def main():
     """Link Sorting Hat unique identities to Metrics Grimoire identities"""
@@ -112,8 +115,8 @@ def parse_args():
                         help=argparse.SUPPRESS)
     parser.add_argument('-s', '--source', dest='source', required=True,
                         help=argparse.SUPPRESS)
-    parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
-                        default=sys.stdin,
+    parser.add_argument('infile', nargs='?', type=utils.InputFileType(),
+                        default='-',
                         help=argparse.SUPPRESS)
 
     return parser.parse_args()
@@ -173,15 +176,31 @@ def retrieve_mg_identities(engine, source):
 
 
 def find_matches(sh_ids, mg_ids):
-    """Find matches between Sorting Hat and Metrics Grimoire identities"""
+    """Find matches between Sorting Hat and Metrics Grimoire identities.
+
+    Metrics Grimoire identities are indexed by their UUIDs, so each
+    Sorting Hat identity is matched looking up its identifier on the
+    index. Duplicated Sorting Hat identities mean data are wrong;
+    they are reported and only their first occurrence is matched.
+    """
+    index = {}
+
+    for mg in mg_ids:
+        index.setdefault(mg.uuid, []).append(mg.id)
+
+    seen = set()
 
-    # Keep this two nested loops to find multiple duplicates,
-    # that will mean data are wrong
     for sh in sh_ids:
-        for mg in mg_ids:
-            if sh.id == mg.uuid:
-                m = {'uuid': sh.uuid, 'people_id': mg.id}
-                yield m
+        if sh.id in seen:
+            sys.stderr.write("Warning: duplicated identity %s found on unique identity %s. Skipping.\n"
+                             % (sh.id, sh.uuid))
+            continue
+
+        seen.add(sh.id)
+
+        for people_id in index.get(sh.id, []):
+            m = {'uuid': sh.uuid, 'people_id': people_id}
+            yield m
 
 
 def load_mapping(engine, mapping):
@@ -215,7 +234,7 @@ def load_mapping(engine, mapping):
             data.append(m)
             n += 1
 
-            if n % 50 == 0:
+            if n % LOAD_BATCH_SIZE == 0:
                 conn.execute(table.insert(), data)
                 data = []
 
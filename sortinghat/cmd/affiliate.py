@@ -20,16 +20,26 @@
 #
 
 import argparse
+import datetime
 import logging
 import re
 
+from sqlalchemy import or_
+
 from .. import api
 from ..command import Command, CMD_SUCCESS, HELP_LIST
-from ..exceptions import NotFoundError, InvalidValueError
+from ..db.api import search_identities_ngrams
+from ..db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE, \
+    UniqueIdentity, Identity, Enrollment
+from ..exceptions import NotFoundError, InvalidValueError, InvalidDateError
+from ..utils import str_to_datetime
 
 
 EMAIL_ADDRESS_PATTERN = re.compile(r"^(?P<email>[^\s@]+@[^\s@.]+\.[^\s@]+)$")
 
+AFFILIATE_BATCH_SIZE = 1000
+AFFILIATE_FETCH_SIZE = 10000
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,18 +48,30 @@ class Affiliate(Command):
 
     The command affiliates unique identities to organizations using email
     addresses and top/sub domains data. Only new enrollments will be created.
+
+    When '--since' is given, only those unique identities modified after
+    that date will be affiliated.
+
+    Other commands can run the affiliation on their own database
+    passing it with the `db` parameter.
     """
-    def __init__(self, **kwargs):
+    def __init__(self, db=None, **kwargs):
         super(Affiliate, self).__init__(**kwargs)
 
         self.parser = argparse.ArgumentParser(description=self.description,
                                               usage=self.usage)
 
+        self.parser.add_argument('--since', dest='since', default=None,
+                                 help="affiliate unique identities modified since this date (YYYY-MM-DD hh:mm:ss)")
+
         # Exit early if help is requested
         if 'cmd_args' in kwargs and [i for i in kwargs['cmd_args'] if i in HELP_LIST]:
             return
 
-        self._set_database(**kwargs)
+        if db:
+            self.db = db
+        else:
+            self._set_database(**kwargs)
 
     @property
     def description(self):
@@ -57,65 +79,167 @@ class Affiliate(Command):
 
     @property
     def usage(self):
-        return """%(prog)s affiliate"""
+        return """%(prog)s affiliate [--since <date>]"""
 
     def run(self, *args):
         """Affiliate unique identities to organizations."""
 
-        self.parser.parse_args(args)
+        params = self.parser.parse_args(args)
 
-        code = self.affiliate()
+        try:
+            since = str_to_datetime(params.since)
+        except InvalidDateError as e:
+            self.error(str(e))
+            return e.code
+
+        code = self.affiliate(since=since)
 
         return code
 
-    def affiliate(self):
+    def affiliate(self, since=None, domain=None):
         """Affiliate unique identities.
 
         This method enrolls unique identities to organizations using email
         addresses and top/sub domains data. Only new enrollments will be created.
+
+        The set of unique identities to affiliate can be reduced using
+        `since` and `domain` parameters. With `since`, only those unique
+        identities modified on or after that date will be checked. With
+        `domain`, only the email addresses of that domain or any of its
+        sub-domains will be checked; this is useful to affiliate unique
+        identities after adding a new domain to the registry.
+
+        Email addresses are read in batches of `AFFILIATE_BATCH_SIZE`
+        unique identities and only the enrollments of the identities
+        in the batch are loaded to check which ones are new. New
+        enrollments are inserted in batches of `AFFILIATE_BATCH_SIZE`
+        rows.
+
+        :param since: affiliate unique identities modified since this date
+        :param domain: affiliate only the email addresses on this domain
         """
         try:
-            uidentities = api.unique_identities(self.db)
+            domains = api.domains_trie(self.db)
 
-            for uid in uidentities:
-                uid.identities.sort(key=lambda x: x.id)
+            affiliations = []
 
-                for identity in uid.identities:
+            for emails, enrolled in self.__fetch_emails(since=since, domain=domain):
+                for uuid, email in emails:
                     # Only check email address to find new affiliations
-                    if not identity.email:
-                        continue
-                    if not EMAIL_ADDRESS_PATTERN.match(identity.email):
+                    if not EMAIL_ADDRESS_PATTERN.match(email):
                         continue
 
-                    domain = identity.email.split('@')[-1]
+                    email_domain = email.split('@')[-1]
+
+                    # Most specific domains go first
+                    doms = domains.lookup(email_domain)
 
-                    try:
-                        doms = api.domains(self.db, domain=domain, top=True)
-                    except NotFoundError as e:
+                    if not doms:
                         continue
 
                     if len(doms) > 1:
-                        doms.sort(key=lambda d: len(d.domain), reverse=True)
-
                         msg = "multiple top domains for %s sub-domain. Domain %s selected."
-                        msg = msg % (domain, doms[0].domain)
+                        msg = msg % (email_domain, doms[0].domain)
                         self.warning(msg)
 
-                    organization = doms[0].organization.name
+                    organization = doms[0].organization
 
                     # Check enrollments to avoid insert affiliation twice
-                    enrollments = api.enrollments(self.db, uid.uuid,
-                                                  organization)
-
-                    if enrollments:
+                    if (uuid, organization.id) in enrolled:
                         continue
 
-                    api.add_enrollment(self.db, uid.uuid, organization)
+                    enrolled.add((uuid, organization.id))
+                    affiliations.append((uuid, email, organization))
 
-                    self.display('affiliate.tmpl', id=uid.uuid,
-                                 email=identity.email, organization=organization)
+            for i in range(0, len(affiliations), AFFILIATE_BATCH_SIZE):
+                self.__enroll(affiliations[i:i + AFFILIATE_BATCH_SIZE])
         except (NotFoundError, InvalidValueError) as e:
             self.error(str(e))
             return e.code
 
         return CMD_SUCCESS
+
+    def __fetch_emails(self, since=None, domain=None):
+        """Get the email addresses of the identities in batches.
+
+        Email addresses are sorted by unique identity and grouped in
+        batches of `AFFILIATE_BATCH_SIZE` unique identities. Each batch
+        is returned together with the set of (uuid, organization id)
+        pairs already enrolled for its unique identities.
+
+        Email addresses are streamed from the database, so enrollments
+        are read using a different session; running another query on
+        the streaming connection would discard the pending rows.
+        """
+        with self.db.connect() as session:
+            query = session.query(Identity.uuid, Identity.email).\
+                filter(Identity.email.isnot(None), Identity.email != '')
+
+            if since:
+                query = query.join(UniqueIdentity).\
+                    filter(UniqueIdentity.last_modified >= since)
+            if domain:
+                # Addresses of the domain and of its sub-domains
+                domain = domain.strip('.')
+
+                # Use the n-grams index to avoid reading every email
+                candidates = search_identities_ngrams(session, domain)
+
+                if candidates is not None:
+                    query = query.filter(Identity.id.in_(candidates.subquery()))
+
+                query = query.filter(or_(Identity.email.endswith('@' + domain, autoescape=True),
+                                         Identity.email.endswith('.' + domain, autoescape=True)))
+
+            query = query.order_by(Identity.uuid, Identity.id).\
+                yield_per(AFFILIATE_FETCH_SIZE)
+
+            emails = []
+            uuids = set()
+
+            for uuid, email in query:
+                if uuid not in uuids and len(uuids) == AFFILIATE_BATCH_SIZE:
+                    yield emails, self.__fetch_enrollments(uuids)
+                    emails = []
+                    uuids = set()
+
+                emails.append((uuid, email))
+                uuids.add(uuid)
+
+            if emails:
+                yield emails, self.__fetch_enrollments(uuids)
+
+    def __fetch_enrollments(self, uuids):
+        """Get the set of (uuid, organization id) pairs enrolled for some unique identities"""
+
+        with self.db.connect() as session:
+            query = session.query(Enrollment.uuid, Enrollment.organization_id).\
+                filter(Enrollment.uuid.in_(uuids)).\
+                distinct()
+
+            return {(uuid, org_id) for uuid, org_id in query}
+
+    def __enroll(self, affiliations):
+        """Insert a batch of enrollments within a single transaction"""
+
+        enrollments = Enrollment.__table__
+        uidentities = UniqueIdentity.__table__
+
+        rows = [{'uuid': uuid, 'organization_id': organization.id,
+                 'start': MIN_PERIOD_DATE, 'end': MAX_PERIOD_DATE}
+                for uuid, _, organization in affiliations]
+        uuids = {uuid for uuid, _, _ in affiliations}
+
+        with self.db.connect() as session:
+            session.execute(enrollments.insert(), rows)
+
+            stmt = uidentities.update().\
+                where(uidentities.c.uuid.in_(uuids)).\
+                values(last_modified=datetime.datetime.utcnow())
+            session.execute(stmt)
+
+        self.db.invalidate_cache('uidentities')
+
+        for uuid, email, organization in affiliations:
+            self.display('affiliate.tmpl', id=uuid,
+                         email=email, organization=organization.name)
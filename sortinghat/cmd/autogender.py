@@ -20,18 +20,58 @@
 #
 
 import argparse
+import concurrent.futures
+import contextlib
+import csv
+import json
 import logging
+import mmap
+import os
 import re
+import struct
+import tempfile
 
 import requests
 import urllib3.util
 
 from .. import api
 from ..command import Command, CMD_SUCCESS, HELP_LIST
-from ..exceptions import NotFoundError, InvalidValueError
-
-
-AUTOGENDER_COMMAND_USAGE_MSG = """%(prog)s autogender [--api-token] [--all]"""
+from ..exceptions import NotFoundError, InvalidValueError, InvalidFormatError
+
+
+AUTOGENDER_COMMAND_USAGE_MSG = \
+    """%(prog)s autogender [--api-token] [--all] [--jobs <n>] [--cache-file <file>]
+                       [--backend {genderize,offline}] [--names-file <file>]
+   or: %(prog)s autogender --names-file <file> --build-index <file>"""
+
+GENDERIZE_BACKEND = 'genderize'
+OFFLINE_BACKEND = 'offline'
+
+GENDERIZE_API_URL = "https://api.genderize.io/"
+GENDERIZE_BATCH_SIZE = 10
+GENDERIZE_JOBS = 4
+
+TOTAL_RETRIES = 10
+MAX_RETRIES = 5
+SLEEP_TIME = 0.25
+STATUS_FORCELIST = [502]
+
+# Statuses returned by genderize.io when some name of the request is invalid
+NAME_ERROR_STATUSES = [422]
+
+# Gender index binary format: a header followed by fixed size
+# records sorted by name. Names are stored in lower case, UTF-8
+# encoded and padded with null bytes.
+GENDER_INDEX_MAGIC = b'SHGENDER'
+GENDER_INDEX_VERSION = 1
+GENDER_INDEX_NAME_SIZE = 32
+GENDER_INDEX_HEADER = struct.Struct('<8sB3xI')
+GENDER_INDEX_RECORD = struct.Struct('<%dsBB' % GENDER_INDEX_NAME_SIZE)
+GENDER_INDEX_CODES = {
+    None: 0,
+    'male': 1,
+    'female': 2
+}
 
 logger = logging.getLogger(__name__)
 
@@ -49,7 +89,20 @@ class AutoGender(Command):
 
     This command uses http://genderize.io API to guess the gender of
     a name. Registered users should use the option `--api-token` for
-    authentication.
+    authentication. Names are requested in batches of up to ten names,
+    using `--jobs` concurrent requests. With `--cache-file`, names
+    already resolved are stored in that file, so they will not be
+    requested again on later runs.
+
+    When `--backend offline` is given, the gender is inferred from
+    the names dataset set with `--names-file`, without accessing
+    the network. The dataset is a CSV file with rows of the form
+    `name,gender,count` (i.e `Mary,F,7065`) or a gender index built
+    from one of these files. Plain datasets are compiled into a
+    temporary index on each run, so large datasets should be compiled
+    once with `--build-index <file>`, which writes the index of the
+    dataset given in `--names-file` to that file. No gender data is
+    updated when this option is given.
     """
     def __init__(self, **kwargs):
         super(AutoGender, self).__init__(**kwargs)
@@ -62,6 +115,17 @@ class AutoGender(Command):
                                  help="genderize.io API token used for authentication")
         self.parser.add_argument('--all', dest='genderize_all', action='store_true',
                                  help="overwrite gender data for all the unique identities")
+        self.parser.add_argument('--jobs', dest='jobs', type=int, default=GENDERIZE_JOBS,
+                                 help="number of concurrent requests to genderize.io")
+        self.parser.add_argument('--cache-file', dest='cache_file', default=None,
+                                 help="file to store the gender of the names already resolved")
+        self.parser.add_argument('--backend', dest='backend', default=GENDERIZE_BACKEND,
+                                 choices=[GENDERIZE_BACKEND, OFFLINE_BACKEND],
+                                 help="service used to infer the gender of the names")
+        self.parser.add_argument('--names-file', dest='names_file', default=None,
+                                 help="names dataset or gender index used by the offline backend")
+        self.parser.add_argument('--build-index', dest='index_file', default=None,
+                                 help="write the gender index of the names dataset to this file")
 
         # Exit early if help is requested
         if 'cmd_args' in kwargs and [i for i in kwargs['cmd_args'] if i in HELP_LIST]:
@@ -81,27 +145,65 @@ class AutoGender(Command):
         """Autocomplete gender information."""
 
         params = self.parser.parse_args(args)
+
+        if params.index_file:
+            return self.build_index(params.names_file, params.index_file)
+
         api_token = params.api_token
         genderize_all = params.genderize_all
         code = self.autogender(api_token=api_token,
-                               genderize_all=genderize_all)
+                               genderize_all=genderize_all,
+                               jobs=params.jobs,
+                               cache_file=params.cache_file,
+                               backend=params.backend,
+                               names_file=params.names_file)
 
         return code
 
-    def autogender(self, api_token=None, genderize_all=False):
+    def autogender(self, api_token=None, genderize_all=False,
+                   jobs=GENDERIZE_JOBS, cache_file=None,
+                   backend=GENDERIZE_BACKEND, names_file=None):
         """Autocomplete gender information of unique identities.
 
         Autocomplete unique identities gender using genderize.io
         API. Only those unique identities without an assigned
         gender will be updated unless `genderize_all` option is given.
+
+        First names are requested in batches of `GENDERIZE_BATCH_SIZE`
+        names, running up to `jobs` requests at the same time. When
+        `cache_file` is given, resolved names are read from and
+        written to that file.
+
+        With the `offline` backend, the gender is inferred from
+        the names dataset or gender index given in `names_file`.
+        In this case, `api_token`, `jobs` and `cache_file` are
+        not used.
+
+        :param api_token: genderize.io API token
+        :param genderize_all: overwrite the gender of every unique identity
+        :param jobs: number of concurrent requests
+        :param cache_file: path to the persistent cache of names
+        :param backend: 'genderize' or 'offline'
+        :param names_file: names dataset used by the offline backend
         """
-        name_cache = {}
+        if backend == OFFLINE_BACKEND:
+            if not names_file:
+                self.error("names file is required by the offline backend")
+                return InvalidValueError.code
+            cache_file = None
+        elif backend != GENDERIZE_BACKEND:
+            self.error("backend %s is not supported" % backend)
+            return InvalidValueError.code
+        elif jobs < 1:
+            self.error("number of jobs must be greater than 0")
+            return InvalidValueError.code
+
         no_gender = not genderize_all
         pattern = re.compile(r"(^\w+)\s\w+")
 
-        profiles = api.search_profiles(self.db, no_gender=no_gender)
+        profiles = []
 
-        for profile in profiles:
+        for profile in api.search_profiles(self.db, no_gender=no_gender):
             if not profile.name:
                 continue
 
@@ -112,56 +214,380 @@ class AutoGender(Command):
                 continue
 
             firstname = m.group(1).lower()
+            profiles.append((profile.uuid, profile.name, firstname))
 
-            if firstname in name_cache:
-                gender_data = name_cache[firstname]
-            else:
+        with GenderCache(cache_file) as name_cache:
+            names = [firstname for _, _, firstname in profiles]
+
+            if backend == OFFLINE_BACKEND:
                 try:
-                    gender, acc = genderize(firstname, api_token)
-                except (requests.exceptions.RequestException,
-                        requests.exceptions.RetryError) as e:
+                    errors = self.__infer_names(names, name_cache, names_file)
+                except (IOError, InvalidFormatError) as e:
+                    self.error(str(e))
+                    return InvalidFormatError.code
+            else:
+                errors = self.__genderize_names(names, name_cache, api_token, jobs)
+
+            for uuid, name, firstname in profiles:
+                if firstname in errors:
                     msg = "Skipping '%s' name (%s) due to a connection error. Error: %s"
-                    msg = msg % (firstname, profile.uuid, str(e))
+                    msg = msg % (firstname, uuid, str(errors[firstname]))
                     self.warning(msg)
                     continue
 
+                gender_data = name_cache.get(firstname)
+
+                if not gender_data['gender']:
+                    continue
+
+                try:
+                    api.edit_profile(self.db, uuid, **gender_data)
+                    self.display('autogender.tmpl',
+                                 uuid=uuid, name=name,
+                                 gender_data=gender_data)
+                except (NotFoundError, InvalidValueError) as e:
+                    self.error(str(e))
+                    return e.code
+
+        return CMD_SUCCESS
+
+    def build_index(self, names_file, index_file):
+        """Build a gender index from a names dataset.
+
+        The index is written to `index_file`. It can be given to
+        the offline backend instead of the dataset, so the dataset
+        is not compiled again on each run.
+
+        :param names_file: names dataset
+        :param index_file: path where the index will be written
+        """
+        if not names_file:
+            self.error("names file is required to build a gender index")
+            return InvalidValueError.code
+
+        try:
+            nnames = build_gender_index([names_file], index_file)
+        except (IOError, InvalidFormatError) as e:
+            self.error(str(e))
+            return InvalidFormatError.code
+
+        self.display('autogender_index.tmpl',
+                     index_file=index_file, nnames=nnames)
+
+        return CMD_SUCCESS
+
+    def __genderize_names(self, names, name_cache, api_token, jobs):
+        """Resolve the names not cached yet; return the names that failed"""
+
+        # Remove duplicates keeping the order of the names
+        pending = list(dict.fromkeys(name for name in names
+                                     if name not in name_cache))
+
+        if not pending:
+            return {}
+
+        batches = [pending[i:i + GENDERIZE_BATCH_SIZE]
+                   for i in range(0, len(pending), GENDERIZE_BATCH_SIZE)]
+
+        errors = {}
+        session = create_genderize_session(pool_size=jobs)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(lambda batch: _genderize_batch(batch, api_token, session),
+                                   batches)
+
+            for result in results:
+                for name, (gender_data, error) in result.items():
+                    if error:
+                        errors[name] = error
+                    else:
+                        name_cache.add(name, gender_data)
+
+        session.close()
+
+        return errors
+
+    def __infer_names(self, names, name_cache, names_file):
+        """Resolve the names using a gender index"""
+
+        with open_gender_index(names_file) as index:
+            for name in names:
+                if name in name_cache:
+                    continue
+
+                gender, acc = index.lookup(name)
                 gender_data = {
                     'gender': gender,
                     'gender_acc': acc
                 }
-                name_cache[firstname] = gender_data
+                name_cache.add(name, gender_data)
 
-            if not gender_data['gender']:
-                continue
+        return {}
 
-            try:
-                api.edit_profile(self.db, profile.uuid, **gender_data)
-                self.display('autogender.tmpl',
-                             uuid=profile.uuid, name=profile.name,
-                             gender_data=gender_data)
-            except (NotFoundError, InvalidValueError) as e:
-                self.error(str(e))
-                return e.code
 
-        return CMD_SUCCESS
+class GenderCache:
+    """Cache of the gender data of first names.
 
+    When `path` is given, the contents of the cache are read from
+    that file and new entries are appended to it, one JSON object
+    per line. Otherwise, entries are only kept in memory.
 
-def genderize(name, api_token=None):
-    """Fetch gender from genderize.io"""
+    :param path: path to the file where the cache is stored
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self._entries = {}
+        self._fd = None
 
-    GENDERIZE_API_URL = "https://api.genderize.io/"
-    TOTAL_RETRIES = 10
-    MAX_RETRIES = 5
-    SLEEP_TIME = 0.25
-    STATUS_FORCELIST = [502]
+        if not path:
+            return
 
-    params = {
-        'name': name
-    }
+        line = ''
 
-    if api_token:
-        params['apikey'] = api_token
+        if os.path.exists(path):
+            with open(path, 'r') as fd:
+                for line in fd:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Skip incomplete entries
+                        continue
+                    self._entries[entry['name']] = {
+                        'gender': entry['gender'],
+                        'gender_acc': entry['gender_acc']
+                    }
+
+        self._fd = open(path, 'a')
+
+        # Do not append new entries to an incomplete one
+        if line and not line.endswith('\n'):
+            self._fd.write('\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name):
+        """Get the gender data of a name or `None` when it is not cached"""
+
+        return self._entries.get(name, None)
+
+    def add(self, name, gender_data):
+        """Add the gender data of a name to the cache"""
+
+        self._entries[name] = gender_data
+
+        if self._fd:
+            entry = {'name': name}
+            entry.update(gender_data)
+            self._fd.write(json.dumps(entry, sort_keys=True) + '\n')
+            self._fd.flush()
+
+    def close(self):
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+
+
+class GenderIndex:
+    """Memory mapped index to look up the gender of names.
+
+    The index is a binary file generated with `build_gender_index`.
+    The file is not loaded in memory; names are looked up with
+    a binary search over its records.
+
+    :param path: path to the index file
+
+    :raises InvalidFormatError: when the file is not a gender index
+    """
+    def __init__(self, path):
+        self.path = path
+        self._fd = open(path, 'rb')
+
+        try:
+            self._map = mmap.mmap(self._fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._fd.close()
+            raise InvalidFormatError(cause="%s is not a gender index" % path)
+
+        try:
+            magic, version, count = GENDER_INDEX_HEADER.unpack_from(self._map)
+        except struct.error:
+            magic, version, count = None, None, None
+
+        size = GENDER_INDEX_HEADER.size + count * GENDER_INDEX_RECORD.size if count else 0
+
+        if magic != GENDER_INDEX_MAGIC or version != GENDER_INDEX_VERSION \
+                or len(self._map) < size:
+            self.close()
+            raise InvalidFormatError(cause="%s is not a gender index" % path)
+
+        self._count = count
+        self._genders = {v: k for k, v in GENDER_INDEX_CODES.items()}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def lookup(self, name):
+        """Look up the gender of a name.
+
+        :param name: name to look up; it is case insensitive
+
+        :returns: a (gender, accuracy) tuple; (None, None) when
+            the name is not found
+        """
+        key = name.lower().encode('utf-8')
+
+        if len(key) > GENDER_INDEX_NAME_SIZE:
+            return None, None
+
+        key = key.ljust(GENDER_INDEX_NAME_SIZE, b'\0')
+
+        mm = self._map
+        header_size = GENDER_INDEX_HEADER.size
+        record_size = GENDER_INDEX_RECORD.size
+        lo, hi = 0, self._count
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = header_size + mid * record_size
+            current = mm[offset:offset + GENDER_INDEX_NAME_SIZE]
+
+            if current < key:
+                lo = mid + 1
+            elif current > key:
+                hi = mid
+            else:
+                _, code, acc = GENDER_INDEX_RECORD.unpack_from(mm, offset)
+                gender = self._genders.get(code, None)
+                return (gender, acc) if gender else (None, None)
+
+        return None, None
 
+    def close(self):
+        if self._map:
+            self._map.close()
+            self._map = None
+        if self._fd:
+            self._fd.close()
+            self._fd = None
+
+
+def build_gender_index(datasets, path):
+    """Build a gender index from a set of names datasets.
+
+    Each dataset is a CSV file where each row has a name, its
+    gender ('M' or 'F', 'male' or 'female') and the number of
+    people with that name and gender (i.e `Mary,F,7065`). Counts
+    of the same name are added. Names are stored with the gender
+    of the majority and the percentage of people with that gender
+    as its accuracy. Names with the same number of people of each
+    gender are stored without gender. Empty lines and names longer
+    than `GENDER_INDEX_NAME_SIZE` bytes are ignored.
+
+    :param datasets: list of paths to the datasets
+    :param path: path where the index will be written
+
+    :returns: the number of names stored in the index
+
+    :raises InvalidFormatError: when a row of a dataset is not valid
+    """
+    counts = {}
+
+    for dataset in datasets:
+        with open(dataset, 'r', newline='', encoding='utf-8') as fd:
+            for nline, row in enumerate(csv.reader(fd), start=1):
+                if not row:
+                    continue
+
+                try:
+                    name, gender, count = row[0], row[1], int(row[2])
+                    gender = gender.strip().lower()[0]
+                except (IndexError, ValueError):
+                    cause = "invalid row in %s, line %s" % (dataset, nline)
+                    raise InvalidFormatError(cause=cause)
+
+                if gender not in ('m', 'f'):
+                    cause = "invalid gender %s in %s, line %s" % (row[1], dataset, nline)
+                    raise InvalidFormatError(cause=cause)
+
+                key = name.strip().lower().encode('utf-8')
+
+                if not key or len(key) > GENDER_INDEX_NAME_SIZE:
+                    continue
+
+                entry = counts.setdefault(key, [0, 0])
+                entry[0 if gender == 'm' else 1] += count
+
+    with open(path, 'wb') as fd:
+        fd.write(GENDER_INDEX_HEADER.pack(GENDER_INDEX_MAGIC,
+                                          GENDER_INDEX_VERSION,
+                                          len(counts)))
+
+        for key in sorted(counts):
+            male, female = counts[key]
+            total = male + female
+
+            if male == female:
+                gender, acc = None, 0
+            elif male > female:
+                gender, acc = 'male', int(male * 100 / total)
+            else:
+                gender, acc = 'female', int(female * 100 / total)
+
+            fd.write(GENDER_INDEX_RECORD.pack(key, GENDER_INDEX_CODES[gender], acc))
+
+    return len(counts)
+
+
+@contextlib.contextmanager
+def open_gender_index(path):
+    """Open a gender index or build a temporary one from a dataset.
+
+    :param path: path to a gender index or to a names dataset
+    """
+    with open(path, 'rb') as fd:
+        is_index = fd.read(len(GENDER_INDEX_MAGIC)) == GENDER_INDEX_MAGIC
+
+    if is_index:
+        with GenderIndex(path) as index:
+            yield index
+        return
+
+    fd, index_path = tempfile.mkstemp(prefix='sortinghat_', suffix='.idx')
+    os.close(fd)
+
+    try:
+        build_gender_index([path], index_path)
+
+        with GenderIndex(index_path) as index:
+            yield index
+    finally:
+        os.remove(index_path)
+
+
+def create_genderize_session(pool_size=1):
+    """Create an HTTP session to request data to genderize.io.
+
+    Failed requests are retried on the connections of this session.
+    The session can be shared among threads.
+
+    :param pool_size: maximum number of connections to keep open
+    """
     session = requests.Session()
 
     retries = urllib3.util.Retry(total=TOTAL_RETRIES,
@@ -171,13 +597,127 @@ def genderize(name, api_token=None):
                                  backoff_factor=SLEEP_TIME,
                                  raise_on_status=True)
 
-    session.mount('http://', requests.adapters.HTTPAdapter(max_retries=retries))
-    session.mount('https://', requests.adapters.HTTPAdapter(max_retries=retries))
+    adapter = requests.adapters.HTTPAdapter(max_retries=retries,
+                                            pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def genderize(name, api_token=None, session=None):
+    """Fetch gender from genderize.io"""
+
+    params = {
+        'name': name
+    }
+
+    if api_token:
+        params['apikey'] = api_token
+
+    if not session:
+        session = create_genderize_session()
 
     r = session.get(GENDERIZE_API_URL, params=params)
     r.raise_for_status()
     result = r.json()
 
+    return _gender_from_result(result)
+
+
+def genderize_names(names, api_token=None, session=None):
+    """Fetch the gender of several names from genderize.io.
+
+    All the names are requested at once, so the list should not
+    be larger than the number of names allowed by genderize.io
+    on a request (see `GENDERIZE_BATCH_SIZE`).
+
+    :param names: list of names
+    :param api_token: genderize.io API token
+    :param session: HTTP session used for the request
+
+    :returns: a list of (gender, accuracy) tuples, one per name and
+        in the same order
+
+    :raises ValueError: when the response does not include the
+        result of every name
+    """
+    params = {
+        'name[]': names
+    }
+
+    if api_token:
+        params['apikey'] = api_token
+
+    if not session:
+        session = create_genderize_session()
+
+    r = session.get(GENDERIZE_API_URL, params=params)
+    r.raise_for_status()
+    results = r.json()
+
+    if len(results) != len(names):
+        msg = "%s results returned for %s names" % (len(results), len(names))
+        raise ValueError(msg)
+
+    genders = {result.get('name'): _gender_from_result(result)
+               for result in results}
+
+    for name in names:
+        if name not in genders:
+            raise ValueError("result for name %s not returned" % name)
+
+    return [genders[name] for name in names]
+
+
+def _genderize_batch(names, api_token, session):
+    """Genderize a batch of names.
+
+    When genderize.io rejects the batch because some of its names
+    are invalid, names are requested one by one so a wrong name
+    does not affect the rest of the batch. Other errors, like
+    connection errors or reaching the rate limit, are set for
+    every name of the batch without requesting them again.
+
+    :returns: a dict with a (gender_data, error) tuple for each name
+    """
+    errors = (requests.exceptions.RequestException, ValueError)
+
+    try:
+        genders = genderize_names(names, api_token, session)
+    except requests.exceptions.HTTPError as e:
+        if e.response is None or e.response.status_code not in NAME_ERROR_STATUSES:
+            return {name: (_gender_data(None, None), e) for name in names}
+        genders = None
+    except errors as e:
+        return {name: (_gender_data(None, None), e) for name in names}
+
+    results = {}
+
+    for i, name in enumerate(names):
+        error = None
+
+        if genders:
+            gender, acc = genders[i]
+        else:
+            try:
+                gender, acc = genderize(name, api_token, session)
+            except errors as e:
+                gender, acc, error = None, None, e
+
+        results[name] = (_gender_data(gender, acc), error)
+
+    return results
+
+
+def _gender_data(gender, acc):
+    return {
+        'gender': gender,
+        'gender_acc': acc
+    }
+
+
+def _gender_from_result(result):
     gender = result['gender']
     prob = result.get('probability', None)
 
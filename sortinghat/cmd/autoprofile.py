@@ -20,18 +20,23 @@
 #
 
 import argparse
-import collections
+import datetime
+import itertools
 import logging
 import re
 
-from .. import api
+from sqlalchemy import bindparam
+
 from ..command import Command, CMD_SUCCESS, HELP_LIST
-from ..exceptions import NotFoundError, InvalidValueError
+from ..db.model import UniqueIdentity, Identity, Profile
 
 
 AUTOPROFILE_COMMAND_USAGE_MSG = """%(prog)s autoprofile <source> ... <source>"""
 EMAIL_ADDRESS_REGEX = r"^(?P<email>[^\s@]+@[^\s@.]+\.[^\s@]+)$"
 
+AUTOPROFILE_BATCH_SIZE = 1000
+AUTOPROFILE_FETCH_SIZE = 10000
+
 logger = logging.getLogger(__name__)
 
 
@@ -83,12 +88,16 @@ class AutoProfile(Command):
         Autocomplete unique identities profiles using the information
         of their identities. The selection of the data used to fill
         the profile is prioritized using a list of sources.
+
+        Identities of the given sources are read in a single pass,
+        sorted by unique identity. Profiles are updated in batches
+        of `AUTOPROFILE_BATCH_SIZE` unique identities.
         """
         email_pattern = re.compile(EMAIL_ADDRESS_REGEX)
 
-        identities = self.__select_autocomplete_identities(sources)
+        profiles = []
 
-        for uuid, ids in identities.items():
+        for uuid, has_profile, ids in self.__select_autocomplete_identities(sources):
             # Among the identities (with the same priority) selected
             # to complete the profile, it will choose the longest 'name'.
             # If no name is available, it will use the field 'username'.
@@ -110,52 +119,88 @@ class AutoProfile(Command):
                 if not email and identity.email:
                     email = identity.email
 
-            kw = {
-                'name': name,
-                'email': email
-            }
+            profiles.append((uuid, has_profile, name or None,
+                             email or None, identity.source))
 
-            try:
-                api.edit_profile(self.db, uuid, **kw)
-                self.display('autoprofile.tmpl', identity=identity)
-            except (NotFoundError, InvalidValueError) as e:
-                self.error(str(e))
-                return e.code
+        for i in range(0, len(profiles), AUTOPROFILE_BATCH_SIZE):
+            self.__update_profiles(profiles[i:i + AUTOPROFILE_BATCH_SIZE])
 
         return CMD_SUCCESS
 
     def __select_autocomplete_identities(self, sources):
-        """Select the identities used for autocompleting"""
-
-        MIN_PRIORITY = 99999999
-
-        checked = {}
+        """Select the identities used for autocompleting.
 
-        for source in sources:
-            uids = api.unique_identities(self.db, source=source)
+        Generates a tuple for each unique identity with identities
+        from the given sources: its uuid, whether it has a profile
+        and the list of identities with the highest priority,
+        sorted by id.
 
-            for uid in uids:
-                if uid.uuid in checked:
-                    continue
-
-                max_priority = MIN_PRIORITY
+        Sources are filtered by the database, which ignores case,
+        so identities with a source that does not exactly match
+        any of the given ones are skipped.
+        """
+        priorities = {source: priority for priority, source
+                      in reversed(list(enumerate(sources)))}
+
+        with self.db.connect() as session:
+            query = session.query(Identity.uuid, Identity.id, Identity.source,
+                                  Identity.name, Identity.email, Identity.username,
+                                  Profile.uuid.label('profile')).\
+                outerjoin(Profile, Identity.uuid == Profile.uuid).\
+                filter(Identity.source.in_(sources)).\
+                order_by(Identity.uuid, Identity.id).\
+                yield_per(AUTOPROFILE_FETCH_SIZE)
+
+            for uuid, rows in itertools.groupby(query, key=lambda row: row.uuid):
+                max_priority = None
                 selected = []
+                has_profile = False
 
-                for identity in sorted(uid.identities, key=lambda x: x.id):
-                    try:
-                        priority = sources.index(identity.source)
+                for row in rows:
+                    has_profile = row.profile is not None
+                    priority = priorities.get(row.source, None)
 
-                        if priority < max_priority:
-                            selected = [identity]
-                            max_priority = priority
-                        elif priority == max_priority:
-                            selected.append(identity)
-                    except ValueError:
+                    if priority is None:
                         continue
 
-                checked[uid.uuid] = selected
-
-        identities = collections.OrderedDict(sorted(checked.items(),
-                                             key=lambda t: t[0]))
-
-        return identities
+                    if max_priority is None or priority < max_priority:
+                        selected = [row]
+                        max_priority = priority
+                    elif priority == max_priority:
+                        selected.append(row)
+
+                if selected:
+                    yield uuid, has_profile, selected
+
+    def __update_profiles(self, profiles):
+        """Update a batch of profiles within a single transaction"""
+
+        profiles_table = Profile.__table__
+        uidentities = UniqueIdentity.__table__
+
+        updates = [{'b_uuid': uuid, 'b_name': name, 'b_email': email}
+                   for uuid, has_profile, name, email, _ in profiles
+                   if has_profile]
+        inserts = [{'uuid': uuid, 'name': name, 'email': email}
+                   for uuid, has_profile, name, email, _ in profiles
+                   if not has_profile]
+        uuids = [uuid for uuid, _, _, _, _ in profiles]
+
+        with self.db.connect() as session:
+            if updates:
+                stmt = profiles_table.update().\
+                    where(profiles_table.c.uuid == bindparam('b_uuid')).\
+                    values(name=bindparam('b_name'), email=bindparam('b_email'))
+                session.execute(stmt, updates)
+            if inserts:
+                session.execute(profiles_table.insert(), inserts)
+
+            stmt = uidentities.update().\
+                where(uidentities.c.uuid.in_(uuids)).\
+                values(last_modified=datetime.datetime.utcnow())
+            session.execute(stmt)
+
+        self.db.invalidate_cache('uidentities')
+
+        for uuid, _, _, _, source in profiles:
+            self.display('autoprofile.tmpl', uuid=uuid, source=source)
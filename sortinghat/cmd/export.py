@@ -20,13 +20,39 @@
 #
 
 import argparse
+import concurrent.futures
+import contextlib
 import datetime
+import gzip
+import io
+import itertools
 import json
 import logging
 import sys
 
 from .. import api
 from ..command import Command, CMD_SUCCESS, HELP_LIST
+from ..db.database import POOL_SIZE, POOL_MAX_OVERFLOW
+from ..db.model import UniqueIdentity, Identity, Profile, \
+    Country, Enrollment, Organization
+from ..exceptions import InvalidValueError, InvalidDateError
+from ..utils import str_to_datetime
+from ..writer import SortingHatJSONWriter, SortingHatJSONLinesWriter, \
+    SortingHatMessagePackWriter
+
+
+EXPORT_FETCH_SIZE = 10000
+
+# Each job reads four streams, each one with its own connection,
+# so the number of jobs is limited by the connections of the pool
+EXPORT_JOB_CONNECTIONS = 4
+EXPORT_MAX_JOBS = (POOL_SIZE + POOL_MAX_OVERFLOW) // EXPORT_JOB_CONNECTIONS
+
+JSON_FORMAT = 'json'
+JSONL_FORMAT = 'jsonl'
+JSONL_GZ_FORMAT = 'jsonl.gz'
+MSGPACK_FORMAT = 'msgpack'
+EXPORT_FORMATS = [JSON_FORMAT, JSONL_FORMAT, JSONL_GZ_FORMAT, MSGPACK_FORMAT]
 
 logger = logging.getLogger(__name__)
 
@@ -42,6 +68,22 @@ class Export(Command):
     identities associated to that source.
 
     To export organizations and domains information use the option '--orgs'.
+
+    Identities can be written in other formats than the default JSON
+    document with '--format'. In 'jsonl', 'jsonl.gz' and 'msgpack'
+    formats, each unique identity is stored in its own record, so the
+    output can be split or processed in parallel. With '--jobs', ranges
+    of unique identities are exported at the same time into part files
+    named after the output file (i.e 'backup.part-0000.jsonl'). Take into
+    account each job needs four connections to the database, so up to
+    eight jobs can run at the same time.
+
+    With '--since', only the unique identities modified on or after
+    the given date are exported, together with the list of unique
+    identities deleted or merged since then. Deletions are stored under
+    the 'deleted' key of the header and they must be applied before
+    the exported unique identities. The 'until' key of the header has
+    the date to use as '--since' on the next export.
     """
     def __init__(self, **kwargs):
         super(Export, self).__init__(**kwargs)
@@ -59,10 +101,16 @@ class Export(Command):
         # General options
         self.parser.add_argument('--source', dest='source', default=None,
                                  help="source of the identities to export")
+        self.parser.add_argument('--format', dest='format', default=JSON_FORMAT,
+                                 choices=EXPORT_FORMATS,
+                                 help="format of the exported identities")
+        self.parser.add_argument('--jobs', dest='jobs', type=int, default=1,
+                                 help="number of part files exported at the same time")
+        self.parser.add_argument('--since', dest='since', default=None,
+                                 help="export changes made since this date (YYYY-MM-DD hh:mm:ss)")
 
         # Positional arguments
-        self.parser.add_argument('outfile', nargs='?', type=argparse.FileType('w'),
-                                 default=sys.stdout,
+        self.parser.add_argument('outfile', nargs='?', default='-',
                                  help="output file")
 
         # Exit early if help is requested
@@ -77,7 +125,10 @@ class Export(Command):
 
     @property
     def usage(self):
-        return "%(prog)s export --identities [--source <source>] [file]\n   or: %(prog)s export --orgs [file]"
+        usg = "%(prog)s export --identities [--source <source>] [--since <date>]"
+        usg += " [--format <format>] [--jobs <n>] [file]"
+        usg += "\n   or: %(prog)s export --orgs [file]"
+        return usg
 
     def run(self, *args):
         """Export data from the registry.
@@ -88,18 +139,57 @@ class Export(Command):
         """
         params = self.parser.parse_args(args)
 
-        with params.outfile as outfile:
-            if params.identities:
-                code = self.export_identities(outfile, params.source)
-            elif params.orgs:
-                code = self.export_organizations(outfile)
-            else:
-                # The running proccess never should reach this section
-                raise RuntimeError("Unexpected export option")
+        if params.jobs < 1:
+            e = InvalidValueError("number of jobs must be greater than 0")
+            self.error(str(e))
+            return e.code
+        if params.jobs > EXPORT_MAX_JOBS:
+            e = InvalidValueError("number of jobs must be lower or equal than %s" % EXPORT_MAX_JOBS)
+            self.error(str(e))
+            return e.code
+        if params.jobs > 1 and params.outfile == '-':
+            e = InvalidValueError("'--jobs' requires an output file")
+            self.error(str(e))
+            return e.code
+        if params.orgs and (params.format != JSON_FORMAT or params.jobs > 1):
+            e = InvalidValueError("organizations can only be exported to a single JSON file")
+            self.error(str(e))
+            return e.code
+        if params.orgs and params.since:
+            e = InvalidValueError("'--since' can only be used exporting identities")
+            self.error(str(e))
+            return e.code
+
+        try:
+            since = str_to_datetime(params.since)
+        except InvalidDateError as e:
+            self.error(str(e))
+            return e.code
+
+        if params.identities and params.jobs > 1:
+            return self.export_identities_parts(params.outfile, params.source,
+                                                fmt=params.format, jobs=params.jobs,
+                                                since=since)
+
+        try:
+            with open_outfile(params.outfile, params.format) as outfile:
+                if params.identities:
+                    code = self.export_identities(outfile, params.source,
+                                                  fmt=params.format, since=since)
+                elif params.orgs:
+                    code = self.export_organizations(outfile)
+                else:
+                    # The running proccess never should reach this section
+                    raise RuntimeError("Unexpected export option")
+        except ImportError as e:
+            self.error(str(e))
+            return InvalidValueError.code
+        except IOError as e:
+            raise RuntimeError(str(e))
 
         return code
 
-    def export_identities(self, outfile, source=None):
+    def export_identities(self, outfile, source=None, fmt=JSON_FORMAT, since=None):
         """Export identities information to a file.
 
         The method exports information related to unique identities, to
@@ -108,16 +198,74 @@ class Export(Command):
         When 'source' parameter is given, only those unique identities which have
         one or more identities from the given source will be exported.
 
-        :param outfile: destination file object
+        When 'since' parameter is given, only the changes made on or after
+        that date will be exported.
+
+        :param outfile: destination file object; it must be opened
+            in binary mode for 'msgpack' format
         :param source: source of the identities to export
+        :param fmt: format of the output
+        :param since: export changes made since this date
         """
         exporter = SortingHatIdentitiesExporter(self.db)
 
-        dump = exporter.export(source)
+        try:
+            exporter.export(source, outfile=outfile, fmt=fmt, since=since)
+
+            if fmt == JSON_FORMAT:
+                outfile.write('\n')
+        except IOError as e:
+            raise RuntimeError(str(e))
+
+        return CMD_SUCCESS
+
+    def export_identities_parts(self, filename, source=None, fmt=JSON_FORMAT, jobs=1,
+                                since=None):
+        """Export identities information to several files at the same time.
+
+        Unique identities are split in up to `jobs` ranges of UUIDs
+        with a similar number of unique identities. Each range is
+        exported to its own part file, named after `filename`, by a
+        different job. Each job needs `EXPORT_JOB_CONNECTIONS` connections,
+        so no more than `EXPORT_MAX_JOBS` jobs are allowed. The blacklist and the deleted unique identities
+        are only written on the first part.
+
+        :param filename: path used to name the part files
+        :param source: source of the identities to export
+        :param fmt: format of the output
+        :param jobs: number of parts exported at the same time
+        :param since: export changes made since this date
+        """
+        if jobs > EXPORT_MAX_JOBS:
+            e = InvalidValueError("number of jobs must be lower or equal than %s" % EXPORT_MAX_JOBS)
+            self.error(str(e))
+            return e.code
+
+        exporter = SortingHatIdentitiesExporter(self.db)
+        uuid_ranges = exporter.uuid_ranges(jobs, source=source, since=since)
+
+        # All the parts share the same end of the exported period
+        until = datetime.datetime.utcnow()
+
+        def export_part(npart):
+            part = part_filename(filename, fmt, npart)
+
+            with open_outfile(part, fmt) as outfile:
+                exporter.export(source, outfile=outfile, fmt=fmt,
+                                uuid_range=uuid_ranges[npart],
+                                include_blacklist=(npart == 0),
+                                include_deleted=(npart == 0),
+                                since=since, until=until)
+
+                if fmt == JSON_FORMAT:
+                    outfile.write('\n')
 
         try:
-            outfile.write(dump)
-            outfile.write('\n')
+            with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+                list(executor.map(export_part, range(len(uuid_ranges))))
+        except ImportError as e:
+            self.error(str(e))
+            return InvalidValueError.code
         except IOError as e:
             raise RuntimeError(str(e))
 
@@ -150,7 +298,7 @@ class IdentitiesExporter(object):
     def __init__(self, db):
         self.db = db
 
-    def export(self, source=None):
+    def export(self, source=None, outfile=None, fmt=JSON_FORMAT):
         raise NotImplementedError
 
 
@@ -165,7 +313,9 @@ class SortingHatIdentitiesExporter(IdentitiesExporter):
     def __init__(self, db):
         super(SortingHatIdentitiesExporter, self).__init__(db)
 
-    def export(self, source=None):
+    def export(self, source=None, outfile=None, fmt=JSON_FORMAT,
+               uuid_range=None, include_blacklist=True,
+               since=None, until=None, include_deleted=True):
         """Export a set of unique identities.
 
         Method to export unique identities from the registry. Identities schema
@@ -174,35 +324,246 @@ class SortingHatIdentitiesExporter(IdentitiesExporter):
         When source parameter is given, only those unique identities which have
         one or more identities from the given source will be exported.
 
-        :param source: source of the identities to export
+        Unique identities, profiles, identities and enrollments are read
+        as four streams sorted by UUID, which are merged while the
+        document is written. When `outfile` is given, the document is
+        written to it while it is generated.
 
-        :returns: a JSON formatted str
-        """
-        uidentities = {}
+        With `fmt`, the document can be written in JSON ('json'), as
+        records in JSON lines ('jsonl' and 'jsonl.gz') or as MessagePack
+        records ('msgpack'). Compression of 'jsonl.gz' format must be
+        handled by `outfile`.
 
-        uids = api.unique_identities(self.db, source=source)
+        When `since` is given, only the unique identities modified on or
+        after that date, or with any identity modified since then, are
+        exported. The header will also include the period of the changes
+        ('since' and 'until') and the list of unique identities deleted
+        or merged into others during it ('deleted'). Dates are compared
+        with the modification dates of the registry, which are in UTC.
 
-        for uid in uids:
-            enrollments = [rol.to_dict()
-                           for rol in api.enrollments(self.db, uuid=uid.uuid)]
+        :param source: source of the identities to export
+        :param outfile: file object where the document will be written
+        :param fmt: format of the document
+        :param uuid_range: only export the unique identities with
+            a UUID in this (start, end) range; see `uuid_ranges`
+        :param include_blacklist: export the entries of the blacklist
+        :param since: export changes made since this date
+        :param until: end of the period of changes written in the header;
+            by default, the current date
+        :param include_deleted: export the unique identities deleted
+            since `since`
+
+        :returns: a JSON formatted str (bytes for 'msgpack'); when
+            `outfile` is given, the document is not returned
+
+        :raises ValueError: when the format is not supported or
+            the data read from the registry is not sorted by UUID
+        """
+        if fmt == MSGPACK_FORMAT:
+            writer_class = SortingHatMessagePackWriter
+        elif fmt in (JSONL_FORMAT, JSONL_GZ_FORMAT):
+            writer_class = SortingHatJSONLinesWriter
+        elif fmt == JSON_FORMAT:
+            writer_class = SortingHatJSONWriter
+        else:
+            raise ValueError("format %s is not supported" % fmt)
 
-            u = uid.to_dict()
-            u['identities'].sort(key=lambda x: x['id'])
+        if outfile:
+            output = outfile
+        elif fmt == MSGPACK_FORMAT:
+            output = io.BytesIO()
+        else:
+            output = io.StringIO()
 
-            uidentities[uid.uuid] = u
-            uidentities[uid.uuid]['enrollments'] = enrollments
+        if include_blacklist:
+            blacklist = [mb.excluded for mb in api.blacklist(self.db)]
+        else:
+            blacklist = []
 
-        blacklist = [mb.excluded for mb in api.blacklist(self.db)]
+        header = {'time': str(datetime.datetime.now()),
+                  'source': source,
+                  'blacklist': blacklist,
+                  'organizations': {}}
 
-        obj = {'time': str(datetime.datetime.now()),
-               'source': source,
-               'blacklist': blacklist,
-               'organizations': {},
-               'uidentities': uidentities}
+        if since:
+            # Changes made after 'until' will be exported again
+            # on the next export
+            until = until or datetime.datetime.utcnow()
 
-        return json.dumps(obj, default=self._json_encoder,
-                          indent=4, separators=(',', ': '),
-                          sort_keys=True)
+            if include_deleted:
+                deleted = [d.to_dict() for d in api.search_deleted_unique_identities(self.db, since)]
+            else:
+                deleted = []
+
+            header['since'] = since
+            header['until'] = until
+            header['deleted'] = deleted
+
+        filters = (source, since, uuid_range)
+
+        # Each stream needs its own connection to be read at the same time
+        with contextlib.ExitStack() as stack:
+            sessions = [stack.enter_context(self.db.connect())
+                        for _ in range(EXPORT_JOB_CONNECTIONS)]
+
+            uuids = self.__fetch_uuids(sessions[0], *filters)
+            streams = [self.__fetch_profiles(sessions[1], *filters),
+                       self.__fetch_identities(sessions[2], *filters),
+                       self.__fetch_enrollments(sessions[3], *filters)]
+
+            with writer_class(output, header,
+                              default=self._json_encoder) as writer:
+                for uuid, (prfs, ids, rols) in _merge_by_uuid(uuids, *streams):
+                    uid = {
+                        'uuid': uuid,
+                        'profile': prfs[0] if prfs else None,
+                        'identities': ids,
+                        'enrollments': rols
+                    }
+                    writer.write(uuid, uid)
+
+        if not outfile:
+            return output.getvalue()
+
+    def uuid_ranges(self, n, source=None, since=None):
+        """Split the unique identities into ranges of UUIDs.
+
+        Ranges have a similar number of unique identities. When
+        there are less than `n` unique identities, fewer ranges
+        are returned.
+
+        :param n: maximum number of ranges
+        :param source: only count the unique identities with
+            identities from this source
+        :param since: only count the unique identities modified
+            since this date
+
+        :returns: a list of (start, end) tuples; `start` is included in
+            the range while `end` is not; `None` stands for no limit
+        """
+        with self.db.connect() as session:
+            query = session.query(UniqueIdentity.uuid)
+            query = self.__filter(query, UniqueIdentity.uuid, source, since, None)
+
+            total = query.count()
+            query = query.order_by(UniqueIdentity.uuid)
+
+            bounds = []
+            offset = 0
+
+            for i in range(1, n):
+                next_offset = i * total // n
+
+                if next_offset == offset:
+                    continue
+
+                # Skip rows from the last bound, so the rows
+                # before it are not read again
+                if bounds:
+                    skip = query.filter(UniqueIdentity.uuid >= bounds[-1])
+                else:
+                    skip = query
+
+                uuid = skip.offset(next_offset - offset).limit(1).scalar()
+                bounds.append(uuid)
+                offset = next_offset
+
+        return list(zip([None] + bounds, bounds + [None]))
+
+    def __fetch_uuids(self, session, source, since, uuid_range):
+        query = session.query(UniqueIdentity.uuid)
+        query = self.__filter_and_sort(query, UniqueIdentity.uuid, source, since, uuid_range)
+
+        for row in query:
+            yield row.uuid
+
+    def __fetch_profiles(self, session, source, since, uuid_range):
+        query = session.query(Profile.uuid, Profile.name, Profile.email,
+                              Profile.gender, Profile.gender_acc, Profile.is_bot,
+                              Country.code, Country.name.label('country_name'),
+                              Country.alpha3).\
+            outerjoin(Country, Profile.country_code == Country.code)
+        query = self.__filter_and_sort(query, Profile.uuid, source, since, uuid_range)
+
+        for row in query:
+            if row.code:
+                country = {
+                    'code': row.code,
+                    'name': row.country_name,
+                    'alpha3': row.alpha3
+                }
+            else:
+                country = None
+
+            profile = {
+                'uuid': row.uuid,
+                'name': row.name,
+                'email': row.email,
+                'gender': row.gender,
+                'gender_acc': row.gender_acc,
+                'is_bot': row.is_bot,
+                'country': country
+            }
+            yield row.uuid, profile
+
+    def __fetch_identities(self, session, source, since, uuid_range):
+        query = session.query(Identity.id, Identity.name, Identity.email,
+                              Identity.username, Identity.source, Identity.uuid)
+        query = self.__filter_and_sort(query, Identity.uuid, source, since, uuid_range,
+                                       Identity.id)
+
+        for row in query:
+            yield row.uuid, row._asdict()
+
+    def __fetch_enrollments(self, session, source, since, uuid_range):
+        query = session.query(Enrollment.start, Enrollment.end, Enrollment.uuid,
+                              Organization.name.label('organization')).\
+            join(Organization, Enrollment.organization_id == Organization.id)
+        query = self.__filter_and_sort(query, Enrollment.uuid, source, since, uuid_range,
+                                       Organization.name, Enrollment.start, Enrollment.end)
+
+        for row in query:
+            yield row.uuid, row._asdict()
+
+    def __filter(self, query, uuid_column, source, since, uuid_range):
+        """Filter a query by source, by modification date and by a range of UUIDs"""
+
+        if source:
+            uuids = query.session.query(Identity.uuid).\
+                filter(Identity.source == source)
+            query = query.filter(uuid_column.in_(uuids.subquery()))
+
+        if since:
+            uuids = query.session.query(UniqueIdentity.uuid).\
+                filter(UniqueIdentity.last_modified >= since).\
+                union(query.session.query(Identity.uuid).
+                      filter(Identity.last_modified >= since))
+            query = query.filter(uuid_column.in_(uuids.subquery()))
+
+        if uuid_range:
+            start, end = uuid_range
+
+            if start is not None:
+                query = query.filter(uuid_column >= start)
+            if end is not None:
+                query = query.filter(uuid_column < end)
+
+        return query
+
+    def __filter_and_sort(self, query, uuid_column, source, since, uuid_range, *order_by):
+        """Filter a query and sort it by UUID.
+
+        UUIDs are sorted by the columns themselves, so the indexes
+        on them can be used. All the UUID columns share the same
+        collation, so all the streams follow the same order. For
+        the UUIDs generated by Sorting Hat (hexadecimal SHA1 digests),
+        this is also the order of the keys in the JSON document.
+        """
+        query = self.__filter(query, uuid_column, source, since, uuid_range)
+        query = query.order_by(uuid_column, *order_by).\
+            yield_per(EXPORT_FETCH_SIZE)
+
+        return query
 
     def _json_encoder(self, obj):
         """Default JSON encoder"""
@@ -213,6 +574,137 @@ class SortingHatIdentitiesExporter(IdentitiesExporter):
             return json.JSONEncoder.default(obj)
 
 
+@contextlib.contextmanager
+def open_outfile(filename, fmt=JSON_FORMAT):
+    """Open a file to write data in the given format.
+
+    Files are opened in binary mode for 'msgpack' format and
+    compressed with gzip for 'jsonl.gz'. The value '-' stands
+    for the standard output, which is not closed.
+
+    :param filename: path to the file or '-' for the standard output
+    :param fmt: format of the data
+    """
+    if filename == '-':
+        stream = sys.stdout
+
+        if fmt in (JSONL_GZ_FORMAT, MSGPACK_FORMAT):
+            stream = getattr(sys.stdout, 'buffer', None)
+
+            if stream is None:
+                raise IOError("binary data cannot be written to the standard output")
+
+        if fmt == JSONL_GZ_FORMAT:
+            with gzip.open(stream, 'wt', encoding='utf-8') as fd:
+                yield fd
+        else:
+            yield stream
+            stream.flush()
+        return
+
+    if fmt == JSONL_GZ_FORMAT:
+        fd = gzip.open(filename, 'wt', encoding='utf-8')
+    elif fmt == MSGPACK_FORMAT:
+        fd = open(filename, 'wb')
+    else:
+        fd = open(filename, 'w')
+
+    with fd:
+        yield fd
+
+
+def part_filename(filename, fmt, npart):
+    """Name of a part file.
+
+    The number of the part is set before the extension of
+    the format (i.e 'backup.jsonl' -> 'backup.part-0001.jsonl').
+    """
+    ext = '.' + fmt
+
+    if filename.endswith(ext):
+        filename = filename[:-len(ext)]
+
+    return "%s.part-%04d%s" % (filename, npart, ext)
+
+
+def _merge_by_uuid(uuids, *streams):
+    """Merge streams of (uuid, item) pairs sorted in the same order as `uuids`.
+
+    UUIDs are compared like the collation of the database does, ignoring
+    case and trailing spaces. Items of a stream with a UUID that sorts
+    before the current one do not belong to any unique identity, so
+    they are skipped with a warning.
+
+    :returns: a generator of (uuid, lists) tuples, where lists has the
+        items of each stream related to uuid
+
+    :raises ValueError: when a stream is not sorted by UUID
+    """
+    groups = [_group_by_uuid(stream) for stream in streams]
+    heads = [next(group, None) for group in groups]
+
+    last_key = None
+
+    for uuid in uuids:
+        key = _uuid_key(uuid)
+
+        if last_key is not None and key <= last_key:
+            raise ValueError("unique identities are not sorted by UUID; %s found after %s"
+                             % (uuid, last_key))
+        last_key = key
+
+        items = []
+
+        for i, group in enumerate(groups):
+            head = heads[i]
+
+            while head is not None and head[0] < key:
+                logger.warning("%s items of %s not found in the unique identities; skipped",
+                               len(head[1]), head[0])
+                head = next(group, None)
+
+            if head is not None and head[0] == key:
+                items.append(head[1])
+                head = next(group, None)
+            else:
+                items.append([])
+
+            heads[i] = head
+
+        yield uuid, items
+
+    for group, head in zip(groups, heads):
+        while head is not None:
+            logger.warning("%s items of %s not found in the unique identities; skipped",
+                           len(head[1]), head[0])
+            head = next(group, None)
+
+
+def _group_by_uuid(stream):
+    """Group the items of a stream of (uuid, item) pairs sorted by UUID.
+
+    :returns: a generator of (key, items) tuples, where key
+        is the UUID as compared by `_uuid_key`
+
+    :raises ValueError: when the stream is not sorted by UUID
+    """
+    last_key = None
+
+    for key, group in itertools.groupby(stream, key=lambda pair: _uuid_key(pair[0])):
+        if last_key is not None and key < last_key:
+            raise ValueError("items are not sorted by UUID; %s found after %s"
+                             % (key, last_key))
+        last_key = key
+
+        yield key, [item for _, item in group]
+
+
+def _uuid_key(uuid):
+    """Key to compare UUIDs like the collation of the database"""
+
+    return uuid.rstrip(' ').lower()
+
+
 class OrganizationsExporter(object):
     """Abstract class for exporting organizations"""
 
@@ -20,15 +20,23 @@
 #
 
 import argparse
+import datetime
+import glob
+import json
 import logging
+import lzma
+import os
 import sys
 
-from .. import api
+from sqlalchemy import and_, or_, false, literal, select
+
+from .. import api, utils
 from ..command import Command, CMD_SUCCESS, HELP_LIST
 from ..db.api import find_identity
-from ..db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE, Enrollment
+from ..db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE, \
+    UniqueIdentity, Identity, Profile, Enrollment
 from ..exceptions import AlreadyExistsError, NotFoundError,\
-    InvalidFormatError, LoadError, MatcherNotSupportedError
+    InvalidFormatError, InvalidValueError, LoadError, MatcherNotSupportedError
 from ..matcher import create_identity_matcher
 from ..matching import SORTINGHAT_IDENTITIES_MATCHERS
 from ..parsing.sh import SortingHatParser
@@ -36,6 +44,15 @@ from ..parsing.sh import SortingHatParser
 
 logger = logging.getLogger(__name__)
 
+JSON_FORMAT = 'json'
+JSONL_FORMAT = 'jsonl'
+MSGPACK_FORMAT = 'msgpack'
+LOAD_FORMATS = [JSON_FORMAT, JSONL_FORMAT, MSGPACK_FORMAT]
+
+PREFILTER_FP_RATE = 0.01
+PREFILTER_FETCH_SIZE = 10000
+JOURNAL_BATCH_SIZE = 100
+
 
 class Load(Command):
     """Import data into the registry.
@@ -43,6 +60,14 @@ class Load(Command):
     This command is able to import data about identities, organizations and
     domains. Data are read, by default, from the standard input. Files can also
     be used as data input giving the path to file as a positional argument.
+    Several files, or glob patterns, can be given; they will be loaded one after
+    the other, as a single stream of identities. Files compressed with gzip, bzip2 or xz are decompressed on the
+    fly.
+
+    Besides JSON documents, the command reads the records written by
+    'export' in JSON lines ('jsonl') and MessagePack ('msgpack') formats.
+    The format of each file is guessed from its extension (i.e. '.jsonl',
+    '.jsonl.gz', '.msgpack') unless it is set with '--format'.
 
     By default, identities and organizations are both loaded but two parameters
     can be used to import some parts from the input. When '--identities' option
@@ -54,6 +79,20 @@ class Load(Command):
     Previous relationships between identities and their enrollments will be
     removed when the option '--reset' is set.
 
+    Before loading the identities, the ids of those already stored on the
+    registry are read into a Bloom filter, so identities that are known to
+    exist are not inserted again. The false positive rate of this filter,
+    and so its memory footprint, is set with '--prefilter-fp-rate'. When
+    this rate is 0, the ids and the unique identities they belong to are
+    kept in memory instead, so existing identities are not looked up on
+    the registry.
+
+    The progress of the load can be recorded on a journal file, given with
+    '--journal', every 100 unique identities. When a load is interrupted, it
+    can be run again with the same input and journal and the '--resume' option.
+    Files already loaded and unique identities already processed will be
+    skipped.
+
     Take into account that those organizations set on each identity enrollment
     will be loaded despite '--identities' option were set.
 
@@ -94,10 +133,23 @@ class Load(Command):
         group.add_argument('-v', '--verbose', dest='verbose', action='store_true',
                            help="run verbose mode while matching and merging")
 
+        # Loading options
+        group = self.parser.add_argument_group('loading options')
+        group.add_argument('--prefilter-fp-rate', dest='fp_rate', type=float,
+                           default=PREFILTER_FP_RATE,
+                           help="false positive rate of the existing identities filter; "
+                                "when 0, an exact map of ids is used")
+        group.add_argument('--journal', dest='journal', default=None,
+                           help="record the progress of the load on this file")
+        group.add_argument('--resume', action='store_true',
+                           help="resume an interrupted load using its journal")
+        group.add_argument('--format', dest='format', default=None,
+                           choices=LOAD_FORMATS,
+                           help="format of the input files; by default, it is guessed from their extension")
+
         # Positional arguments
-        self.parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
-                                 default=sys.stdin,
-                                 help="input file")
+        self.parser.add_argument('infiles', nargs='*', default=['-'],
+                                 help="input files or glob patterns")
 
         # Exit early if help is requested
         if 'cmd_args' in kwargs and [i for i in kwargs['cmd_args'] if i in HELP_LIST]:
@@ -105,6 +157,9 @@ class Load(Command):
 
         self._set_database(**kwargs)
         self.new_uids = set()
+        self.stored_ids = None
+        self.journal = None
+        self.merged_uuids = {}
 
     @property
     def description(self):
@@ -114,7 +169,9 @@ class Load(Command):
     def usage(self):
         usg = "%(prog)s load"
         usg += " [-v] [--reset] [--identities | --orgs]"
-        usg += " [-m matching] [-n] [--no-strict-matching] [--overwrite] [file]"
+        usg += " [-m matching] [-n] [--no-strict-matching] [--overwrite]"
+        usg += " [--prefilter-fp-rate rate] [--journal file [--resume]]"
+        usg += " [--format format] [file ...]"
         return usg
 
     def log(self, msg, debug=True):
@@ -129,43 +186,90 @@ class Load(Command):
     def run(self, *args):
         """Import data on the registry.
 
-        By default, it reads the data from the standard input. If a positional
-        argument is given, it will read the data from there.
+        By default, it reads the data from the standard input. If positional
+        arguments are given, it will read the data from those files, one
+        after the other.
         """
         params = self.parser.parse_args(args)
 
-        with params.infile as infile:
+        if params.resume and not params.journal:
+            e = InvalidValueError("'--resume' requires a journal file ('--journal')")
+            self.error(str(e))
+            return e.code
+
+        journal = None
+
+        if params.journal:
             try:
-                stream = self.__read_file(infile)
-                parser = SortingHatParser(stream)
-            except InvalidFormatError as e:
-                self.error(str(e))
-                return e.code
-            except (IOError, TypeError, AttributeError) as e:
+                journal = LoadJournal(params.journal, resume=params.resume)
+            except (IOError, ValueError) as e:
                 raise RuntimeError(str(e))
 
-        if params.identities:
-            self.import_blacklist(parser)
-            code = self.import_identities(parser,
-                                          matching=params.matching,
-                                          match_new=params.match_new,
-                                          no_strict_matching=params.no_strict,
-                                          reset=params.reset,
-                                          verbose=params.verbose)
-        elif params.orgs:
-            self.import_organizations(parser, params.overwrite)
-            code = CMD_SUCCESS
-        else:
-            self.import_organizations(parser, params.overwrite)
-            self.import_blacklist(parser)
-            code = self.import_identities(parser, matching=params.matching,
-                                          match_new=params.match_new,
-                                          no_strict_matching=params.no_strict,
-                                          reset=params.reset,
-                                          verbose=params.verbose)
+        parsers = self.__parse_input_files(params.infiles, params.format,
+                                           params.reset, journal,
+                                           load_orgs=not params.identities,
+                                           load_blacklist=not params.orgs,
+                                           overwrite=params.overwrite)
+
+        try:
+            if params.orgs:
+                for _ in parsers:
+                    if journal:
+                        journal.record(0, None, completed=True)
+                code = CMD_SUCCESS
+            else:
+                code = self.__import_identities(parsers,
+                                                matching=params.matching,
+                                                match_new=params.match_new,
+                                                no_strict_matching=params.no_strict,
+                                                fp_rate=params.fp_rate,
+                                                journal=journal,
+                                                verbose=params.verbose)
+        except (InvalidFormatError, LoadError) as e:
+            self.error(str(e))
+            return e.code
 
         return code
 
+    def __parse_input_files(self, patterns, fmt, reset, journal,
+                            load_orgs=True, load_blacklist=True,
+                            overwrite=False):
+        """Parse the input files, one after the other.
+
+        For each file, it yields its parser and whether the relationships
+        must be reset before loading its identities. Relationships are
+        only reset before loading the first file; when resuming, they
+        were reset on the interrupted run. Organizations and blacklist
+        entries of each file are imported before it is yielded, unless
+        the load of that file is being resumed.
+        """
+        for i, filename in enumerate(self.__find_input_files(patterns)):
+            resumed = False
+
+            if journal:
+                journal.begin(filename)
+
+                if journal.completed:
+                    self.log("%s already loaded. Skipping." % filename)
+                    continue
+
+                resumed = journal.position > 0
+
+            try:
+                parser = self.__parse_file(filename, fmt or self.__guess_format(filename))
+            except ImportError as e:
+                raise LoadError(cause=str(e))
+            except (IOError, TypeError, AttributeError, EOFError, lzma.LZMAError) as e:
+                raise RuntimeError(str(e))
+
+            if not resumed:
+                if load_orgs:
+                    self.import_organizations(parser, overwrite)
+                if load_blacklist:
+                    self.import_blacklist(parser)
+
+            yield parser, reset and i == 0 and not resumed
+
     def import_blacklist(self, parser):
         """Import blacklist.
 
@@ -228,7 +332,8 @@ class Load(Command):
 
     def import_identities(self, parser, matching=None, match_new=False,
                           no_strict_matching=False,
-                          reset=False, verbose=False):
+                          reset=False, fp_rate=PREFILTER_FP_RATE,
+                          journal=None, verbose=False):
         """Import identities information on the registry.
 
         New unique identities, organizations and enrollment data parsed
@@ -245,30 +350,71 @@ class Load(Command):
         When `reset` is set, relationships and enrollments will be removed
         before loading any data.
 
+        The ids of the identities already stored are kept in a filter with
+        a false positive rate of `fp_rate`, so most of the existing
+        identities are detected without trying to insert them again.
+        When `fp_rate` is 0, the filter will be an exact map of ids
+        to the unique identities they belong to.
+
+        The progress of the load is recorded on `journal`, when it is
+        given. In that case, those unique identities that the journal
+        reports as loaded for the current input will be skipped.
+
         :param parser: sorting hat parser
         :param matching: type of matching used to merge existing identities
         :param match_new: match and merge only the new loaded identities
         :param no_strict_matching: disable strict matching (i.e, well-formed email addresses)
         :param reset: remove relationships and enrollments before loading data
+        :param fp_rate: false positive rate of the existing identities filter
+        :param journal: `LoadJournal` object where the progress is recorded
         :param verbose: run in verbose mode when matching is set
         """
-        matcher = None
-
-        if matching:
-            strict = not no_strict_matching
+        return self.__import_identities([(parser, reset)], matching=matching,
+                                        match_new=match_new,
+                                        no_strict_matching=no_strict_matching,
+                                        fp_rate=fp_rate, journal=journal,
+                                        verbose=verbose)
+
+    def __import_identities(self, parsers, matching=None, match_new=False,
+                            no_strict_matching=False, fp_rate=PREFILTER_FP_RATE,
+                            journal=None, verbose=False):
+        """Import the identities of a sequence of parsers.
+
+        `parsers` yields pairs of parser and reset flag. The filter of
+        stored identities and the matcher are built once for the whole
+        sequence; the matcher is only rebuilt when the blacklist changes
+        from one input to the next one.
+        """
+        if not 0 <= fp_rate < 1:
+            e = InvalidValueError("false positive rate must be in the range [0, 1)")
+            self.error(str(e))
+            return e.code
 
-            try:
-                blacklist = api.blacklist(self.db)
-                matcher = create_identity_matcher(matching, blacklist, strict=strict)
-            except MatcherNotSupportedError as e:
-                self.error(str(e))
-                return e.code
+        matcher = None
+        excluded = None
+        strict = not no_strict_matching
 
-        uidentities = parser.identities
+        # Unique identities created by the interrupted run are
+        # still new when the load is resumed
+        self.new_uids = set(journal.new_uids) if journal else set()
+        self.stored_ids = None
+        self.journal = journal
 
         try:
-            self.__load_unique_identities(uidentities, matcher, match_new,
-                                          reset, verbose)
+            for parser, reset in parsers:
+                if matching:
+                    blacklist = api.blacklist(self.db)
+                    entries = [mb.excluded for mb in blacklist]
+
+                    if entries != excluded:
+                        excluded = entries
+                        matcher = create_identity_matcher(matching, blacklist, strict=strict)
+
+                self.__load_unique_identities(parser.identities, matcher, match_new,
+                                              reset, fp_rate, journal, verbose)
+        except MatcherNotSupportedError as e:
+            self.error(str(e))
+            return e.code
         except LoadError as e:
             self.error(str(e))
             return e.code
@@ -276,19 +422,42 @@ class Load(Command):
         return CMD_SUCCESS
 
     def __load_unique_identities(self, uidentities, matcher, match_new,
-                                 reset, verbose):
+                                 reset, fp_rate, journal, verbose):
         """Load unique identities"""
 
-        self.new_uids.clear()
-
         n = 0
+        offset = 0
+
+        if journal and journal.position:
+            offset = journal.position
+
+            if offset > len(uidentities) or uidentities[offset - 1].uuid != journal.uuid:
+                msg = "journal entry for %s does not match with its contents" % journal.filename
+                raise LoadError(cause=msg)
 
         if reset:
             self.__reset_unique_identities()
+            self.stored_ids = None
+
+        nids = sum(len(uidentity.identities) for uidentity in uidentities)
+
+        if self.stored_ids is None:
+            self.__load_stored_ids(fp_rate, nids)
+        else:
+            self.__reserve_stored_ids(fp_rate, nids)
 
         self.log("Loading unique identities...")
 
-        for uidentity in uidentities:
+        if offset:
+            self.log("Resuming load after unique identity %s (%d/%d)"
+                     % (journal.uuid, offset, len(uidentities)))
+
+        for pos in range(offset, len(uidentities)):
+            uidentity = uidentities[pos]
+
+            if journal and pos > offset and pos % journal.batch_size == 0:
+                journal.record(pos, uidentities[pos - 1].uuid)
+
             self.log("\n=====", verbose)
             self.log("+ Processing %s" % uidentity.uuid, verbose)
 
@@ -320,34 +489,75 @@ class Load(Command):
             self.log("=====", verbose)
             n += 1
 
+        if journal:
+            uuid = uidentities[-1].uuid if uidentities else None
+            journal.record(len(uidentities), uuid, completed=True)
+
         self.log("%d/%d unique identities loaded" % (n, len(uidentities)))
 
     def __reset_unique_identities(self):
-        """Clear identities relationships and enrollments data"""
+        """Clear identities relationships and enrollments data.
 
+        Relationships are reset using set-based statements within
+        a single transaction: unique identities are created for those
+        identities that do not have one with its same id, every
+        identity is moved to its own unique identity and, finally,
+        enrollments are removed.
+        """
         self.log("Reseting unique identities...")
 
         self.log("Clearing identities relationships")
 
-        nids = 0
-        uidentities = api.unique_identities(self.db)
+        identities = Identity.__table__
+        uidentities = UniqueIdentity.__table__
+        profiles = Profile.__table__
+        enrollments = Enrollment.__table__
 
-        for uidentity in uidentities:
-            for identity in uidentity.identities:
-                api.move_identity(self.db, identity.id, identity.id)
-                nids += 1
-
-        self.log("Relationships cleared for %s identities" % nids)
-
-        self.log("Clearing enrollments")
+        last_modified = datetime.datetime.utcnow()
+        moved = identities.c.uuid != identities.c.id
 
         with self.db.connect() as session:
-            enrollments = session.query(Enrollment).all()
-
-            for enr in enrollments:
-                session.delete(enr)
-
-        self.log("Enrollments cleared")
+            # Create the unique identities (and their empty profiles)
+            # of those identities that will be moved
+            query = select([identities.c.id, literal(last_modified)]).\
+                select_from(identities.outerjoin(uidentities,
+                                                 uidentities.c.uuid == identities.c.id)).\
+                where(and_(moved, uidentities.c.uuid.is_(None)))
+            stmt = uidentities.insert().from_select(['uuid', 'last_modified'], query)
+            nuids = session.execute(stmt).rowcount
+
+            query = select([identities.c.id, false()]).\
+                select_from(identities.outerjoin(profiles,
+                                                 profiles.c.uuid == identities.c.id)).\
+                where(and_(moved, profiles.c.uuid.is_(None)))
+            stmt = profiles.insert().from_select(['uuid', 'is_bot'], query)
+            session.execute(stmt)
+
+            # Update the modification date of the unique identities
+            # involved before moving the identities and removing
+            # the enrollments
+            stmt = uidentities.update().\
+                where(or_(uidentities.c.uuid.in_(select([identities.c.uuid]).where(moved)),
+                          uidentities.c.uuid.in_(select([identities.c.id]).where(moved)),
+                          uidentities.c.uuid.in_(select([enrollments.c.uuid])))).\
+                values(last_modified=last_modified)
+            session.execute(stmt)
+
+            stmt = identities.update().\
+                where(moved).\
+                values(uuid=identities.c.id, last_modified=last_modified)
+            nids = session.execute(stmt).rowcount
+
+            self.log("%s unique identities created" % nuids)
+            self.log("Relationships cleared for %s identities" % nids)
+
+            self.log("Clearing enrollments")
+
+            nenrs = session.execute(enrollments.delete()).rowcount
+
+        self.db.invalidate_cache('uidentities', 'search_totals')
+
+        self.log("%s enrollments cleared" % nenrs)
 
     def __load_unique_identity(self, uidentity, verbose):
         """Seek or store unique identity"""
@@ -372,19 +582,16 @@ class Load(Command):
         identity = uidentity.identities.pop(0)
 
         try:
-            stored_uuid = api.add_identity(self.db, identity.source,
-                                           identity.email,
-                                           identity.name,
-                                           identity.username)
-            self.new_uids.add(stored_uuid)
-        except AlreadyExistsError as e:
-            with self.db.connect() as session:
-                stored_identity = find_identity(session, e.eid)
-                stored_uuid = stored_identity.uuid
-            self.warning("-- " + str(e), debug=verbose)
+            stored_uuid, stored_id = self.__add_identity(identity)
         except ValueError as e:
             raise LoadError(cause=str(e))
 
+        if stored_id:
+            e = AlreadyExistsError(entity='Identity', eid=stored_id)
+            self.warning("-- " + str(e), debug=verbose)
+        else:
+            self.__add_new_uid(stored_uuid)
+
         self.log("-- using %s for %s unique identity." % (stored_uuid, uuid), verbose)
 
         return stored_uuid
@@ -395,33 +602,142 @@ class Load(Command):
         self.log("-- loading identities", verbose)
 
         for identity in identities:
-            try:
-                api.add_identity(self.db, identity.source, identity.email,
-                                 identity.name, identity.username, uuid)
-                self.new_uids.add(uuid)
-            except AlreadyExistsError as e:
-                self.warning(str(e), verbose)
+            stored_uuid, stored_id = self.__add_identity(identity, uuid)
+
+            if not stored_id:
+                self.__add_new_uid(uuid)
+                continue
 
-                with self.db.connect() as session:
-                    stored_identity = find_identity(session, e.eid)
-                    stored_uuid = stored_identity.uuid
+            e = AlreadyExistsError(entity='Identity', eid=stored_id)
+            self.warning(str(e), verbose)
 
-                if uuid != stored_uuid:
-                    msg = "%s is already assigned to %s. Merging." % (uuid, stored_uuid)
-                    self.warning(msg, verbose)
+            if uuid != stored_uuid:
+                msg = "%s is already assigned to %s. Merging." % (uuid, stored_uuid)
+                self.warning(msg, verbose)
 
-                    api.merge_unique_identities(self.db, uuid, stored_uuid)
+                api.merge_unique_identities(self.db, uuid, stored_uuid)
+                self.merged_uuids[uuid] = stored_uuid
 
-                    if uuid in self.new_uids:
-                        self.new_uids.remove(uuid)
+                if uuid in self.new_uids:
+                    self.new_uids.remove(uuid)
 
-                    self.new_uids.add(stored_uuid)
-                    uuid = stored_uuid
+                self.__add_new_uid(stored_uuid)
+                uuid = stored_uuid
 
         self.log("-- identities loaded", verbose)
 
         return uuid
 
+    def __add_new_uid(self, uuid):
+        """Set a unique identity as new, recording it on the journal"""
+
+        if uuid in self.new_uids:
+            return
+
+        self.new_uids.add(uuid)
+
+        if self.journal:
+            self.journal.record_new_uid(uuid)
+
+    def __load_stored_ids(self, fp_rate, nids):
+        """Read the ids of the stored identities into a filter.
+
+        The filter will have room for the identities on the registry
+        plus `nids` new ones. When `fp_rate` is 0, a dict that maps
+        each id to the uuid of its unique identity is used.
+        """
+        self.merged_uuids.clear()
+
+        with self.db.connect() as session:
+            if fp_rate:
+                capacity = session.query(Identity.id).count()
+                self.stored_ids = [utils.BloomFilter(capacity + nids, fp_rate)]
+                query = session.query(Identity.id)
+            else:
+                self.stored_ids = {}
+                query = session.query(Identity.id, Identity.uuid)
+
+            for row in query.yield_per(PREFILTER_FETCH_SIZE):
+                self.__add_stored_id(*row)
+
+    def __reserve_stored_ids(self, fp_rate, nids):
+        """Make room on the filter for `nids` new ids.
+
+        Bloom filters cannot grow, so when the last one does not have
+        room for the new ids, another filter is added for them.
+        """
+        if isinstance(self.stored_ids, dict):
+            return
+
+        last = self.stored_ids[-1]
+
+        if len(last) + nids > last.capacity:
+            self.stored_ids.append(utils.BloomFilter(nids, fp_rate))
+
+    def __is_stored_id(self, id_):
+        if isinstance(self.stored_ids, dict):
+            return id_ in self.stored_ids
+        return any(id_ in bf for bf in self.stored_ids)
+
+    def __add_stored_id(self, id_, uuid=None):
+        if isinstance(self.stored_ids, dict):
+            self.stored_ids[id_] = uuid
+        elif self.stored_ids is not None:
+            self.stored_ids[-1].add(id_)
+
+    def __find_stored_uuid(self, id_):
+        """Find the uuid of the unique identity of a stored identity.
+
+        Ids on the exact map are resolved without querying the registry,
+        following the merges done since they were read.
+        """
+        if isinstance(self.stored_ids, dict) and id_ in self.stored_ids:
+            uuid = self.stored_ids[id_]
+
+            while uuid in self.merged_uuids:
+                uuid = self.merged_uuids[uuid]
+
+            self.stored_ids[id_] = uuid
+            return uuid
+
+        with self.db.connect() as session:
+            stored_identity = find_identity(session, id_)
+            return stored_identity.uuid if stored_identity else None
+
+    def __add_identity(self, identity, uuid=None):
+        """Add an identity unless it is already stored.
+
+        Returns a tuple with the uuid of the unique identity the identity
+        is assigned to and, when it was already stored, its id; `None`
+        otherwise. Only those identities whose ids might be in the
+        filter are looked up on the registry, and only once.
+        """
+        try:
+            id_ = utils.uuid(identity.source, email=identity.email,
+                             name=identity.name, username=identity.username)
+        except ValueError:
+            id_ = None
+
+        if id_ and self.stored_ids is not None and self.__is_stored_id(id_):
+            stored_uuid = self.__find_stored_uuid(id_)
+
+            if stored_uuid:
+                return stored_uuid, id_
+
+        try:
+            stored_uuid = api.add_identity(self.db, identity.source,
+                                           identity.email,
+                                           identity.name,
+                                           identity.username,
+                                           uuid)
+        except AlreadyExistsError as e:
+            # Identities stored after the filter was loaded
+            return self.__find_stored_uuid(e.eid), e.eid
+
+        self.__add_stored_id(id_, stored_uuid)
+
+        return stored_uuid, None
+
     def __load_profile(self, profile, uuid, verbose):
         """Create a new profile when the unique identity does not have any."""
 
@@ -571,12 +887,174 @@ class Load(Command):
             self.display('match.tmpl', uid=from_uid, match=to_uid)
 
         api.merge_unique_identities(self.db, from_uid.uuid, to_uid.uuid)
+        self.merged_uuids[from_uid.uuid] = to_uid.uuid
 
         if verbose:
             self.display('merge.tmpl', from_uuid=from_uid.uuid, to_uuid=to_uid.uuid)
 
+    def __find_input_files(self, patterns):
+        """Expand glob patterns into the list of files to read.
+
+        Patterns that do not match any file are returned as they are,
+        so the error will be raised when the file is opened.
+        """
+        for pattern in patterns:
+            if pattern == '-' or not glob.has_magic(pattern):
+                yield pattern
+                continue
+
+            filenames = sorted(glob.glob(pattern))
+
+            if filenames:
+                yield from filenames
+            else:
+                yield pattern
+
+    def __guess_format(self, filename):
+        """Guess the format of a file using its extension"""
+
+        name = filename.lower()
+
+        for extensions, _, _ in utils.COMPRESSION_FORMATS:
+            if name.endswith(extensions):
+                name = os.path.splitext(name)[0]
+                break
+
+        if name.endswith('.' + JSONL_FORMAT):
+            return JSONL_FORMAT
+        elif name.endswith('.' + MSGPACK_FORMAT):
+            return MSGPACK_FORMAT
+        else:
+            return JSON_FORMAT
+
+    def __parse_file(self, filename, fmt):
+        """Parse the contents of a file written in the given format"""
+
+        if fmt == MSGPACK_FORMAT:
+            if filename == '-':
+                return SortingHatParser.from_msgpack(sys.stdin.buffer)
+
+            with open(filename, 'rb') as infile:
+                return SortingHatParser.from_msgpack(infile)
+
+        with utils.open_file(filename) as infile:
+            if fmt == JSONL_FORMAT:
+                return SortingHatParser.from_json_lines(infile)
+
+            stream = self.__read_file(infile)
+
+        return SortingHatParser(stream)
+
     def __read_file(self, infile):
         """Read a file into a str object"""
 
         content = infile.read()
         return content
+
+
+class LoadJournal:
+    """Persistent record of the progress of a load.
+
+    The journal is a file in JSON lines format. For each input file,
+    an entry is appended every time a batch of unique identities is
+    processed. Entries store the name of the file, the number of unique
+    identities processed so far (`position`) and the uuid of the last
+    one, as it appears on the input. The last entry of a file is
+    flagged as `completed`.
+
+    The uuids of the unique identities created by the load are also
+    appended, one per line, as soon as they are created. Thus, they are
+    still considered new when the load is resumed, even if they were
+    created after the last batch was recorded.
+
+    When `resume` is set, the progress recorded on a previous run is
+    read from `path`; otherwise, the journal is emptied.
+
+    :param path: path to the journal file
+    :param resume: read the progress recorded on the journal
+    :param batch_size: number of unique identities of each batch
+
+    :raises ValueError: when the contents of the journal are not valid
+    """
+    def __init__(self, path, resume=False, batch_size=JOURNAL_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self.entries = {}
+        self.new_uids = set()
+        self.filename = None
+
+        if resume and os.path.exists(path):
+            self.entries, self.new_uids = self.__read_entries()
+        else:
+            open(self.path, 'w').close()
+
+    @property
+    def position(self):
+        entry = self.entries.get(self.filename, None)
+        return entry['position'] if entry else 0
+
+    @property
+    def uuid(self):
+        entry = self.entries.get(self.filename, None)
+        return entry['uuid'] if entry else None
+
+    @property
+    def completed(self):
+        entry = self.entries.get(self.filename, None)
+        return entry['completed'] if entry else False
+
+    def begin(self, filename):
+        """Set the input file whose progress will be recorded"""
+
+        self.filename = filename if filename == '-' else os.path.abspath(filename)
+
+    def record(self, position, uuid, completed=False):
+        """Append the progress of the current input file to the journal"""
+
+        entry = {
+            'file': self.filename,
+            'position': position,
+            'uuid': uuid,
+            'completed': completed
+        }
+
+        with open(self.path, 'a') as fd:
+            fd.write(json.dumps(entry, sort_keys=True) + '\n')
+            fd.flush()
+            os.fsync(fd.fileno())
+
+        self.entries[self.filename] = entry
+
+    def record_new_uid(self, uuid):
+        """Append the uuid of a unique identity created by the load"""
+
+        with open(self.path, 'a') as fd:
+            fd.write(json.dumps({'new_uid': uuid}) + '\n')
+
+        self.new_uids.add(uuid)
+
+    def __read_entries(self):
+        entries = {}
+        new_uids = set()
+
+        with open(self.path, 'r') as fd:
+            lines = fd.readlines()
+
+        for n, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # The last line might be incomplete when the process
+                # was killed while writing it; it will be discarded
+                if n == len(lines) - 1:
+                    with open(self.path, 'w') as fd:
+                        fd.writelines(lines[:-1])
+                    break
+                raise ValueError("invalid journal entry on line %s of %s" % (n + 1, self.path))
+
+            if 'new_uid' in entry:
+                new_uids.add(entry['new_uid'])
+            else:
+                entries[entry['file']] = entry
+
+        return entries, new_uids
@@ -25,10 +25,11 @@ import logging
 from .. import api
 from ..command import Command, CMD_SUCCESS, HELP_LIST
 from ..exceptions import AlreadyExistsError, NotFoundError, InvalidValueError
+from .affiliate import Affiliate
 
 
 ORGS_COMMAND_USAGE_MSG = """%(prog)s orgs -l [term]
-   or: %(prog)s orgs -a <organization> [domain] [--top-domain] [--overwrite]"
+   or: %(prog)s orgs -a <organization> [domain] [--top-domain] [--overwrite] [--affiliate]"
    or: %(prog)s orgs -d <organization> [domain]"""
 
 
@@ -58,6 +59,10 @@ class Organizations(Command):
     (i.e eu.example.com, us.example.com). Take into account when 'overwrite' is set
     it will also update 'top_domain' flag even when this flag were not set.
 
+    Using '--affiliate', unique identities with email addresses on the new
+    domain, or on any of its sub-domains, will be affiliated after adding it.
+    Only these identities are checked, not the whole registry.
+
     To delete organizations use '--delete' option. When <organization> is the only
     parameter given, it will be removed from the registry, including those domains
     related to it. When both <domain> and <organization> are given, only the domain
@@ -86,6 +91,8 @@ class Organizations(Command):
                            help="set this domain as a top domain")
         group.add_argument('--overwrite', action='store_true',
                            help="force to overwrite existing domain relationships")
+        group.add_argument('--affiliate', action='store_true',
+                           help="affiliate the unique identities on this domain")
 
         # Positional arguments
         self.parser.add_argument('organization', nargs='?', default=None,
@@ -119,9 +126,11 @@ class Organizations(Command):
         domain = params.domain
         is_top_domain = params.top_domain
         overwrite = params.overwrite
+        affiliate = params.affiliate
 
         if params.add:
-            code = self.add(organization, domain, is_top_domain, overwrite)
+            code = self.add(organization, domain, is_top_domain, overwrite,
+                            affiliate)
         elif params.delete:
             code = self.delete(organization, domain)
         else:
@@ -130,7 +139,8 @@ class Organizations(Command):
 
         return code
 
-    def add(self, organization, domain=None, is_top_domain=False, overwrite=False):
+    def add(self, organization, domain=None, is_top_domain=False, overwrite=False,
+            affiliate=False):
         """Add organizations and domains to the registry.
 
         This method adds the given 'organization' or 'domain' to the registry,
@@ -150,10 +160,14 @@ class Organizations(Command):
         eu.example.com, us.example.com). Take into account when 'overwrite' is set
         it will update 'is_top_domain' flag too.
 
+        When 'affiliate' is set, the unique identities with email addresses
+        on the new domain will be affiliated (see 'Affiliate' command).
+
         :param organization: name of the organization to add
         :param domain: domain to add to the registry
         :param is_top_domain: set the domain as a top domain
         :param overwrite: force to reassign the domain to the given company
+        :param affiliate: affiliate the unique identities on the new domain
         """
         # Empty or None values for organizations are not allowed
         if not organization:
@@ -186,6 +200,10 @@ class Organizations(Command):
                 self.error(str(e))
                 return e.code
 
+            if affiliate:
+                cmd = Affiliate(db=self.db)
+                return cmd.affiliate(domain=domain)
+
         return CMD_SUCCESS
 
     def delete(self, organization, domain=None):
@@ -20,6 +20,7 @@
 #
 
 import argparse
+import itertools
 import logging
 
 from .. import api
@@ -27,6 +28,8 @@ from ..command import Command, CMD_SUCCESS, HELP_LIST
 from ..exceptions import NotFoundError
 
 
+SHOW_BATCH_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 
 
@@ -94,6 +97,9 @@ class Show(Command):
         which match with the given term. This parameter does not have any
         effect when <uuid> is set.
 
+        When neither <uuid> nor <term> are given, unique identities are
+        read and printed in batches of `SHOW_BATCH_SIZE`.
+
         :param uuid: unique identifier
         :param term: term to match with unique identities data
         """
@@ -103,14 +109,23 @@ class Show(Command):
             elif term:
                 uidentities = api.search_unique_identities(self.db, term)
             else:
-                uidentities = api.unique_identities(self.db)
+                uidentities = api.iter_unique_identities(self.db,
+                                                         batch_size=SHOW_BATCH_SIZE)
+
+            uidentities = iter(uidentities)
+
+            while True:
+                batch = list(itertools.islice(uidentities, SHOW_BATCH_SIZE))
+
+                if not batch:
+                    break
 
-            for uid in uidentities:
-                # Add enrollments to a new property 'roles'
-                enrollments = api.enrollments(self.db, uid.uuid)
-                uid.roles = enrollments
+                for uid in batch:
+                    # Add enrollments to a new property 'roles'
+                    enrollments = api.enrollments(self.db, uid.uuid)
+                    uid.roles = enrollments
 
-            self.display('show.tmpl', uidentities=uidentities)
+                self.display('show.tmpl', uidentities=batch)
         except NotFoundError as e:
             self.error(str(e))
             return e.code
@@ -25,8 +25,11 @@ import hashlib
 import json
 import os
 
+from sqlalchemy import func
+
 from .. import api
 from ..command import Command, CMD_SUCCESS, HELP_LIST
+from ..db.model import UniqueIdentity
 from ..exceptions import MatcherNotSupportedError
 from ..matcher import create_identity_matcher, match
 from ..matching import SORTINGHAT_IDENTITIES_MATCHERS
@@ -148,7 +151,7 @@ class Unify(Command):
             self.error(str(e))
             return e.code
 
-        uidentities = api.unique_identities(self.db)
+        uidentities = api.iter_unique_identities(self.db)
 
         try:
             self.__unify_unique_identities(uidentities, matcher,
@@ -167,14 +170,20 @@ class Unify(Command):
                                   fast_matching, interactive):
         """Unify unique identities looking for similar identities."""
 
-        self.total = len(uidentities)
+        self.total = 0
         self.matched = 0
 
+        def count(uids):
+            for uid in uids:
+                self.total += 1
+                yield uid
+
         if self.recovery and self.recovery_file.exists():
             print("Loading matches from recovery file: %s" % self.recovery_file.location())
             matched = self.recovery_file.load_matches()
+            self.total = self.__count_unique_identities()
         else:
-            matched = match(uidentities, matcher, fastmode=fast_matching)
+            matched = match(count(uidentities), matcher, fastmode=fast_matching)
             # convert the matched identities to a common JSON format to ease resuming operations
             matched = self.__marshal_matches(matched)
 
@@ -183,6 +192,12 @@ class Unify(Command):
         if self.recovery:
             self.recovery_file.delete()
 
+    def __count_unique_identities(self):
+        """Count the unique identities of the registry"""
+
+        with self.db.connect() as session:
+            return session.query(func.count(UniqueIdentity.uuid)).scalar()
+
     def __merge(self, matched, interactive):
         """Merge a lists of matched unique identities"""
 
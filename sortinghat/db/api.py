@@ -21,21 +21,34 @@
 
 import datetime
 import logging
+import zlib
 
+from sqlalchemy import func, select
+
+from ..utils import ngrams
 from .model import (MAX_PERIOD_DATE,
                     MIN_PERIOD_DATE,
                     UniqueIdentity,
                     Identity,
+                    IdentityNgram,
                     Profile,
                     Organization,
                     Domain,
                     Enrollment,
                     Country,
+                    DeletedUniqueIdentity,
                     MatchingBlacklist)
 
 
 logger = logging.getLogger(__name__)
 
+# Terms with these characters cannot be searched using n-grams
+LIKE_WILDCARDS = ('%', '_', '\\')
+
+# Number of n-grams inserted and identities read at once building the index
+NGRAMS_BATCH_SIZE = 10000
+NGRAMS_FETCH_SIZE = 10000
+
 
 def find_unique_identity(session, uuid):
     """Find a unique identity.
@@ -167,17 +180,29 @@ def add_unique_identity(session, uuid):
     return uidentity
 
 
-def delete_unique_identity(session, uidentity):
+def delete_unique_identity(session, uidentity, merged_into=None):
     """Remove a unique identity from the session.
 
     Function that removes from the session the unique identity
     given in `uidentity`. Data related to this identity will be
     also removed.
 
+    The deletion is recorded in the registry of deleted unique
+    identities, so it can be exported later. When the unique
+    identity was merged into another, its UUID is given in
+    `merged_into`.
+
     :param session: database session
     :param uidentity: unique identity to remove
+    :param merged_into: UUID of the unique identity where
+        `uidentity` was merged
     """
+    deleted = DeletedUniqueIdentity(uuid=uidentity.uuid,
+                                    merged_into=merged_into,
+                                    deleted_at=datetime.datetime.utcnow())
+
     session.delete(uidentity)
+    session.add(deleted)
     session.flush()
 
 
@@ -224,12 +249,131 @@ def add_identity(session, uidentity, identity_id, source,
     identity.last_modified = datetime.datetime.utcnow()
     identity.uidentity = uidentity
     identity.uidentity.last_modified = identity.last_modified
+    identity.ngrams = [IdentityNgram(ngram=key)
+                       for key in identity_ngrams(source, name, email, username)]
 
     session.add(identity)
 
     return identity
 
 
+def identity_ngrams(*values):
+    """Get the keys of the n-grams of the data of an identity.
+
+    The n-grams of all the values are indexed together. Each n-gram
+    is stored as a 32 bits integer hash, so different n-grams might
+    share the same key.
+
+    :param values: name, email, username or source of the identity;
+        `None` values are ignored
+
+    :returns: a set of integer keys
+    """
+    keys = set()
+
+    for value in values:
+        if not value:
+            continue
+        keys.update(_ngram_key(ngram) for ngram in ngrams(value))
+
+    return keys
+
+
+def _ngram_key(ngram):
+    """Hash an n-gram into a signed 32 bits integer"""
+
+    key = zlib.crc32(ngram.encode('utf-8', errors='surrogateescape'))
+
+    return key - (1 << 32) if key >= (1 << 31) else key
+
+
+def search_identities_ngrams(session, term):
+    """Look for the identities which might contain a term.
+
+    The function returns a query with the ids of the identities that
+    have all the n-grams of `term`. These identities are a superset
+    of those with the term on any of their fields, so the results
+    must still be filtered by the term.
+
+    When the term cannot be searched using n-grams, because it is
+    too short or because it has wildcard characters, `None` is
+    returned instead.
+
+    :param session: database session
+    :param term: term to search
+
+    :returns: a query of identities ids or `None`
+    """
+    if not term or any(c in term for c in LIKE_WILDCARDS):
+        return None
+
+    keys = identity_ngrams(term)
+
+    if not keys:
+        return None
+
+    query = session.query(IdentityNgram.identity_id).\
+        filter(IdentityNgram.ngram.in_(keys)).\
+        group_by(IdentityNgram.identity_id).\
+        having(func.count() == len(keys))
+
+    return query
+
+
+def build_identities_ngrams(session):
+    """Index the n-grams of all the identities.
+
+    The index is built from scratch, so the previous entries
+    are removed. Identities are read in batches of
+    `NGRAMS_FETCH_SIZE` rows, sorted by id, so they are not
+    loaded in memory at once. Rows are inserted in batches.
+
+    :param session: database session
+
+    :returns: number of identities indexed
+    """
+    identities = Identity.__table__
+    identities_ngrams = IdentityNgram.__table__
+
+    session.execute(identities_ngrams.delete())
+
+    query = select([identities.c.id, identities.c.source, identities.c.name,
+                    identities.c.email, identities.c.username]).\
+        order_by(identities.c.id).\
+        limit(NGRAMS_FETCH_SIZE)
+
+    nids = 0
+    rows = []
+    last_id = None
+
+    while True:
+        # Each batch starts after the last identity read, so the
+        # cost of reading it does not depend on its position
+        if last_id is None:
+            batch = session.execute(query).fetchall()
+        else:
+            batch = session.execute(query.where(identities.c.id > last_id)).fetchall()
+
+        if not batch:
+            break
+
+        for id_, source, name, email, username in batch:
+            rows.extend({'ngram': key, 'identity_id': id_}
+                        for key in identity_ngrams(source, name, email, username))
+
+            if len(rows) >= NGRAMS_BATCH_SIZE:
+                session.execute(identities_ngrams.insert(), rows)
+                rows = []
+
+        nids += len(batch)
+        last_id = batch[-1][0]
+
+    if rows:
+        session.execute(identities_ngrams.insert(), rows)
+
+    return nids
+
+
 def delete_identity(session, identity):
     """Remove an identity from the session.
 
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import collections
+import threading
+import time
+
+
+# Maximum number of entries stored for each type of entity
+DEFAULT_CACHE_SIZES = {
+    'uidentities': 10000,
+    'organizations': 1000,
+    'domains': 10000,
+    'blacklist': 1000,
+    'search_totals': 1000
+}
+
+# Number of seconds an entry is valid
+DEFAULT_CACHE_TTL = 300
+
+
+class LRUCache(object):
+    """Least recently used cache with expiration of entries.
+
+    The cache stores up to `size` entries. When it is full, the least
+    recently used entry is discarded to make room for the new one.
+    Entries also expire `ttl` seconds after they were stored, so
+    changes made by other processes are eventually seen.
+
+    :param size: maximum number of entries
+    :param ttl: number of seconds an entry is valid
+    """
+    def __init__(self, size, ttl):
+        if size < 1:
+            raise ValueError("'size' must be greater than 0; %s given" % str(size))
+        if ttl <= 0:
+            raise ValueError("'ttl' must be greater than 0; %s given" % str(ttl))
+
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, loader):
+        """Get the value of a key, loading it when it is not cached.
+
+        When `key` is not in the cache or its entry expired, the value
+        returned by calling `loader` is stored and returned. Exceptions
+        raised by `loader` are propagated and nothing is stored.
+
+        `loader` is called without holding the lock. When the cache
+        is cleared while the value is loaded, the value might be
+        stale, so it is returned but not stored.
+
+        :param key: key of the entry
+        :param loader: function with no arguments that returns the value
+
+        :returns: the value of the key
+        """
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation != self._generation:
+                return value
+
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def clear(self):
+        """Remove all the entries"""
+
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+
+class DatabaseCache(object):
+    """Read-through cache of the entities of a registry.
+
+    Each type of entity has its own `LRUCache` so large sets of
+    entries, like unique identities, do not evict the entries of
+    smaller ones, like organizations. Entries store detached objects
+    that are shared among callers, so they must be treated as read-only.
+
+    :param sizes: dict with the maximum number of entries for each
+        type of entity; types not included take the default size
+    :param ttl: number of seconds an entry is valid
+    """
+    def __init__(self, sizes=None, ttl=DEFAULT_CACHE_TTL):
+        sizes = dict(DEFAULT_CACHE_SIZES, **(sizes or {}))
+
+        for entity in sizes:
+            if entity not in DEFAULT_CACHE_SIZES:
+                raise ValueError("'%s' is not a cacheable entity" % entity)
+
+        self._caches = {entity: LRUCache(size, ttl)
+                        for entity, size in sizes.items()}
+
+    def get(self, entity, key, loader):
+        """Get the value of a key of the given type of entity"""
+
+        return self._caches[entity].get(key, loader)
+
+    def invalidate(self, *entities):
+        """Remove the entries of the given types of entities.
+
+        When no type is given, the entries of every type are removed.
+        """
+        for entity in entities or self._caches:
+            self._caches[entity].clear()
+
+    def stats(self):
+        """Get the number of hits, misses and entries of each type of entity"""
+
+        return {entity: {'hits': cache.hits,
+                         'misses': cache.misses,
+                         'entries': len(cache)}
+                for entity, cache in self._caches.items()}
@@ -24,7 +24,7 @@ import re
 from contextlib import contextmanager
 import logging
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect
 from sqlalchemy.exc import OperationalError, ProgrammingError, InternalError, IntegrityError
 from sqlalchemy.engine.url import URL
 from sqlalchemy.orm import mapper, sessionmaker
@@ -33,9 +33,15 @@ from sqlalchemy.pool import QueuePool
 from sqlalchemy.schema import MetaData
 
 from sortinghat.exceptions import DatabaseError, DatabaseExists, AlreadyExistsError
-from sortinghat.db.model import ModelBase
+from sortinghat.db.api import build_identities_ngrams
+from sortinghat.db.cache import DatabaseCache, DEFAULT_CACHE_TTL
+from sortinghat.db.model import ModelBase, Identity, IdentityNgram
 
 
+# Connections kept and allowed over them on each engine
+POOL_SIZE = 25
+POOL_MAX_OVERFLOW = 10
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,6 +56,9 @@ class Database(object):
     MYSQL_FLUSH_ERROR_REGEX = re.compile(
         r"New instance <(?P<entity>.+) at .+<class '.+'>, \('(?P<eid>.+)',.+\)\sconflicts")
 
+    # Read-through cache of lookups; disabled by default
+    cache = None
+
     def __init__(self, user, password, database, host='localhost', port='3306'):
         self._engine = self.build_engine(user, password, database, host, port)
         self._Session = sessionmaker(bind=self._engine)
@@ -79,6 +88,37 @@ class Database(object):
             session.commit()
         session.close()
 
+        self.invalidate_cache()
+
+    def enable_cache(self, sizes=None, ttl=DEFAULT_CACHE_TTL):
+        """Cache the results of the lookups done with this manager.
+
+        Long-running processes that look for the same entities many
+        times can enable this cache to avoid querying the database on
+        each call. The write functions of the API invalidate the cache,
+        but changes made by other processes will not be seen until the
+        entries expire after `ttl` seconds.
+
+        :param sizes: dict with the maximum number of entries for each
+            type of entity
+        :param ttl: number of seconds an entry is valid
+
+        :returns: the `DatabaseCache` object
+        """
+        self.cache = DatabaseCache(sizes=sizes, ttl=ttl)
+        return self.cache
+
+    def disable_cache(self):
+        """Stop caching the results of the lookups"""
+
+        self.cache = None
+
+    def invalidate_cache(self, *entities):
+        """Remove cached entries of the given types of entities, if any"""
+
+        if self.cache is not None:
+            self.cache.invalidate(*entities)
+
     @classmethod
     def create(cls, user, password, database, host='localhost', port='3306'):
         engine = cls.build_engine(user, password, None, host, port)
@@ -167,8 +207,30 @@ class Database(object):
         raise AlreadyExistsError(entity=entity, eid=eid)
 
     def __create_schema(self, engine):
+        # Registries created before the search index was
+        # available need to index their identities
+        tables = inspect(engine).get_table_names()
+        build_ngrams = Identity.__tablename__ in tables and \
+            IdentityNgram.__tablename__ not in tables
+
         ModelBase.metadata.create_all(engine)
 
+        if build_ngrams:
+            logger.info("Building identities search index")
+
+            session = self._Session()
+
+            try:
+                nids = build_identities_ngrams(session)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
+
+            logger.info("%s identities indexed", nids)
+
 
 def create_database_engine(user, password, database, host, port):
     """Create a database engine"""
@@ -185,7 +247,8 @@ def create_database_engine(user, password, database, host, port):
     #
     engine_params = {
         'poolclass': QueuePool,
-        'pool_size': 25,
+        'pool_size': POOL_SIZE,
+        'max_overflow': POOL_MAX_OVERFLOW,
         'pool_pre_ping': True,
         'echo': False,
         'connect_args': {
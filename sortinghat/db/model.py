@@ -179,6 +179,10 @@ class Identity(ModelBase):
     uidentity = relationship('UniqueIdentity', backref='uuid_identy',
                              lazy='joined')
 
+    # Search index; rows are removed by the database
+    ngrams = relationship('IdentityNgram', cascade="save-update, merge",
+                          passive_deletes=True)
+
     __table_args__ = (UniqueConstraint('name', 'email', 'username', 'source',
                                        name='_identity_unique'),
                       MYSQL_CHARSET)
@@ -194,6 +198,17 @@ class Identity(ModelBase):
         }
 
 
+class IdentityNgram(ModelBase):
+    __tablename__ = 'identities_ngrams'
+
+    ngram = Column(Integer, primary_key=True, autoincrement=False)
+    identity_id = Column(String(128),
+                         ForeignKey('identities.id', ondelete='CASCADE'),
+                         primary_key=True, index=True)
+
+    __table_args__ = (MYSQL_CHARSET)
+
+
 class Profile(ModelBase):
     __tablename__ = 'profiles'
 
@@ -267,6 +282,27 @@ class Enrollment(ModelBase):
         }
 
 
+class DeletedUniqueIdentity(ModelBase):
+    __tablename__ = 'uidentities_deleted'
+
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(128), nullable=False)
+    merged_into = Column(String(128))
+    deleted_at = Column(DATETIME(fsp=6), nullable=False, index=True)
+
+    __table_args__ = (MYSQL_CHARSET)
+
+    def to_dict(self):
+        return {
+            'uuid': self.uuid,
+            'merged_into': self.merged_into,
+            'deleted_at': self.deleted_at
+        }
+
+    def __repr__(self):
+        return "%s (%s)" % (self.uuid, self.deleted_at)
+
+
 class MatchingBlacklist(ModelBase):
     __tablename__ = 'matching_blacklist'
 
@@ -354,6 +390,37 @@ class MetricsGrimoireIdentity(MappedTable):
     def column_prefix(cls):
         return cls.COLUMN_PREFIX
 
+    @classmethod
+    def map_columns(cls, table):
+        """Map the attributes of an identity to the columns of a table.
+
+        Each attribute (i.e 'mg_id', 'name', 'email' and 'username')
+        is mapped to the first column of `table` found on its list
+        of keys. When none of them is found, the attribute is
+        mapped to `None`.
+
+        :param table: reflected table of identities
+
+        :returns: a dict with the column of each attribute
+        """
+        prefix = cls.column_prefix()
+        keys = {
+            'mg_id': cls.MG_ID_KEYS,
+            'name': cls.NAME_KEYS,
+            'email': cls.EMAIL_KEYS,
+            'username': cls.USERNAME_KEYS
+        }
+
+        columns = {}
+
+        for attr, attr_keys in keys.items():
+            names = [k[len(prefix):] for k in attr_keys]
+            found = [table.columns[name] for name in names
+                     if name in table.columns]
+            columns[attr] = found[0] if found else None
+
+        return columns
+
     def to_dict(self):
         return {'name': self.name,
                 'email': self.email,
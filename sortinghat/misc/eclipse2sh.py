@@ -27,6 +27,8 @@ import sys
 
 from sortinghat.exceptions import InvalidFormatError
 from sortinghat.parsing.eclipse import EclipseParser
+from sortinghat.utils import InputFileType
+from sortinghat.writer import SortingHatJSONWriter
 
 
 ECLIPSE2SH_DESC_MSG = \
@@ -43,10 +45,9 @@ def main():
     except (IOError, UnicodeDecodeError, InvalidFormatError) as e:
         raise RuntimeError(str(e))
 
-    j = to_json(parser.identities, parser.organizations, args.source)
-
     try:
-        args.outfile.write(j)
+        write_json(args.outfile, parser.identities, parser.organizations,
+                   args.source, compact=args.compact)
         args.outfile.write('\n')
     except IOError as e:
         raise RuntimeError(str(e))
@@ -62,8 +63,10 @@ def parse_args():
     parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'),
                         default=sys.stdout,
                         help='Sorting Hat JSON output filename')
-    parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
-                        default=sys.stdin,
+    parser.add_argument('--compact', dest='compact', action='store_true',
+                        help="write a compact JSON document, with no indentation")
+    parser.add_argument('infile', nargs='?', type=InputFileType(),
+                        default='-',
                         help='Eclipse JSON file')
 
     return parser.parse_args()
@@ -79,37 +82,32 @@ def parse_eclipse_file(infile, source):
     return parser
 
 
-def to_json(uidentities, organizations, source):
-    """Convert unique identities and organizations to Sorting Hat JSON format"""
+def write_json(outfile, uidentities, organizations, source, compact=False):
+    """Write unique identities and organizations to a file using Sorting Hat JSON format"""
 
-    uids = {}
     orgs = {}
 
-    # Convert to dict objects
-    for uidentity in uidentities:
-        uuid = uidentity.uuid
-
-        uid = uidentity.to_dict()
-        uid['identities'].sort(key=lambda x: x['email'])
-
-        enrollments = [rol.to_dict()
-                       for rol in uidentity.enrollments]
-        uid['enrollments'] = enrollments
-
-        uids[uuid] = uid
-
     for organization in organizations:
         orgs[organization.name] = {}
 
-    # Generate JSON file
-    obj = {'time': str(datetime.datetime.now()),
-           'source': source,
-           'blacklist': [],
-           'organizations': orgs,
-           'uidentities': uids}
+    header = {
+        'time': str(datetime.datetime.now()),
+        'source': source,
+        'blacklist': [],
+        'organizations': orgs
+    }
+
+    with SortingHatJSONWriter(outfile, header, compact=compact,
+                              default=json_encoder) as writer:
+        for uidentity in uidentities:
+            uid = uidentity.to_dict()
+            uid['identities'].sort(key=lambda x: x['email'])
+
+            enrollments = [rol.to_dict()
+                           for rol in uidentity.enrollments]
+            uid['enrollments'] = enrollments
 
-    return json.dumps(obj, default=json_encoder,
-                      indent=4, sort_keys=True)
+            writer.write(uidentity.uuid, uid)
 
 
 def json_encoder(obj):
@@ -27,6 +27,8 @@ import sys
 
 from sortinghat.exceptions import InvalidFormatError
 from sortinghat.parsing.gitdm import GitdmParser
+from sortinghat.utils import InputFileType
+from sortinghat.writer import SortingHatJSONWriter
 
 
 GITDM2SH_DESC_MSG = \
@@ -45,11 +47,9 @@ def main():
     except (IOError, UnicodeDecodeError, InvalidFormatError) as e:
         raise RuntimeError(str(e))
 
-    json = to_json(parser.identities, parser.organizations,
-                   args.source)
-
     try:
-        args.outfile.write(json)
+        write_json(args.outfile, parser.identities, parser.organizations,
+                   args.source, compact=args.compact)
         args.outfile.write('\n')
     except IOError as e:
         raise RuntimeError(str(e))
@@ -61,19 +61,21 @@ def parse_args():
     parser = argparse.ArgumentParser(description=GITDM2SH_DESC_MSG)
 
     parser.add_argument('-a', '--aliases', dest='aliases',
-                        type=argparse.FileType('r'),
+                        type=InputFileType(),
                         help='Gitdm aliases mapping file')
     parser.add_argument('-e', '--email-employer', dest='email_employer',
-                        type=argparse.FileType('r'),
+                        type=InputFileType(),
                         help='Gitdm email to employer mapping file')
     parser.add_argument('-d', '--domain-employer', dest='domain_employer',
-                        type=argparse.FileType('r'),
+                        type=InputFileType(),
                         help='Gitdm domain to employer mapping file')
     parser.add_argument('-s', '--source', dest='source', required=True,
                         help='name of the source')
     parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'),
                         default=sys.stdout,
                         help='Sorting Hat JSON output filename')
+    parser.add_argument('--compact', dest='compact', action='store_true',
+                        help="write a compact JSON document, with no indentation")
     parser.add_argument('--no-email-validation', dest='no_email_validation',
                         action='store_true',
                         help="do not email addresses validation")
@@ -85,44 +87,19 @@ def parse_gitdm_files(aliases, email_to_employer,
                       domain_to_employer, source, email_validation):
     """Parse Gitdm files"""
 
-    a = None
-    ee = None
-    de = None
-
-    if aliases:
-        a = read_file(aliases)
-    if email_to_employer:
-        ee = read_file(email_to_employer)
-    if domain_to_employer:
-        de = read_file(domain_to_employer)
-
-    parser = GitdmParser(aliases=a,
-                         email_to_employer=ee,
-                         domain_to_employer=de,
+    parser = GitdmParser(aliases=aliases,
+                         email_to_employer=email_to_employer,
+                         domain_to_employer=domain_to_employer,
                          source=source,
                          email_validation=email_validation)
     return parser
 
 
-def to_json(uidentities, organizations, source):
-    """Convert unique identities to Sorting Hat JSON format"""
+def write_json(outfile, uidentities, organizations, source, compact=False):
+    """Write unique identities and organizations to a file using Sorting Hat JSON format"""
 
-    uids = {}
     orgs = {}
 
-    # Convert to dict objects
-    for uidentity in uidentities:
-        uuid = uidentity.uuid
-
-        uid = uidentity.to_dict()
-        uid['identities'].sort(key=lambda x: x['email'] or x['username'])
-
-        enrollments = [rol.to_dict()
-                       for rol in uidentity.enrollments]
-        uid['enrollments'] = enrollments
-
-        uids[uuid] = uid
-
     for organization in organizations:
         domains = [{'domain': dom.domain,
                     'is_top': dom.is_top_domain}
@@ -131,15 +108,24 @@ def to_json(uidentities, organizations, source):
 
         orgs[organization.name] = domains
 
-    # Generate JSON file
-    obj = {'time': str(datetime.datetime.now()),
-           'source': source,
-           'blacklist': [],
-           'organizations': orgs,
-           'uidentities': uids}
+    header = {
+        'time': str(datetime.datetime.now()),
+        'source': source,
+        'blacklist': [],
+        'organizations': orgs
+    }
+
+    with SortingHatJSONWriter(outfile, header, compact=compact,
+                              default=json_encoder) as writer:
+        for uidentity in uidentities:
+            uid = uidentity.to_dict()
+            uid['identities'].sort(key=lambda x: x['email'] or x['username'])
+
+            enrollments = [rol.to_dict()
+                           for rol in uidentity.enrollments]
+            uid['enrollments'] = enrollments
 
-    return json.dumps(obj, default=json_encoder,
-                      indent=4, sort_keys=True)
+            writer.write(uidentity.uuid, uid)
 
 
 def json_encoder(obj):
@@ -151,11 +137,6 @@ def json_encoder(obj):
         return json.JSONEncoder.default(obj)
 
 
-def read_file(f):
-    content = f.read()
-    return content
-
-
 if __name__ == '__main__':
     try:
         main()
@@ -30,6 +30,8 @@ import sys
 
 from sortinghat.exceptions import InvalidFormatError
 from sortinghat.parsing.grimoirelab import GrimoireLabParser
+from sortinghat.utils import InputFileType
+from sortinghat.writer import SortingHatJSONWriter
 
 
 GRIMOIRELAB2SH_DESC_MSG = \
@@ -45,17 +47,14 @@ def main():
         email_validation = not args.no_email_validation
         enrollment_periods_valdation = not args.no_enrollment_periods_validation
         parser = parse_grimoirelab_file(args.identities, args.organizations,
-                                        args.source, email_validation, enrollment_periods_valdation)
+                                        args.source, email_validation, enrollment_periods_valdation,
+                                        jobs=args.jobs)
     except (IOError, UnicodeDecodeError, InvalidFormatError) as e:
         raise RuntimeError(str(e))
 
-    j = to_json(parser.blacklist,
-                parser.identities,
-                parser.organizations,
-                args.source)
-
     try:
-        args.outfile.write(j)
+        write_json(args.outfile, parser.blacklist, parser.identities,
+                   parser.organizations, args.source, compact=args.compact)
         args.outfile.write('\n')
     except IOError as e:
         raise RuntimeError(str(e))
@@ -66,22 +65,26 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description=GRIMOIRELAB2SH_DESC_MSG)
 
-    parser.add_argument('-i', '--identities', type=argparse.FileType('r'),
+    parser.add_argument('-i', '--identities', type=InputFileType(),
                         help='GrimoireLab profiles/identities mapping file')
     parser.add_argument('-d', '--organizations', dest='organizations',
-                        type=argparse.FileType('r'),
+                        type=InputFileType(),
                         help='GrimoireLab domain to employer mapping file')
     parser.add_argument('-s', '--source', dest='source', required=True,
                         help='name of the source')
     parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'),
                         default=sys.stdout,
                         help='Sorting Hat JSON output filename')
+    parser.add_argument('--compact', dest='compact', action='store_true',
+                        help="write a compact JSON document, with no indentation")
     parser.add_argument('--no-email-validation', dest='no_email_validation',
                         action='store_true',
                         help="do not email addresses validation")
     parser.add_argument('--no-enrollment-periods-validation', dest='no_enrollment_periods_validation',
                         action='store_true',
                         help="do not enrollment periods validation")
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1,
+                        help="number of processes used to parse the identities file")
 
     args = parser.parse_args()
 
@@ -91,7 +94,8 @@ def parse_args():
     return args
 
 
-def parse_grimoirelab_file(identities, organizations, source, email_validation, enrollment_periods_validation):
+def parse_grimoirelab_file(identities, organizations, source, email_validation, enrollment_periods_validation,
+                           jobs=1):
     """Parse GrimoireLab JSON file"""
 
     content_id = read_file(identities) if identities else None
@@ -101,7 +105,8 @@ def parse_grimoirelab_file(identities, organizations, source, email_validation,
         parser = GrimoireLabParser(content_id, content_org,
                                    source=source,
                                    email_validation=email_validation,
-                                   enrollment_periods_validation=enrollment_periods_validation)
+                                   enrollment_periods_validation=enrollment_periods_validation,
+                                   jobs=jobs)
     except ValueError:
         s = "Error: Empty input file(s)\n"
         sys.stdout.write(s)
@@ -110,24 +115,11 @@ def parse_grimoirelab_file(identities, organizations, source, email_validation,
     return parser
 
 
-def to_json(blacklist, uidentities, organizations, source):
-    """Convert unique identities and organizations to Sorting Hat JSON format"""
+def write_json(outfile, blacklist, uidentities, organizations, source, compact=False):
+    """Write unique identities and organizations to a file using Sorting Hat JSON format"""
 
-    uids = {}
     orgs = {}
 
-    # Convert to dict objects
-    for uidentity in uidentities:
-        uuid = uidentity.uuid
-
-        uid = uidentity.to_dict()
-
-        enrollments = [rol.to_dict()
-                       for rol in uidentity.enrollments]
-        uid['enrollments'] = enrollments
-
-        uids[uuid] = uid
-
     for organization in organizations:
         domains = [{'domain': dom.domain,
                     'is_top': dom.is_top_domain}
@@ -136,17 +128,23 @@ def to_json(blacklist, uidentities, organizations, source):
 
         orgs[organization.name] = domains
 
-    blacklist = [mb.excluded for mb in blacklist]
+    header = {
+        'time': str(datetime.datetime.now()),
+        'source': source,
+        'blacklist': [mb.excluded for mb in blacklist],
+        'organizations': orgs
+    }
+
+    with SortingHatJSONWriter(outfile, header, compact=compact,
+                              default=json_encoder) as writer:
+        for uidentity in uidentities:
+            uid = uidentity.to_dict()
 
-    # Generate JSON file
-    obj = {'time': str(datetime.datetime.now()),
-           'source': source,
-           'blacklist': blacklist,
-           'organizations': orgs,
-           'uidentities': uids}
+            enrollments = [rol.to_dict()
+                           for rol in uidentity.enrollments]
+            uid['enrollments'] = enrollments
 
-    return json.dumps(obj, default=json_encoder,
-                      indent=4, sort_keys=True)
+            writer.write(uidentity.uuid, uid)
 
 
 def json_encoder(obj):
@@ -27,6 +27,8 @@ import sys
 
 from sortinghat.exceptions import InvalidFormatError
 from sortinghat.parsing.mailmap import MailmapParser
+from sortinghat.utils import InputFileType
+from sortinghat.writer import SortingHatJSONWriter
 
 
 MAILMAP2SH_DESC_MSG = \
@@ -44,11 +46,9 @@ def main():
     except (IOError, UnicodeDecodeError, InvalidFormatError) as e:
         raise RuntimeError(str(e))
 
-    json = to_json(parser.identities, parser.organizations,
-                   args.source)
-
     try:
-        args.outfile.write(json)
+        write_json(args.outfile, parser.identities, parser.organizations,
+                   args.source, compact=args.compact)
         args.outfile.write('\n')
     except IOError as e:
         raise RuntimeError(str(e))
@@ -67,8 +67,10 @@ def parse_args():
     parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'),
                         default=sys.stdout,
                         help='Sorting Hat JSON output filename')
-    parser.add_argument('infile', nargs='?', type=argparse.FileType('r'),
-                        default=sys.stdin,
+    parser.add_argument('--compact', dest='compact', action='store_true',
+                        help="write a compact JSON document, with no indentation")
+    parser.add_argument('infile', nargs='?', type=InputFileType(),
+                        default='-',
                         help='mailmap JSON file')
 
     return parser.parse_args()
@@ -77,33 +79,17 @@ def parse_args():
 def parse_mailmap_file(infile, has_orgs, source):
     """Parse a mailmap file"""
 
-    content = read_file(infile)
-
-    parser = MailmapParser(content, has_orgs=has_orgs,
+    parser = MailmapParser(infile, has_orgs=has_orgs,
                            source=source)
 
     return parser
 
 
-def to_json(uidentities, organizations, source):
-    """Convert unique identities to Sorting Hat JSON format"""
+def write_json(outfile, uidentities, organizations, source, compact=False):
+    """Write unique identities and organizations to a file using Sorting Hat JSON format"""
 
-    uids = {}
     orgs = {}
 
-    # Convert to dict objects
-    for uidentity in uidentities:
-        uuid = uidentity.uuid
-
-        uid = uidentity.to_dict()
-        uid['identities'].sort(key=lambda x: x['email'] or x['username'])
-
-        enrollments = [rol.to_dict()
-                       for rol in uidentity.enrollments]
-        uid['enrollments'] = enrollments
-
-        uids[uuid] = uid
-
     for organization in organizations:
         domains = [{'domain': dom.domain,
                     'is_top': dom.is_top_domain}
@@ -112,17 +98,24 @@ def to_json(uidentities, organizations, source):
 
         orgs[organization.name] = domains
 
-    # Generate JSON file
-    obj = {
+    header = {
         'time': str(datetime.datetime.now()),
         'source': source,
         'blacklist': [],
-        'organizations': orgs,
-        'uidentities': uids
+        'organizations': orgs
     }
 
-    return json.dumps(obj, default=json_encoder,
-                      indent=4, sort_keys=True)
+    with SortingHatJSONWriter(outfile, header, compact=compact,
+                              default=json_encoder) as writer:
+        for uidentity in uidentities:
+            uid = uidentity.to_dict()
+            uid['identities'].sort(key=lambda x: x['email'] or x['username'])
+
+            enrollments = [rol.to_dict()
+                           for rol in uidentity.enrollments]
+            uid['enrollments'] = enrollments
+
+            writer.write(uidentity.uuid, uid)
 
 
 def json_encoder(obj):
@@ -134,11 +127,6 @@ def json_encoder(obj):
         return json.JSONEncoder.default(obj)
 
 
-def read_file(f):
-    content = f.read()
-    return content
-
-
 if __name__ == '__main__':
     try:
         main()
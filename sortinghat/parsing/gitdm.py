@@ -20,14 +20,16 @@
 #     Quan Zhou <quan@bitergia.com>
 #
 
-import dateutil.parser
+import io
+import itertools
 import logging
 import re
 
 
 from ..db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE, UniqueIdentity,\
     Identity, Enrollment, Organization, Domain
-from ..exceptions import InvalidFormatError
+from ..exceptions import InvalidDateError, InvalidFormatError
+from ..utils import str_to_datetime
 
 logger = logging.getLogger(__name__)
 
@@ -49,6 +51,10 @@ class GitdmParser(object):
     are the name of the organizations and each organization object is
     related to a list of domains.
 
+    Streams can be given as strings or as file objects. In the latter
+    case, lines are read one by one so the contents of the files are
+    not loaded into memory at once.
+
     :param aliases: aliases stream
     :param email_to_employer: enrollments stream
     :param domain_to_employer: organizations stream
@@ -67,6 +73,14 @@ class GitdmParser(object):
     DOMAIN_REGEX = r"^(?P<domain>\w\S+)$"
     ENROLLMENT_REGEX = r"^(?P<organization>[^#<\n\r\f\v]*[^#<\t\n\r\f\v\s])(?:[ \t]+<[ \t]+(?P<date>\d{4}\-\d{2}\-\d{2}))?$"
 
+    # Compiled patterns
+    _VALID_LINE_PATTERN = re.compile(VALID_LINE_REGEX, re.UNICODE)
+    _LINES_TO_IGNORE_PATTERN = re.compile(LINES_TO_IGNORE_REGEX, re.UNICODE)
+    _EMAIL_ADDRESS_PATTERN = re.compile(EMAIL_ADDRESS_REGEX, re.UNICODE)
+    _ORGANIZATION_PATTERN = re.compile(ORGANIZATION_REGEX, re.UNICODE)
+    _DOMAIN_PATTERN = re.compile(DOMAIN_REGEX, re.UNICODE)
+    _ENROLLMENT_PATTERN = re.compile(ENROLLMENT_REGEX, re.UNICODE)
+
     def __init__(self, aliases=None, email_to_employer=None,
                  domain_to_employer=None, source='gitdm', email_validation=True):
         self._identities = {}
@@ -114,7 +128,7 @@ class GitdmParser(object):
             if not uid:
                 uid = UniqueIdentity(uuid=email)
 
-                e = re.match(self.EMAIL_ADDRESS_REGEX, email, re.UNICODE)
+                e = self._EMAIL_ADDRESS_PATTERN.match(email)
                 if e:
                     identity = Identity(email=email, source=self.source)
                 else:
@@ -124,7 +138,7 @@ class GitdmParser(object):
 
                 self._identities[email] = uid
 
-            e = re.match(self.EMAIL_ADDRESS_REGEX, alias, re.UNICODE)
+            e = self._EMAIL_ADDRESS_PATTERN.match(alias)
             if e:
                 identity = Identity(email=alias, source=self.source)
             else:
@@ -202,7 +216,7 @@ class GitdmParser(object):
         jdoe@example.com      john_doe@example.com
         jdoe@example          john_doe@example.com
         """
-        if not stream:
+        if stream is None:
             return
 
         f = self.__parse_aliases_line
@@ -229,7 +243,7 @@ class GitdmParser(object):
         jdoe@example.com    Example Company   # John Doe
         jsmith@example.com    Bitergia < 2015-01-01  # John Smith - Bitergia
         """
-        if not stream:
+        if stream is None:
             return
 
         f = self.__parse_email_to_employer_line
@@ -263,7 +277,7 @@ class GitdmParser(object):
         libresoft.es       LibreSoft
         example.org        LibreSoft
         """
-        if not stream:
+        if stream is None:
             return
 
         f = self.__parse_domain_to_employer_line
@@ -280,21 +294,25 @@ class GitdmParser(object):
     def __parse_stream(self, stream, parse_line):
         """Generic method to parse gitdm streams"""
 
-        if not stream:
-            raise InvalidFormatError(cause='stream cannot be empty or None')
+        if isinstance(stream, str):
+            stream = io.StringIO(stream)
 
-        nline = 0
-        lines = stream.split('\n')
+        # File objects are always true, so the first line
+        # is read to find out whether the stream is empty
+        first_line = stream.readline() if stream else None
+
+        if not first_line:
+            raise InvalidFormatError(cause='stream cannot be empty or None')
 
-        for line in lines:
-            nline += 1
+        for nline, line in enumerate(itertools.chain([first_line], stream), start=1):
+            line = line.rstrip('\n')
 
             # Ignore blank lines and comments
-            m = re.match(self.LINES_TO_IGNORE_REGEX, line, re.UNICODE)
+            m = self._LINES_TO_IGNORE_PATTERN.match(line)
             if m:
                 continue
 
-            m = re.match(self.VALID_LINE_REGEX, line, re.UNICODE)
+            m = self._VALID_LINE_PATTERN.match(line)
             if not m:
                 cause = "Skip: '%s' -> line %s: invalid line format" % (line, str(nline))
                 logger.warning(cause)
@@ -319,7 +337,7 @@ class GitdmParser(object):
     def __parse_email_to_employer_line(self, raw_email, raw_enrollment):
         """Parse email to employer lines"""
 
-        e = re.match(self.EMAIL_ADDRESS_REGEX, raw_email, re.UNICODE)
+        e = self._EMAIL_ADDRESS_PATTERN.match(raw_email)
         if not e and self.email_validation:
             cause = "invalid email format: '%s'" % raw_email
             raise InvalidFormatError(cause=cause)
@@ -330,7 +348,7 @@ class GitdmParser(object):
             email = raw_email
 
         raw_enrollment = raw_enrollment.strip() if raw_enrollment != ' ' else raw_enrollment
-        r = re.match(self.ENROLLMENT_REGEX, raw_enrollment, re.UNICODE)
+        r = self._ENROLLMENT_PATTERN.match(raw_enrollment)
         if not r:
             cause = "invalid enrollment format: '%s'" % raw_enrollment
             raise InvalidFormatError(cause=cause)
@@ -340,9 +358,10 @@ class GitdmParser(object):
 
         if date:
             try:
-                dt = dateutil.parser.parse(r.group('date'))
-            except Exception as e:
+                dt = str_to_datetime(date)
+            except InvalidDateError:
                 cause = "invalid date: '%s'" % date
+                raise InvalidFormatError(cause=cause)
         else:
             dt = MAX_PERIOD_DATE
 
@@ -354,7 +373,7 @@ class GitdmParser(object):
     def __parse_domain_to_employer_line(self, raw_domain, raw_org):
         """Parse domain to employer lines"""
 
-        d = re.match(self.DOMAIN_REGEX, raw_domain, re.UNICODE)
+        d = self._DOMAIN_PATTERN.match(raw_domain)
         if not d:
             cause = "invalid domain format: '%s'" % raw_domain
             raise InvalidFormatError(cause=cause)
@@ -362,7 +381,7 @@ class GitdmParser(object):
         dom = d.group('domain').strip()
 
         raw_org = raw_org.strip() if raw_org != ' ' else raw_org
-        o = re.match(self.ORGANIZATION_REGEX, raw_org, re.UNICODE)
+        o = self._ORGANIZATION_PATTERN.match(raw_org)
         if not o:
             cause = "invalid organization format: '%s'" % raw_org
             raise InvalidFormatError(cause=cause)
@@ -22,9 +22,11 @@
 #     Quan Zhou <quan@bitergia.com>
 #
 
+import concurrent.futures
 import datetime
 import itertools
 import logging
+import math
 import re
 import yaml
 
@@ -38,6 +40,18 @@ PERCEVAL_BACKENDS = ['askbot', 'bugzilla', 'bugzillarest', 'confluence', 'discou
                      'jira', 'mbox', 'mediawiki', 'meetup', 'nntp', 'phabricator', 'pipermail',
                      'redmine', 'rss', 'slack', 'stackexchange', 'supybot', 'telegram']
 
+# Use libyaml bindings when they are available
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Top level items of a YAML sequence
+YAML_TOP_LEVEL_ITEM_REGEX = re.compile(r"^-(?:[ \t]|$)", re.MULTILINE)
+
+# Anchors and aliases of YAML nodes; they might be on different items
+YAML_ANCHOR_REGEX = re.compile(r"(?:^|[\s\[{,])[&*][^\s\[\]{},]", re.MULTILINE)
+
+# Number of chunks per job when parsing in parallel
+CHUNKS_PER_JOB = 4
+
 logger = logging.getLogger(__name__)
 
 
@@ -67,6 +81,7 @@ class GrimoireLabParser(object):
     :param source: source of the data
     :param email_validation: validate email addresses; set to True by default
     :param enrollment_validation: validate enrollment periods; set to True by default
+    :param jobs: number of processes used to parse the identities stream
 
     :raises InvalidFormatError: raised when the format of the stream is
         not valid.
@@ -76,13 +91,14 @@ class GrimoireLabParser(object):
 
     def __init__(self, identities=None, organizations=None,
                  source='grimoirelab', email_validation=True,
-                 enrollment_periods_validation=True):
+                 enrollment_periods_validation=True, jobs=1):
         self._blacklist = set()
         self._identities = {}
         self._organizations = {}
         self.source = source
         self.email_validation = email_validation
         self.enrollment_periods_validation = enrollment_periods_validation
+        self.jobs = jobs
 
         if not (identities or organizations):
             raise ValueError('Null identities and organization streams')
@@ -113,11 +129,71 @@ class GrimoireLabParser(object):
         if organizations_stream:
             self.__parse_organizations(organizations_stream)
 
-        if identities_stream:
-            self.__parse_identities(identities_stream)
-            self.__parse_blacklist(identities_stream)
+        if not identities_stream:
+            return
+
+        if self.jobs > 1:
+            self.__parse_identities_in_parallel(identities_stream)
+        else:
+            yaml_file = self.__load_yml(identities_stream)
+            self.__parse_identities(yaml_file)
+            self.__parse_blacklist(yaml_file)
+
+    def __parse_identities_in_parallel(self, stream):
+        """Parse identities and blacklist using a pool of processes.
+
+        The top level sequence of the stream is split into chunks
+        of items that are loaded by different processes. Loading
+        the YAML document is the most expensive step, so objects are
+        built from the loaded entries by this process, following the
+        order of the stream. Thus, the result is the same obtained
+        parsing the stream with a single process.
+
+        Items can only be loaded on their own when they do not refer
+        to anchors defined on other items, so streams with anchors or
+        aliases are loaded by this process.
+        """
+        if not isinstance(stream, str):
+            stream = stream.read()
+
+        if YAML_ANCHOR_REGEX.search(stream):
+            chunks = [stream]
+        else:
+            chunks = self.__split_yml_sequence(stream, self.jobs * CHUNKS_PER_JOB)
+
+        if len(chunks) < 2:
+            yaml_file = self.__load_yml(stream)
+        else:
+            yaml_file = []
+
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                for entries, error in executor.map(_load_yml_chunk, chunks):
+                    if error:
+                        cause = "invalid yml format. %s" % error
+                        raise InvalidFormatError(cause=cause)
+                    yaml_file.extend(entries or [])
+
+        self.__parse_identities(yaml_file)
+        self.__parse_blacklist(yaml_file)
 
-    def __parse_blacklist(self, stream):
+    @staticmethod
+    def __split_yml_sequence(stream, nchunks):
+        """Split a YAML top level sequence into valid YAML chunks"""
+
+        starts = [m.start() for m in YAML_TOP_LEVEL_ITEM_REGEX.finditer(stream)]
+
+        if not starts:
+            return [stream]
+
+        size = int(math.ceil(len(starts) / nchunks))
+
+        # The header of the document goes with the first chunk
+        starts[0] = 0
+        bounds = starts[::size] + [len(stream)]
+
+        return [stream[bounds[i]:bounds[i + 1]] for i in range(len(bounds) - 1)]
+
+    def __parse_blacklist(self, yaml_file):
         """Parse blacklist entries using GrimoireLab format.
 
         The GrimoireLab blacklist format is part of a YAML document
@@ -127,13 +203,11 @@ class GrimoireLabParser(object):
           - no-reply@example.com
           - root
 
-        :param stream: stream to parse
+        :param yaml_file: YAML object to parse
 
         :raises InvalidFormatError: raised when the format of the stream is
             not valid.
         """
-        yaml_file = self.__load_yml(stream)
-
         for element in yaml_file:
             if 'blacklist' not in element:
                 continue
@@ -152,7 +226,7 @@ class GrimoireLabParser(object):
                 bl = MatchingBlacklist(excluded=excluded)
                 self._blacklist.add(bl)
 
-    def __parse_identities(self, stream):
+    def __parse_identities(self, yaml_file):
         """Parse identities using GrimoireLab format.
 
         The GrimoireLab identities format is a YAML document following a
@@ -171,7 +245,7 @@ class GrimoireLabParser(object):
               start: 1900-01-01
               end: 2100-01-01
 
-        :parse json: YAML object to parse
+        :param yaml_file: YAML object to parse
 
         :raise InvalidFormatError: raised when the format of the YAML is
             not valid.
@@ -198,7 +272,6 @@ class GrimoireLabParser(object):
 
             return ids
 
-        yaml_file = self.__load_yml(stream)
         yid_counter = 0
 
         try:
@@ -361,8 +434,8 @@ class GrimoireLabParser(object):
         """Load yml stream into a dict object """
 
         try:
-            return yaml.load(stream, Loader=yaml.SafeLoader)
-        except ValueError as e:
+            return yaml.load(stream, Loader=YAML_LOADER)
+        except (yaml.YAMLError, ValueError) as e:
             cause = "invalid yml format. %s" % str(e)
             raise InvalidFormatError(cause=cause)
 
@@ -394,3 +467,17 @@ class GrimoireLabParser(object):
                 raise InvalidFormatError(cause=msg)
 
         return enrollments
+
+
+def _load_yml_chunk(stream):
+    """Load a chunk of a YAML stream.
+
+    Errors are returned as a message instead of being raised,
+    so they can be sent back from the worker processes.
+
+    :returns: a tuple with the loaded entries and an error message
+    """
+    try:
+        return yaml.load(stream, Loader=YAML_LOADER), None
+    except (yaml.YAMLError, ValueError) as e:
+        return None, str(e)
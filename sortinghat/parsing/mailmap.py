@@ -20,6 +20,8 @@
 #
 
 import email.utils
+import io
+import itertools
 import logging
 import re
 
@@ -49,6 +51,10 @@ class MailmapParser(object):
     keys are the name of the organizations and each organization object
     is related to a list of domains.
 
+    The stream can be given as a string or as a file object. In the
+    latter case, lines are read one by one so the contents of the file
+    are not loaded into memory at once.
+
     :param stream: stream to parse
     :param has_orgs: set if the stream maps data about organizations
     :param source: source of the identities
@@ -58,6 +64,8 @@ class MailmapParser(object):
     """
     LINES_TO_IGNORE_REGEX = r"^\s*(?:#.*)?\s*$"
 
+    _LINES_TO_IGNORE_PATTERN = re.compile(LINES_TO_IGNORE_REGEX, re.UNICODE)
+
     def __init__(self, stream, has_orgs=False, source='mailmap'):
         self._identities = {}
         self._organizations = {}
@@ -170,14 +178,21 @@ class MailmapParser(object):
     def __parse_stream(self, stream):
         """Generic method to parse mailmap streams"""
 
-        nline = 0
-        lines = stream.split('\n')
+        if isinstance(stream, str):
+            stream = io.StringIO(stream)
+
+        # File objects are always true, so the first line
+        # is read to find out whether the stream is empty
+        first_line = stream.readline() if stream else None
+
+        if not first_line:
+            raise InvalidFormatError(cause='stream cannot be empty or None')
 
-        for line in lines:
-            nline += 1
+        for nline, line in enumerate(itertools.chain([first_line], stream), start=1):
+            line = line.rstrip('\n')
 
             # Ignore blank lines and comments
-            m = re.match(self.LINES_TO_IGNORE_REGEX, line, re.UNICODE)
+            m = self._LINES_TO_IGNORE_PATTERN.match(line)
             if m:
                 continue
 
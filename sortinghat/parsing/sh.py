@@ -19,8 +19,14 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import json
 import logging
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 from ..db.model import UniqueIdentity, Identity, Profile,\
     Enrollment, Organization, Domain, Country, MatchingBlacklist
 from ..exceptions import InvalidFormatError, InvalidDateError
@@ -44,7 +50,13 @@ class SortingHatParser(object):
     are the name of the organizations and each organization object is
     related to a list of domains.
 
-    :param stream: stream to parse
+    The data can also be stored as a sequence of records, where
+    the first one has the fields of the document but 'uidentities'
+    and each of the rest has a unique identity. Use `from_json_lines`
+    or `from_msgpack` to parse these formats.
+
+    :param stream: stream to parse; it can also be a dict with
+        the document already decoded
 
     :raises InvalidFormatError: raised when the format of the stream is
         not valid.
@@ -56,6 +68,84 @@ class SortingHatParser(object):
         self._organizations = {}
         self.__parse(stream)
 
+    @classmethod
+    def from_records(cls, records):
+        """Parse a sequence of records.
+
+        :param records: iterable of dicts; the first one is the header
+            of the document and the rest are unique identities
+
+        :raises InvalidFormatError: raised when the records are not valid
+        """
+        records = iter(records)
+        header = next(records, None)
+
+        if header is None:
+            raise InvalidFormatError(cause="stream cannot be empty or None")
+        if not isinstance(header, dict):
+            raise InvalidFormatError(cause="invalid records format. Header must be an object")
+
+        document = dict(header)
+        document['uidentities'] = {}
+
+        for n, record in enumerate(records):
+            if not isinstance(record, dict):
+                msg = "invalid records format. Record %s must be an object" % (n + 1)
+                raise InvalidFormatError(cause=msg)
+            document['uidentities'][n] = record
+
+        return cls(document)
+
+    @classmethod
+    def from_json_lines(cls, stream):
+        """Parse a stream of records in JSON lines format.
+
+        :param stream: iterable of lines (i.e. a file object in text mode)
+
+        :raises InvalidFormatError: raised when the format of the stream is
+            not valid.
+        """
+        def decode(lines):
+            for nline, line in enumerate(lines, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    cause = "invalid json lines format. Line %s: %s" % (nline, str(e))
+                    raise InvalidFormatError(cause=cause)
+
+        return cls.from_records(decode(stream))
+
+    @classmethod
+    def from_msgpack(cls, stream):
+        """Parse a stream of records in MessagePack format.
+
+        :param stream: file object in binary mode
+
+        :raises InvalidFormatError: raised when the format of the stream is
+            not valid.
+        :raises ImportError: raised when `msgpack` is not installed
+        """
+        if not msgpack:
+            raise ImportError("'msgpack' package is required to read MessagePack records")
+
+        data = stream.read()
+
+        unpacker = msgpack.Unpacker(raw=False, max_buffer_size=max(len(data), 1))
+        unpacker.feed(data)
+
+        try:
+            records = list(unpacker)
+        except (ValueError, msgpack.UnpackException) as e:
+            cause = "invalid msgpack format. %s" % str(e)
+            raise InvalidFormatError(cause=cause)
+
+        if unpacker.tell() != len(data):
+            raise InvalidFormatError(cause="invalid msgpack format. Unexpected end of data")
+
+        return cls.from_records(records)
+
     @property
     def blacklist(self):
         bl = [b for b in self._blacklist.values()]
@@ -79,7 +169,10 @@ class SortingHatParser(object):
         if not stream:
             raise InvalidFormatError(cause="stream cannot be empty or None")
 
-        json = self.__load_json(stream)
+        if isinstance(stream, dict):
+            json = stream
+        else:
+            json = self.__load_json(stream)
 
         self.__parse_organizations(json)
         self.__parse_identities(json)
@@ -335,8 +428,6 @@ class SortingHatParser(object):
     def __load_json(self, stream):
         """Load json stream into a dict object """
 
-        import json
-
         try:
             return json.loads(stream)
         except ValueError as e:
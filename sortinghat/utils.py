@@ -19,9 +19,19 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import argparse
+import bisect
+import bz2
+import datetime
 import dateutil.parser
+import gzip
 import hashlib
+import heapq
 import logging
+import lzma
+import math
+import re
+import sys
 import unicodedata
 
 from .db.model import MIN_PERIOD_DATE, MAX_PERIOD_DATE
@@ -30,6 +40,33 @@ from .exceptions import InvalidDateError
 logger = logging.getLogger(__name__)
 
 
+# Supported compression formats: extensions, magic bytes and opener
+COMPRESSION_FORMATS = [
+    (('.gz', '.gzip'), b'\x1f\x8b', gzip.open),
+    (('.bz2',), b'BZh', bz2.open),
+    (('.xz', '.lzma'), b'\xfd7zXZ\x00', lzma.open)
+]
+MAGIC_BYTES_SIZE = max([len(fmt[1]) for fmt in COMPRESSION_FORMATS])
+
+# Canonical ISO 8601 dates (i.e. 2100-01-01T00:00:00)
+ISO_DATETIME_REGEX = re.compile(r"""
+    ^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})
+    (?:[T\ ](?P<hour>\d{2}):(?P<minute>\d{2})
+       (?::(?P<second>\d{2})(?:\.(?P<fraction>\d{1,6}))?)?
+       (?:Z|[+-]\d{2}(?::?\d{2})?)?
+    )?$
+    """, re.VERBOSE)
+
+# Letters that the database collation compares equal to their base
+# letter, or expands to several letters, but which are not decomposed
+# by Unicode normalization
+NGRAMS_FOLDED_LETTERS = str.maketrans({
+    'ø': 'o', 'ł': 'l', 'đ': 'd', 'ð': 'd', 'ħ': 'h', 'ŧ': 't',
+    'ƀ': 'b', 'ƶ': 'z', 'ǥ': 'g', 'ɨ': 'i',
+    'æ': 'ae', 'œ': 'oe', 'þ': 'th'
+})
+
+
 def merge_date_ranges(dates):
     """Merge date ranges.
 
@@ -95,6 +132,10 @@ def str_to_datetime(ts):
     and YY-MM-DD. When the given data is None or an empty string, the function
     returns None.
 
+    Canonical ISO 8601 strings (i.e. '2100-01-01T00:00:00') are converted
+    without calling `dateutil`, which is much slower. Like with the rest
+    of formats, timezone information is discarded.
+
     :param ts: string to convert
 
     :returns: a datetime object
@@ -105,12 +146,35 @@ def str_to_datetime(ts):
     if not ts:
         return None
 
+    m = ISO_DATETIME_REGEX.match(ts) if isinstance(ts, str) else None
+
+    if m:
+        try:
+            return _iso_match_to_datetime(m)
+        except ValueError:
+            # Let dateutil decide on out of range values
+            pass
+
     try:
         return dateutil.parser.parse(ts).replace(tzinfo=None)
     except Exception:
         raise InvalidDateError(date=str(ts))
 
 
+def _iso_match_to_datetime(m):
+    """Build a datetime object from an ISO 8601 regex match"""
+
+    fraction = m.group('fraction')
+
+    return datetime.datetime(int(m.group('year')),
+                             int(m.group('month')),
+                             int(m.group('day')),
+                             int(m.group('hour') or 0),
+                             int(m.group('minute') or 0),
+                             int(m.group('second') or 0),
+                             int(fraction.ljust(6, '0')) if fraction else 0)
+
+
 def to_unicode(x, unaccent=False):
     """Convert a string to unicode"""
     s = str(x)
@@ -123,6 +187,30 @@ def to_unicode(x, unaccent=False):
     return s
 
 
+def ngrams(value, n=3):
+    """Get the set of n-grams of a string.
+
+    The string is normalized before splitting it to compare it like
+    the database does: case is folded, compatibility characters
+    (i.e. 'ｊ') are replaced by their equivalents, and accents,
+    control and format characters are removed. Ligatures like 'æ' are
+    expanded too. This way, the n-grams of values like 'Jöhn', 'JOHN'
+    or 'ｊｏｈｎ' are the same. Strings
+    shorter than `n` do not have n-grams.
+
+    :param value: string to split
+    :param n: number of characters of each n-gram
+
+    :returns: a set of n-grams
+    """
+    s = unicodedata.normalize('NFKD', to_unicode(value).casefold())
+    s = ''.join(c for c in s
+                if not unicodedata.combining(c) and unicodedata.category(c)[0] != 'C')
+    s = s.translate(NGRAMS_FOLDED_LETTERS)
+
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
 def uuid(source, email=None, name=None, username=None):
     """Get the UUID related to the identity data.
 
@@ -169,3 +257,351 @@ def uuid(source, email=None, name=None, username=None):
     uuid_ = sha1.hexdigest()
 
     return uuid_
+
+
+class BloomFilter:
+    """Probabilistic set of strings.
+
+    A Bloom filter tells whether an item might be in the set or
+    whether it is definitely not there. False negatives are not
+    possible but false positives are. The probability of a false
+    positive will be close to `fp_rate` as long as the number of
+    items added to the filter does not exceed `capacity`. The
+    lower the rate, the more memory the filter needs.
+
+    :param capacity: expected number of items
+    :param fp_rate: false positive rate, between 0 and 1 (not included)
+
+    :raises ValueError: when `capacity` is negative or `fp_rate`
+        is out of range
+    """
+    def __init__(self, capacity, fp_rate=0.01):
+        if capacity < 0:
+            raise ValueError("capacity cannot be negative")
+        if not 0 < fp_rate < 1:
+            raise ValueError("false positive rate must be between 0 and 1")
+
+        capacity = max(capacity, 1)
+        nbits = -capacity * math.log(fp_rate) / (math.log(2) ** 2)
+
+        self.capacity = capacity
+
+        self.nbits = max(int(math.ceil(nbits)), 8)
+        self.nhashes = max(int(round(self.nbits / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.nbits + 7) // 8)
+        self.count = 0
+
+    def add(self, item):
+        """Add an item to the filter."""
+
+        for pos in self.__positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        for pos in self.__positions(item):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def __positions(self, item):
+        # Double hashing: the k positions are derived from two
+        # independent halves of a single digest
+        digest = hashlib.blake2b(item.encode('UTF-8', errors="surrogateescape"),
+                                 digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        for i in range(self.nhashes):
+            yield (h1 + i * h2) % self.nbits
+
+
+class DomainsTrie:
+    """Trie of domain names indexed by their reversed labels.
+
+    Each domain is stored splitting its name into labels, from
+    the rightmost to the leftmost (i.e 'www.example.com' is stored
+    as 'com' -> 'example' -> 'www'), together with a value and
+    a flag that sets whether it is a top domain. Names are
+    case insensitive.
+
+    Looking up a domain takes as many steps as labels it has,
+    no matter how many domains are stored.
+    """
+    class _Node:
+        __slots__ = ['children', 'value', 'is_top', 'stored']
+
+        def __init__(self):
+            self.children = {}
+            self.value = None
+            self.is_top = False
+            self.stored = False
+
+    def __init__(self):
+        self._root = self._Node()
+        self._size = 0
+
+    def add(self, domain, value=None, is_top=False):
+        """Add a domain to the trie.
+
+        When the domain already exists, its value and its top
+        flag are replaced.
+
+        :param domain: name of the domain
+        :param value: value linked to the domain
+        :param is_top: set the domain as a top domain
+        """
+        node = self._root
+
+        for label in self.__labels(domain):
+            node = node.children.setdefault(label, self._Node())
+
+        if not node.stored:
+            self._size += 1
+
+        node.value = value
+        node.is_top = is_top
+        node.stored = True
+
+    def lookup(self, domain):
+        """Find the domains that match with the given one.
+
+        When `domain` is stored, the list will only include its
+        value. Otherwise, the values of its top domains will be
+        returned, from the most specific to the most generic
+        (i.e for 'a.b.example.com', 'b.example.com' goes before
+        'example.com'). An empty list is returned when there
+        are no matches.
+
+        :param domain: name of the domain
+
+        :returns: a list of values
+        """
+        node = self._root
+        tops = []
+
+        for label in self.__labels(domain):
+            node = node.children.get(label, None)
+
+            if node is None:
+                break
+            elif node.stored and node.is_top:
+                tops.append(node.value)
+        else:
+            if node.stored:
+                return [node.value]
+
+        # Most specific domains go first
+        tops.reverse()
+
+        return tops
+
+    def __contains__(self, domain):
+        node = self._root
+
+        for label in self.__labels(domain):
+            node = node.children.get(label, None)
+
+            if node is None:
+                return False
+
+        return node.stored
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def __labels(domain):
+        labels = domain.strip('.').lower().split('.')
+        return reversed(labels)
+
+
+class EnrollmentsIndex:
+    """Index of enrollments to find affiliations on a given date.
+
+    Enrollment periods are added with `add`, including both their
+    start and end dates. For each unique identity, the periods are
+    split into non-overlapping intervals sorted by date, so finding
+    the affiliation on a date is a binary search over them.
+
+    When several periods of a unique identity include the same date,
+    the value of the one added first is returned. Intervals are
+    (re)built the first time the affiliations of a unique identity
+    are requested after adding new periods.
+    """
+    # Periods include their end date, so the next interval starts
+    # right after it
+    END_DELTA = datetime.timedelta(microseconds=1)
+
+    def __init__(self):
+        self._periods = {}
+        self._intervals = {}
+
+    def add(self, uuid, start, end, value):
+        """Add an enrollment period to the index.
+
+        :param uuid: unique identity enrolled
+        :param start: date when the enrollment starts
+        :param end: date when the enrollment ends
+        :param value: value linked to the period (i.e organization name)
+        """
+        self._periods.setdefault(uuid, []).append((start, end, value))
+        self._intervals.pop(uuid, None)
+
+    def find(self, uuid, date):
+        """Find the value of the enrollment of a unique identity on a date.
+
+        :param uuid: unique identity
+        :param date: date to check
+
+        :returns: the value of the enrollment or `None` when the unique
+            identity was not enrolled on that date
+        """
+        return self.find_all([(uuid, date)])[0]
+
+    def find_all(self, pairs):
+        """Find the values of the enrollments for a list of pairs.
+
+        :param pairs: iterable of (uuid, date) tuples
+
+        :returns: a list with the value of the enrollment, or `None`,
+            for each pair in the same order
+        """
+        periods = self._periods
+        intervals = self._intervals
+        bisect_right = bisect.bisect_right
+
+        results = []
+        append = results.append
+
+        for uuid, date in pairs:
+            found = intervals.get(uuid, None)
+
+            if found is None:
+                if uuid not in periods:
+                    append(None)
+                    continue
+                found = self.__build(periods[uuid])
+                intervals[uuid] = found
+
+            starts, values = found
+            i = bisect_right(starts, date) - 1
+            append(values[i] if i >= 0 else None)
+
+        return results
+
+    def __len__(self):
+        return len(self._periods)
+
+    def __build(self, periods):
+        # Sweep the boundaries of the periods keeping the active ones
+        # in a heap, sorted by the order they were added
+        events = sorted((start, i) for i, (start, _, _) in enumerate(periods))
+        points = sorted({start for start, _, _ in periods} |
+                        {end + self.END_DELTA for _, end, _ in periods})
+
+        starts = []
+        values = []
+        active = []
+        n = 0
+
+        for point in points:
+            while n < len(events) and events[n][0] <= point:
+                heapq.heappush(active, events[n][1])
+                n += 1
+
+            # Remove the periods that ended before this point
+            while active and periods[active[0]][1] < point:
+                heapq.heappop(active)
+
+            value = periods[active[0]][2] if active else None
+
+            # Merge consecutive intervals with the same value
+            if values and values[-1] == value:
+                continue
+
+            starts.append(point)
+            values.append(value)
+
+        return starts, values
+
+
+def open_file(filename, encoding='utf-8'):
+    """Open a file for reading text, decompressing it when needed.
+
+    Files compressed with gzip, bzip2 or xz are decompressed on the
+    fly while they are read. The compression format is selected using
+    the extension of the file or, when it is unknown, the magic bytes
+    at the beginning of its contents. The value '-' stands for the
+    standard input.
+
+    :param filename: path to the file or '-' for the standard input
+    :param encoding: encoding of the text
+
+    :returns: a file object in text mode
+
+    :raises IOError: when the file cannot be opened
+    """
+    if filename == '-':
+        # Replaced streams (i.e. StringIO) do not have binary buffers
+        stream = getattr(sys.stdin, 'buffer', None)
+
+        if stream is None or not hasattr(stream, 'peek'):
+            return sys.stdin
+
+        opener = _find_opener(stream.peek(MAGIC_BYTES_SIZE)[:MAGIC_BYTES_SIZE])
+
+        if not opener:
+            return sys.stdin
+
+        return opener(stream, 'rt', encoding=encoding)
+
+    opener = None
+
+    for extensions, _, compressed_opener in COMPRESSION_FORMATS:
+        if filename.lower().endswith(extensions):
+            opener = compressed_opener
+            break
+    else:
+        with open(filename, 'rb') as fd:
+            opener = _find_opener(fd.read(MAGIC_BYTES_SIZE))
+
+    if opener:
+        return opener(filename, 'rt', encoding=encoding)
+    else:
+        return open(filename, 'r', encoding=encoding)
+
+
+def _find_opener(magic):
+    """Find the opener of a compression format using its magic bytes"""
+
+    for _, fmt_magic, opener in COMPRESSION_FORMATS:
+        if magic.startswith(fmt_magic):
+            return opener
+    return None
+
+
+class InputFileType:
+    """Factory for creating input file types for `argparse`.
+
+    It works like `argparse.FileType('r')` but files compressed
+    with gzip, bzip2 or xz are decompressed on the fly. See
+    `open_file` for more details.
+
+    :param encoding: encoding of the text
+    """
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+
+    def __call__(self, string):
+        try:
+            return open_file(string, encoding=self.encoding)
+        except OSError as e:
+            msg = "can't open '%s': %s" % (string, e)
+            raise argparse.ArgumentTypeError(msg)
+
+    def __repr__(self):
+        return '%s(encoding=%r)' % (type(self).__name__, self.encoding)
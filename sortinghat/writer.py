@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class SortingHatJSONWriter(object):
+    """Write Sorting Hat JSON documents one unique identity at a time.
+
+    The document is written to `outfile` while unique identities are
+    given, so there is no need to keep all of them in memory. The
+    fields of `header` (i.e. 'time', 'source', 'organizations') are
+    written as they are, while the contents of 'uidentities' are
+    written with `write`. The document is finished calling `close`.
+
+    Unique identities must be written in ascending order of their
+    UUIDs. This way, the output is the same that `json.dumps` would
+    generate for the whole document, with sorted keys and using four
+    spaces as indentation. When `compact` is set, the document is
+    written with no indentation or whitespaces between elements.
+
+    :param outfile: file object where the document is written
+    :param header: dict with the fields of the document, other
+        than 'uidentities'
+    :param compact: write the document using a compact format
+    :param default: function to serialize objects not supported
+        by `json` (i.e. datetime objects)
+
+    :raises ValueError: when `header` contains 'uidentities' field
+    """
+    UIDENTITIES_KEY = 'uidentities'
+
+    def __init__(self, outfile, header, compact=False, default=None):
+        if self.UIDENTITIES_KEY in header:
+            raise ValueError("'%s' cannot be part of the header" % self.UIDENTITIES_KEY)
+
+        self.outfile = outfile
+        self.header = header
+        self.compact = compact
+        self.default = default
+        self.nuids = 0
+        self.last_uuid = None
+
+        self._nfields = 0
+        self._opened = False
+
+        if compact:
+            self._indent = None
+            self._separators = (',', ':')
+        else:
+            self._indent = 4
+            self._separators = (',', ': ')
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def open(self):
+        """Start the document, writing the header fields that go
+        before 'uidentities'."""
+
+        self.outfile.write('{')
+
+        for key in sorted(self.header):
+            if key < self.UIDENTITIES_KEY:
+                self.__write_field(key, self.header[key])
+
+        self.__write_key(self.UIDENTITIES_KEY, 1)
+        self.outfile.write('{')
+        self._opened = True
+
+    def write(self, uuid, uidentity):
+        """Write a unique identity.
+
+        :param uuid: UUID of the unique identity
+        :param uidentity: dict with the data of the unique identity
+
+        :raises ValueError: when `uuid` is not greater than the
+            UUID of the previous unique identity
+        """
+        if not self._opened:
+            self.open()
+
+        if self.last_uuid is not None and uuid <= self.last_uuid:
+            msg = "unique identities must be written in order; %s after %s" \
+                % (uuid, self.last_uuid)
+            raise ValueError(msg)
+
+        if self.nuids > 0:
+            self.outfile.write(',')
+
+        self.__write_key(uuid, 2)
+        self.outfile.write(self.__dumps(uidentity, 2))
+
+        self.nuids += 1
+        self.last_uuid = uuid
+
+    def close(self):
+        """Finish the document, writing the header fields that go
+        after 'uidentities'."""
+
+        if not self._opened:
+            self.open()
+
+        if self.nuids > 0 and not self.compact:
+            self.outfile.write('\n' + ' ' * self._indent)
+        self.outfile.write('}')
+
+        for key in sorted(self.header):
+            if key > self.UIDENTITIES_KEY:
+                self.__write_field(key, self.header[key])
+
+        if not self.compact:
+            self.outfile.write('\n')
+        self.outfile.write('}')
+
+    def __write_field(self, key, value):
+        self.__write_key(key, 1)
+        self.outfile.write(self.__dumps(value, 1))
+
+    def __write_key(self, key, level):
+        if level == 1:
+            if self._nfields > 0:
+                self.outfile.write(',')
+            self._nfields += 1
+
+        if not self.compact:
+            self.outfile.write('\n' + ' ' * (self._indent * level))
+
+        self.outfile.write(json.dumps(key) + self._separators[1])
+
+    def __dumps(self, obj, level):
+        s = json.dumps(obj, indent=self._indent,
+                       separators=self._separators,
+                       sort_keys=True, default=self.default)
+
+        if not self.compact:
+            s = s.replace('\n', '\n' + ' ' * (self._indent * level))
+
+        return s
+
+
+class SortingHatRecordsWriter(object):
+    """Write Sorting Hat data as a sequence of records.
+
+    The first record stores the fields of `header` (i.e. 'time',
+    'source', 'organizations'). Then, each unique identity given
+    with `write` is stored in its own record. Unlike JSON documents,
+    records can be written and read in any order, so files can be
+    split or processed in parallel.
+
+    Subclasses define how records are encoded.
+
+    :param outfile: file object where the records are written
+    :param header: dict with the fields of the document, other
+        than 'uidentities'
+    :param default: function to serialize objects not supported
+        by the encoder (i.e. datetime objects)
+
+    :raises ValueError: when `header` contains 'uidentities' field
+    """
+    UIDENTITIES_KEY = 'uidentities'
+
+    def __init__(self, outfile, header, default=None):
+        if self.UIDENTITIES_KEY in header:
+            raise ValueError("'%s' cannot be part of the header" % self.UIDENTITIES_KEY)
+
+        self.outfile = outfile
+        self.header = header
+        self.default = default
+        self.nuids = 0
+
+        self._opened = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+    def open(self):
+        """Write the header record"""
+
+        self._write_record(self.header)
+        self._opened = True
+
+    def write(self, uuid, uidentity):
+        """Write a unique identity.
+
+        :param uuid: UUID of the unique identity
+        :param uidentity: dict with the data of the unique identity
+        """
+        if not self._opened:
+            self.open()
+
+        self._write_record(uidentity)
+        self.nuids += 1
+
+    def close(self):
+        """Finish writing the records"""
+
+        if not self._opened:
+            self.open()
+
+    def _write_record(self, obj):
+        raise NotImplementedError
+
+
+class SortingHatJSONLinesWriter(SortingHatRecordsWriter):
+    """Write Sorting Hat data in JSON lines format.
+
+    Each record is a compact JSON object written in its own line.
+    `outfile` must be opened in text mode.
+    """
+    def _write_record(self, obj):
+        s = json.dumps(obj, separators=(',', ':'),
+                       sort_keys=True, default=self.default)
+        self.outfile.write(s + '\n')
+
+
+class SortingHatMessagePackWriter(SortingHatRecordsWriter):
+    """Write Sorting Hat data in MessagePack format.
+
+    Records are MessagePack maps written one after the other.
+    `outfile` must be opened in binary mode. This writer requires
+    `msgpack` package.
+
+    :raises ImportError: when `msgpack` is not installed
+    """
+    def __init__(self, outfile, header, default=None):
+        if not msgpack:
+            raise ImportError("'msgpack' package is required to write MessagePack records")
+
+        super(SortingHatMessagePackWriter, self).__init__(outfile, header,
+                                                          default=default)
+        self._packer = msgpack.Packer(default=default, use_bin_type=True)
+
+    def _write_record(self, obj):
+        self.outfile.write(self._packer.pack(obj))
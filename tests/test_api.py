@@ -23,14 +23,17 @@
 import datetime
 import sys
 import unittest
+import unittest.mock
 
 if '..' not in sys.path:
     sys.path.insert(0, '..')
 
 from sortinghat import api
+from sortinghat.db.api import add_unique_identity as add_unique_identity_db, \
+    add_identity as add_identity_db
 from sortinghat.db.model import UniqueIdentity, Identity, Profile, \
     Organization, Domain, Country, Enrollment, MatchingBlacklist
-from sortinghat.exceptions import AlreadyExistsError, NotFoundError
+from sortinghat.exceptions import AlreadyExistsError, NotFoundError, InvalidValueError
 from sortinghat.matcher import create_identity_matcher
 
 from tests.base import TestDatabaseCaseBase
@@ -2612,6 +2615,67 @@ class TestUniqueIdentities(TestAPICaseBase):
                           self.db, 'John Smith', 'scm')
 
 
+class TestIterUniqueIdentities(TestAPICaseBase):
+    """Unit tests for iter_unique_identities"""
+
+    def setUp(self):
+        super().setUp()
+
+        for i in range(7):
+            uuid = api.add_identity(self.db, 'scm', 'user%s@example.com' % i)
+
+            if i % 2:
+                api.add_identity(self.db, 'mls', 'user%s@example.com' % i, uuid=uuid)
+
+        api.add_unique_identity(self.db, 'Without identities')
+
+    def test_iter_unique_identities(self):
+        """Check if it generates the same unique identities than unique_identities"""
+
+        expected = [uid.uuid for uid in api.unique_identities(self.db)]
+        self.assertEqual(len(expected), 8)
+
+        for batch_size in (1, 3, 8, 100):
+            uids = list(api.iter_unique_identities(self.db, batch_size=batch_size))
+            self.assertListEqual([uid.uuid for uid in uids], expected)
+
+        # Identities and profiles are loaded
+        uid = uids[-1]
+        self.assertEqual(len(uid.identities), 1)
+        self.assertIsNotNone(uid.profile)
+
+    def test_source(self):
+        """Check if only the unique identities of the given source are generated"""
+
+        expected = [uid.uuid for uid in api.unique_identities(self.db, source='mls')]
+        self.assertEqual(len(expected), 3)
+
+        uids = list(api.iter_unique_identities(self.db, source='mls', batch_size=2))
+        self.assertListEqual([uid.uuid for uid in uids], expected)
+        self.assertEqual(len(uids[0].identities), 2)
+
+        uids = list(api.iter_unique_identities(self.db, source='its'))
+        self.assertListEqual(uids, [])
+
+    def test_batches(self):
+        """Check if unique identities are read in batches"""
+
+        with unittest.mock.patch.object(self.db, 'connect', wraps=self.db.connect) as connect:
+            uids = api.iter_unique_identities(self.db, batch_size=3)
+
+            next(uids)
+            self.assertEqual(connect.call_count, 1)
+
+            list(uids)
+            self.assertEqual(connect.call_count, 3)
+
+    def test_invalid_batch_size(self):
+        """Check if it fails when the batch size is not valid"""
+
+        self.assertRaises(InvalidValueError, api.iter_unique_identities,
+                          self.db, batch_size=0)
+
+
 class TestSearchUniqueIdentities(TestAPICaseBase):
     """Unit tests for search_unique_identities"""
 
@@ -2718,6 +2782,51 @@ class TestSearchUniqueIdentities(TestAPICaseBase):
                           self.db, 'Jane Rae')
 
 
+class TestSearchUniqueIdentitiesNgrams(TestAPICaseBase):
+    """Unit tests for searches using the n-grams index"""
+
+    def test_same_results(self):
+        """Check if the index does not change the results of the searches"""
+
+        api.add_identity(self.db, 'scm', 'jsmith@example.com', 'John Smith', 'jsmith')
+        api.add_identity(self.db, 'scm', 'jsmith@bitergia.com')
+        api.add_identity(self.db, 'mls', 'jsmith@bitergia.com', username='j_smith')
+        api.add_identity(self.db, 'scm', 'jdoe@example.com', 'John Doe', 'jdoe')
+        api.add_identity(self.db, 'its', 'jrae@example.net', 'Jane Rae')
+        api.add_unique_identity(self.db, 'Without identities')
+
+        terms = ['jsmith', 'JSMITH', 'bitergia', 'example.com', 'john', 'its',
+                 'j_smith', 'e.c', 'Jo', 'Rae@', 'nobody']
+
+        def search(term):
+            try:
+                uids = api.search_unique_identities(self.db, term)
+            except NotFoundError:
+                uids = []
+
+            result = [[uid.uuid for uid in uids]]
+
+            uids, ntotal = api.search_unique_identities_slice(self.db, term, 0, 100)
+            result.append(([uid.uuid for uid in uids], ntotal))
+
+            uids, _ = api.search_unique_identities_after(self.db, term)
+            result.append([uid.uuid for uid in uids])
+
+            return result
+
+        results = [search(term) for term in terms]
+
+        with unittest.mock.patch('sortinghat.api.search_identities_ngrams', return_value=None):
+            expected = [search(term) for term in terms]
+
+        self.assertListEqual(results, expected)
+
+        # Check some of the results
+        self.assertEqual(len(results[0][0]), 3)
+        self.assertEqual(len(results[6][0]), 1)
+        self.assertEqual(len(results[10][0]), 0)
+
+
 class TestSearchUniqueIdentitiesSlice(TestAPICaseBase):
     """Unit tests for search_unique_identitie_slice"""
 
@@ -2877,6 +2986,118 @@ class TestSearchUniqueIdentitiesSlice(TestAPICaseBase):
                           self.db, None, 1, -1)
 
 
+class TestSearchUniqueIdentitiesAfter(TestAPICaseBase):
+    """Unit tests for search_unique_identities_after"""
+
+    def test_search_unique_identities_after(self):
+        """Check if it returns pages of unique identities after a given one"""
+
+        api.add_identity(self.db, 'scm', 'jsmith@example.com',
+                         'John Smith', 'jsmith')
+        api.add_identity(self.db, 'scm', 'jsmith@bitergia.com')
+        api.add_identity(self.db, 'mls', 'jsmith@bitergia.com')
+        api.add_identity(self.db, 'scm', 'jdoe@example.com', 'John Doe', 'jdoe')
+
+        uids, ntotal = api.search_unique_identities_after(self.db, 'jsmith', limit=2)
+        self.assertEqual(len(uids), 2)
+        self.assertEqual(ntotal, None)
+        self.assertEqual(uids[0].uuid, 'a9b403e150dd4af8953a52a4bb841051e4b705d9')
+        self.assertEqual(uids[1].uuid, 'acced28b86278f00a21080d695ecb34b81a1828f')
+        self.assertEqual(len(uids[0].identities), 1)
+
+        uids, ntotal = api.search_unique_identities_after(self.db, 'jsmith',
+                                                          after=uids[-1].uuid, limit=2)
+        self.assertEqual(len(uids), 1)
+        self.assertEqual(uids[0].uuid, 'ebcda394c978d50847d60015892f9ca0f0ccde65')
+
+        # No more results
+        uids, ntotal = api.search_unique_identities_after(self.db, 'jsmith',
+                                                          after=uids[-1].uuid, limit=2)
+        self.assertListEqual(uids, [])
+
+    def test_same_results_as_slice(self):
+        """Check if paging with a cursor returns the same results than slicing"""
+
+        for i in range(7):
+            uuid = api.add_identity(self.db, 'scm', 'user%s@example.com' % i)
+            api.add_identity(self.db, 'mls', 'user%s@example.com' % i, uuid=uuid)
+        api.add_unique_identity(self.db, 'Without identities')
+
+        for term in (None, 'example', 'mls', 'user3'):
+            expected, nexpected = api.search_unique_identities_slice(self.db, term, 0, 100)
+
+            uuids = []
+            after = None
+
+            while True:
+                uids, ntotal = api.search_unique_identities_after(self.db, term, after=after,
+                                                                  limit=3, total=True)
+                self.assertEqual(ntotal, nexpected)
+
+                if not uids:
+                    break
+
+                uuids.extend([uid.uuid for uid in uids])
+                after = uids[-1].uuid
+
+            self.assertListEqual(uuids, [uid.uuid for uid in expected])
+
+    def test_cached_total(self):
+        """Check if the total of a search is cached until identities change"""
+
+        api.add_identity(self.db, 'scm', 'jsmith@example.com', 'John Smith', 'jsmith')
+        api.add_identity(self.db, 'scm', 'jdoe@example.com', 'John Doe', 'jdoe')
+
+        # Without cache, totals are always counted
+        _, ntotal = api.search_unique_identities_after(self.db, 'john', limit=1, total=True)
+        self.assertEqual(ntotal, 2)
+
+        self.db.enable_cache()
+
+        try:
+            _, ntotal = api.search_unique_identities_after(self.db, 'john', limit=1, total=True)
+            self.assertEqual(ntotal, 2)
+
+            # Add an identity without invalidating the cache
+            with self.db.connect() as session:
+                uidentity = add_unique_identity_db(session, 'John Roe')
+                add_identity_db(session, uidentity, 'John Roe', 'scm', name='John Roe')
+
+            # The total was cached
+            uids, ntotal = api.search_unique_identities_after(self.db, 'john', total=True)
+            self.assertEqual(len(uids), 3)
+            self.assertEqual(ntotal, 2)
+
+            # Other terms are counted
+            _, ntotal = api.search_unique_identities_after(self.db, 'jdoe', total=True)
+            self.assertEqual(ntotal, 1)
+
+            # Modifying identities, totals are counted again
+            api.add_identity(self.db, 'scm', 'jrae@example.com', 'John Rae', 'jrae')
+
+            _, ntotal = api.search_unique_identities_after(self.db, 'john', total=True)
+            self.assertEqual(ntotal, 4)
+
+            stats = self.db.cache.stats()['search_totals']
+            self.assertEqual(stats['hits'], 1)
+            self.assertEqual(stats['misses'], 3)
+        finally:
+            self.db.disable_cache()
+
+    def test_empty_registry(self):
+        """Check whether it returns an empty list when the registry is empty"""
+
+        uids, ntotal = api.search_unique_identities_after(self.db, None, total=True)
+        self.assertListEqual(uids, [])
+        self.assertEqual(ntotal, 0)
+
+    def test_invalid_limit(self):
+        """Check whether it raises an exception when limit value is invalid"""
+
+        self.assertRaises(ValueError, api.search_unique_identities_after,
+                          self.db, None, None, -1)
+
+
 class TestSearchLastModifiedIdentities(TestAPICaseBase):
     """Unit tests for last_modified_identities"""
 
@@ -2975,6 +3196,62 @@ class TestSearchLastModifiedIdentities(TestAPICaseBase):
         self.assertListEqual(uuids, [])
 
 
+class TestSearchDeletedUniqueIdentities(TestAPICaseBase):
+    """Unit tests for search_deleted_unique_identities"""
+
+    def test_search_deleted_unique_identities(self):
+        """Check if it returns the deleted and merged unique identities"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.add_unique_identity(self.db, 'John Doe')
+        api.add_unique_identity(self.db, 'Jane Rae')
+        api.add_unique_identity(self.db, 'Jane Roe')
+
+        before_dt = datetime.datetime.utcnow()
+
+        api.delete_unique_identity(self.db, 'Jane Rae')
+        api.merge_unique_identities(self.db, 'John Doe', 'John Smith')
+
+        before_delete_dt = datetime.datetime.utcnow()
+
+        api.delete_unique_identity(self.db, 'Jane Roe')
+
+        # Deletions are sorted by date
+        deleted = api.search_deleted_unique_identities(self.db, before_dt)
+        self.assertEqual(len(deleted), 3)
+
+        self.assertEqual(deleted[0].uuid, 'Jane Rae')
+        self.assertEqual(deleted[0].merged_into, None)
+        self.assertGreaterEqual(deleted[0].deleted_at, before_dt)
+
+        self.assertEqual(deleted[1].uuid, 'John Doe')
+        self.assertEqual(deleted[1].merged_into, 'John Smith')
+
+        self.assertEqual(deleted[2].uuid, 'Jane Roe')
+        self.assertEqual(deleted[2].merged_into, None)
+        self.assertGreaterEqual(deleted[2].deleted_at, before_delete_dt)
+
+        # Check if only the last deletions are returned
+        deleted = api.search_deleted_unique_identities(self.db, before_delete_dt)
+        self.assertEqual(len(deleted), 1)
+        self.assertEqual(deleted[0].uuid, 'Jane Roe')
+
+    def test_empty_search_deleted_unique_identities(self):
+        """Check if the result is empty when unique identities are not deleted"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.add_unique_identity(self.db, 'John Doe')
+        api.delete_unique_identity(self.db, 'John Doe')
+
+        after_dt = datetime.datetime.utcnow()
+
+        # Merging a unique identity with itself does not delete it
+        api.merge_unique_identities(self.db, 'John Smith', 'John Smith')
+
+        deleted = api.search_deleted_unique_identities(self.db, after_dt)
+        self.assertListEqual(deleted, [])
+
+
 class TestSearchProfiles(TestAPICaseBase):
     """Unit tests for search_profiles"""
 
@@ -3293,6 +3570,50 @@ class TestDomains(TestAPICaseBase):
         self.assertRaises(NotFoundError, api.domains, self.db, '.myexample.com', True)
 
 
+class TestDomainsTrie(TestAPICaseBase):
+    """Unit tests for domains_trie"""
+
+    def test_domains_trie(self):
+        """Check if the domains of the registry are loaded into a trie"""
+
+        api.add_organization(self.db, 'Example')
+        api.add_domain(self.db, 'Example', 'example.com', is_top_domain=True)
+        api.add_domain(self.db, 'Example', 'u.example.com', is_top_domain=True)
+        api.add_domain(self.db, 'Example', 'es.u.example.com')
+
+        api.add_organization(self.db, 'Bitergia')
+        api.add_domain(self.db, 'Bitergia', 'bitergia.com')
+
+        trie = api.domains_trie(self.db)
+        self.assertEqual(len(trie), 4)
+
+        # Results must be the same that the ones given by 'domains'
+        for domain in ['example.com', 'es.u.example.com', 'bitergia.com',
+                       'en.u.example.com', 'a.es.u.example.com']:
+            expected = api.domains(self.db, domain=domain, top=True)
+            expected.sort(key=lambda d: len(d.domain), reverse=True)
+
+            doms = trie.lookup(domain)
+            self.assertListEqual([d.domain for d in doms],
+                                 [d.domain for d in expected])
+
+        doms = trie.lookup('en.u.example.com')
+        self.assertIsInstance(doms[0], Domain)
+        self.assertEqual(doms[0].organization.name, 'Example')
+
+        # Sub-domains of domains which are not top domains are not found
+        self.assertListEqual(trie.lookup('dev.bitergia.com'), [])
+        self.assertRaises(NotFoundError, api.domains, self.db,
+                          domain='dev.bitergia.com', top=True)
+
+    def test_empty_registry(self):
+        """Check if an empty trie is returned when the registry is empty"""
+
+        trie = api.domains_trie(self.db)
+        self.assertEqual(len(trie), 0)
+        self.assertListEqual(trie.lookup('example.com'), [])
+
+
 class TestCountries(TestAPICaseBase):
     """Unit tests for countries"""
 
@@ -3710,6 +4031,190 @@ class TestEnrollments(TestAPICaseBase):
                                'John Smith', 'LibreSoft')
 
 
+class TestIterIdentities(TestAPICaseBase):
+    """Unit tests for iter_identities"""
+
+    def load_identities(self):
+        jsmith_uuid = api.add_identity(self.db, 'scm', 'jsmith@example.com',
+                                       'John Smith', 'jsmith')
+        api.add_identity(self.db, 'mls', 'jsmith@example.com', uuid=jsmith_uuid)
+        jdoe_uuid = api.add_identity(self.db, 'scm', 'jdoe@example.com', 'John Doe')
+
+        return jsmith_uuid, jdoe_uuid
+
+    def test_iter_identities(self):
+        """Check if it generates records with the data of the identities"""
+
+        jsmith_uuid, jdoe_uuid = self.load_identities()
+
+        records = list(api.iter_identities(self.db))
+        self.assertEqual(len(records), 3)
+
+        # Records are sorted by uuid and id
+        self.assertListEqual([r.uuid for r in records], [jdoe_uuid, jsmith_uuid, jsmith_uuid])
+        self.assertListEqual([r.id for r in records[1:]], sorted([r.id for r in records[1:]]))
+
+        with self.db.connect() as session:
+            identity = session.query(Identity).filter(Identity.id == jdoe_uuid).one()
+            expected = tuple(getattr(identity, column) for column in api.IDENTITY_COLUMNS)
+
+        self.assertIsInstance(records[0], tuple)
+        self.assertTupleEqual(records[0], expected)
+        self.assertEqual(records[0].email, 'jdoe@example.com')
+        self.assertEqual(records[0].username, None)
+
+    def test_columns(self):
+        """Check if only the given columns are returned"""
+
+        jsmith_uuid, _ = self.load_identities()
+
+        records = list(api.iter_identities(self.db, columns=['source', 'email']))
+        self.assertListEqual(sorted(records), [('mls', 'jsmith@example.com'),
+                                               ('scm', 'jdoe@example.com'),
+                                               ('scm', 'jsmith@example.com')])
+        self.assertTupleEqual(records[0]._fields, ('source', 'email'))
+
+    def test_filters(self):
+        """Check if identities are filtered by source and unique identity"""
+
+        jsmith_uuid, jdoe_uuid = self.load_identities()
+
+        records = list(api.iter_identities(self.db, source='scm', columns=['uuid']))
+        self.assertListEqual(records, [(jdoe_uuid,), (jsmith_uuid,)])
+
+        records = list(api.iter_identities(self.db, uuid=jsmith_uuid, columns=['source']))
+        self.assertListEqual(sorted(records), [('mls',), ('scm',)])
+
+        records = list(api.iter_identities(self.db, source='its'))
+        self.assertListEqual(records, [])
+
+    def test_invalid_columns(self):
+        """Check if it fails when a column is not valid"""
+
+        self.assertRaisesRegex(InvalidValueError, "'profile' is not a valid column",
+                               api.iter_identities, self.db, columns=['name', 'profile'])
+        self.assertRaisesRegex(InvalidValueError, "columns cannot be empty",
+                               api.iter_identities, self.db, columns=[])
+
+
+class TestIterEnrollments(TestAPICaseBase):
+    """Unit tests for iter_enrollments"""
+
+    def setUp(self):
+        super().setUp()
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.add_unique_identity(self.db, 'John Doe')
+
+        api.add_organization(self.db, 'Example')
+        api.add_organization(self.db, 'Bitergia')
+
+        api.add_enrollment(self.db, 'John Smith', 'Example')
+        api.add_enrollment(self.db, 'John Smith', 'Bitergia',
+                           datetime.datetime(1999, 1, 1),
+                           datetime.datetime(2000, 1, 1))
+        api.add_enrollment(self.db, 'John Doe', 'Bitergia',
+                           datetime.datetime(2005, 1, 1),
+                           datetime.datetime(2008, 1, 1))
+
+    def test_iter_enrollments(self):
+        """Check if it generates the same enrollments than enrollments"""
+
+        expected = [(rol.uuid, rol.organization.name, rol.start, rol.end)
+                    for rol in api.enrollments(self.db)]
+
+        records = list(api.iter_enrollments(self.db))
+        self.assertListEqual(records, expected)
+        self.assertEqual(records[0].organization, 'Bitergia')
+        self.assertEqual(records[0].start, datetime.datetime(2005, 1, 1))
+
+    def test_filters(self):
+        """Check if enrollments are filtered like in enrollments"""
+
+        params = [
+            {'uuid': 'John Smith'},
+            {'organization': 'Bitergia'},
+            {'uuid': 'John Smith', 'organization': 'Bitergia'},
+            {'from_date': datetime.datetime(1999, 1, 1)},
+            {'from_date': datetime.datetime(2000, 1, 1),
+             'to_date': datetime.datetime(2010, 1, 1)}
+        ]
+
+        for kwargs in params:
+            expected = [(rol.uuid, rol.organization.name, rol.start, rol.end)
+                        for rol in api.enrollments(self.db, **kwargs)]
+            records = list(api.iter_enrollments(self.db, **kwargs))
+            self.assertListEqual(records, expected)
+
+        records = list(api.iter_enrollments(self.db, uuid='Jane Rae'))
+        self.assertListEqual(records, [])
+
+    def test_columns(self):
+        """Check if only the given columns are returned"""
+
+        records = list(api.iter_enrollments(self.db, columns=['organization', 'uuid']))
+        self.assertListEqual(records, [('Bitergia', 'John Doe'),
+                                       ('Bitergia', 'John Smith'),
+                                       ('Example', 'John Smith')])
+
+    def test_invalid_params(self):
+        """Check if it fails when the params are not valid"""
+
+        self.assertRaisesRegex(InvalidValueError, "'id' is not a valid column",
+                               api.iter_enrollments, self.db, columns=['id'])
+        self.assertRaisesRegex(InvalidValueError, "cannot be greater than",
+                               api.iter_enrollments, self.db,
+                               from_date=datetime.datetime(2001, 1, 1),
+                               to_date=datetime.datetime(2000, 1, 1))
+
+
+class TestAffiliationsAt(TestAPICaseBase):
+    """Unit tests for affiliations_at"""
+
+    def test_affiliations_at(self):
+        """Check if it returns the organizations on the given dates"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.add_unique_identity(self.db, 'John Doe')
+        api.add_unique_identity(self.db, 'Jane Rae')
+
+        api.add_organization(self.db, 'Example')
+        api.add_organization(self.db, 'Bitergia')
+        api.add_organization(self.db, 'LibreSoft')
+
+        api.add_enrollment(self.db, 'John Smith', 'Example',
+                           datetime.datetime(1900, 1, 1),
+                           datetime.datetime(2010, 1, 1))
+        api.add_enrollment(self.db, 'John Smith', 'Bitergia',
+                           datetime.datetime(2010, 1, 2),
+                           datetime.datetime(2100, 1, 1))
+        api.add_enrollment(self.db, 'John Doe', 'LibreSoft',
+                           datetime.datetime(2005, 1, 1),
+                           datetime.datetime(2008, 1, 1))
+        api.add_enrollment(self.db, 'John Doe', 'Example')
+
+        pairs = [('John Smith', datetime.datetime(2005, 1, 1)),
+                 ('John Doe', datetime.datetime(2006, 1, 1)),
+                 ('John Smith', datetime.datetime(2010, 1, 1, 12, 0, 0)),
+                 ('Jane Rae', datetime.datetime(2006, 1, 1)),
+                 ('John Doe', datetime.datetime(2009, 1, 1)),
+                 ('John Smith', datetime.datetime(2015, 1, 1)),
+                 ('Unknown', datetime.datetime(2015, 1, 1))]
+
+        result = api.affiliations_at(self.db, iter(pairs))
+
+        # Overlapped enrollments are selected by organization name
+        expected = ['Example', 'Example', None, None,
+                    'Example', 'Bitergia', None]
+        self.assertListEqual(result, expected)
+
+    def test_empty_pairs(self):
+        """Check if it returns an empty list when no pairs are given"""
+
+        result = api.affiliations_at(self.db, [])
+        self.assertListEqual(result, [])
+
+
 class TestBlacklist(TestAPICaseBase):
     """Unit tests for blacklist"""
 
@@ -3793,5 +4298,133 @@ class TestBlacklist(TestAPICaseBase):
         self.assertRaises(NotFoundError, api.blacklist, self.db, 'jane')
 
 
+class TestReadThroughCache(TestAPICaseBase):
+    """Unit tests for the lookups cache"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = self.db.enable_cache()
+
+    def tearDown(self):
+        self.db.disable_cache()
+        super().tearDown()
+
+    def test_cached_lookups(self):
+        """Check if repeated lookups are read from the cache"""
+
+        api.add_identity(self.db, 'scm', 'jsmith@example.com', uuid=None)
+        api.add_organization(self.db, 'Example')
+        api.add_domain(self.db, 'Example', 'example.com', is_top_domain=True)
+        api.add_to_matching_blacklist(self.db, 'root@example.com')
+
+        uuid = api.unique_identities(self.db)[0].uuid
+
+        for _ in range(3):
+            uids = api.unique_identities(self.db, uuid)
+            self.assertEqual(uids[0].uuid, uuid)
+            self.assertEqual(uids[0].identities[0].email, 'jsmith@example.com')
+
+            orgs = api.registry(self.db, 'Example')
+            self.assertEqual(orgs[0].domains[0].domain, 'example.com')
+
+            doms = api.domains(self.db, 'www.example.com', top=True)
+            self.assertEqual(doms[0].organization.name, 'Example')
+
+            mbs = api.blacklist(self.db)
+            self.assertEqual(mbs[0].excluded, 'root@example.com')
+
+        stats = self.cache.stats()
+
+        for entity in ('uidentities', 'organizations', 'domains', 'blacklist'):
+            self.assertEqual(stats[entity]['misses'], 1)
+            self.assertEqual(stats[entity]['hits'], 2)
+            self.assertEqual(stats[entity]['entries'], 1)
+
+    def test_not_cached_lookups(self):
+        """Check if listings of unique identities and errors are not cached"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+
+        api.unique_identities(self.db)
+        api.unique_identities(self.db)
+        self.assertRaises(NotFoundError, api.unique_identities, self.db, 'Jane Roe')
+
+        api.add_unique_identity(self.db, 'Jane Roe')
+        uids = api.unique_identities(self.db, 'Jane Roe')
+        self.assertEqual(uids[0].uuid, 'Jane Roe')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['uidentities']['hits'], 0)
+        self.assertEqual(stats['uidentities']['entries'], 1)
+
+    def test_returned_lists(self):
+        """Check if modifying a returned list does not change the cached one"""
+
+        api.add_to_matching_blacklist(self.db, 'root@example.com')
+
+        mbs = api.blacklist(self.db)
+        mbs.clear()
+
+        mbs = api.blacklist(self.db)
+        self.assertEqual(len(mbs), 1)
+
+    def test_invalidate_on_write(self):
+        """Check if write functions invalidate the cached entities"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.add_unique_identity(self.db, 'John Doe')
+        api.add_organization(self.db, 'Example')
+        api.add_domain(self.db, 'Example', 'example.com')
+        api.add_to_matching_blacklist(self.db, 'root@example.com')
+
+        uids = api.unique_identities(self.db, 'John Smith')
+        self.assertIsNone(uids[0].profile.name)
+
+        api.edit_profile(self.db, 'John Smith', name='John Smith')
+        uids = api.unique_identities(self.db, 'John Smith')
+        self.assertEqual(uids[0].profile.name, 'John Smith')
+
+        api.merge_unique_identities(self.db, 'John Smith', 'John Doe')
+        self.assertRaises(NotFoundError, api.unique_identities, self.db, 'John Smith')
+
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs[0].domains), 1)
+
+        api.add_domain(self.db, 'Example', 'example.org')
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs[0].domains), 2)
+
+        api.domains(self.db, 'example.com')
+        api.delete_organization(self.db, 'Example')
+        self.assertRaises(NotFoundError, api.registry, self.db, 'Example')
+        self.assertRaises(NotFoundError, api.domains, self.db, 'example.com')
+
+        api.blacklist(self.db)
+        api.delete_from_matching_blacklist(self.db, 'root@example.com')
+        self.assertListEqual(api.blacklist(self.db), [])
+
+    def test_invalidate_on_failed_write(self):
+        """Check if the cache is invalidated even when a write function fails"""
+
+        api.add_unique_identity(self.db, 'John Smith')
+        api.unique_identities(self.db, 'John Smith')
+
+        self.assertRaises(AlreadyExistsError, api.add_unique_identity,
+                          self.db, 'John Smith')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['uidentities']['entries'], 0)
+
+    def test_clear(self):
+        """Check if clearing the database invalidates the cache"""
+
+        api.add_to_matching_blacklist(self.db, 'root@example.com')
+        api.blacklist(self.db)
+
+        self.db.clear()
+
+        self.assertListEqual(api.blacklist(self.db), [])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -20,14 +20,17 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import datetime
 import sys
 import unittest
+import unittest.mock
 
 if '..' not in sys.path:
     sys.path.insert(0, '..')
 
 from sortinghat import api
 from sortinghat.command import CMD_SUCCESS
+from sortinghat.exceptions import CODE_INVALID_DATE_ERROR
 from sortinghat.cmd.affiliate import Affiliate
 
 from tests.base import TestCommandCaseBase
@@ -42,8 +45,21 @@ Unique identity 17ab00ed3825ec2f50483e33c88df223264182ba (jroe@example.com) affi
 Unique identity 17ab00ed3825ec2f50483e33c88df223264182ba (jroe@bitergia.com) affiliated to Bitergia
 Unique identity dc31d2afbee88a6d1dbc1ef05ec827b878067744 (jsmith@us.example.com) affiliated to Example"""
 
+AFFILIATE_OUTPUT_SINCE = """Unique identity 108f508fea9861d86c8d07a197489cc630bec446 (janedoe@it.u.example.com) \
+affiliated to Example Alt"""
+
+AFFILIATE_OUTPUT_DOMAIN = """Unique identity 17ab00ed3825ec2f50483e33c88df223264182ba (jroe@bitergia.com) \
+affiliated to Bitergia"""
+
+AFFILIATE_OUTPUT_DOMAIN_TOP = """Unique identity 17ab00ed3825ec2f50483e33c88df223264182ba (jroe@bitergia.com) \
+affiliated to Bitergia
+Unique identity 17ab00ed3825ec2f50483e33c88df223264182ba (jroe@example.com) affiliated to Example
+Unique identity dc31d2afbee88a6d1dbc1ef05ec827b878067744 (jsmith@us.example.com) affiliated to Example"""
+
 AFFILIATE_EMPTY_OUTPUT = ""
 
+AFFILIATE_INVALID_DATE_ERROR = "Error: 2001-13-01 is not a valid date"
+
 MULTIPLE_DOMAIN_WARNING = "Warning: multiple top domains for %(subdomain)s sub-domain. Domain %(domain)s selected."
 
 
@@ -120,6 +136,27 @@ class TestAffiliateCommand(TestAffiliateCaseBase):
                          MULTIPLE_DOMAIN_WARNING % {'subdomain': 'it.u.example.com',
                                                     'domain': 'u.example.com'})
 
+    def test_since(self):
+        """Check if only the unique identities modified since the given date are affiliated"""
+
+        since = datetime.datetime.utcnow()
+        api.add_identity(self.db, 'scm', 'janedoe@it.u.example.com')
+
+        code = self.cmd.run('--since', str(since))
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_OUTPUT_SINCE)
+
+    def test_invalid_since_date(self):
+        """Check if it fails when the date is invalid"""
+
+        code = self.cmd.run('--since', '2001-13-01')
+        self.assertEqual(code, CODE_INVALID_DATE_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_INVALID_DATE_ERROR)
+
     def test_empty_registry(self):
         """Check output when the registry is empty"""
 
@@ -161,6 +198,78 @@ class TestAffiliate(TestAffiliateCaseBase):
                          MULTIPLE_DOMAIN_WARNING % {'subdomain': 'it.u.example.com',
                                                     'domain': 'u.example.com'})
 
+    def test_enrollments(self):
+        """Check if the enrollments are stored in the registry"""
+
+        before = api.unique_identities(self.db, '17ab00ed3825ec2f50483e33c88df223264182ba')[0]
+
+        # Insert one enrollment on each batch
+        with unittest.mock.patch('sortinghat.cmd.affiliate.AFFILIATE_BATCH_SIZE', 1):
+            code = self.cmd.affiliate()
+        self.assertEqual(code, CMD_SUCCESS)
+
+        enrollments = api.enrollments(self.db, '17ab00ed3825ec2f50483e33c88df223264182ba')
+        self.assertEqual(len(enrollments), 2)
+        self.assertEqual(enrollments[0].organization.name, 'Bitergia')
+        self.assertEqual(enrollments[1].organization.name, 'Example')
+
+        enrollments = api.enrollments(self.db, 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+        self.assertEqual(len(enrollments), 2)
+        self.assertEqual(enrollments[0].organization.name, 'Bitergia')
+        self.assertEqual(enrollments[1].organization.name, 'Example')
+
+        after = api.unique_identities(self.db, '17ab00ed3825ec2f50483e33c88df223264182ba')[0]
+        self.assertGreater(after.last_modified, before.last_modified)
+
+        # Running it again does not create new enrollments
+        code = self.cmd.affiliate()
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_OUTPUT)
+
+        enrollments = api.enrollments(self.db)
+        self.assertEqual(len(enrollments), 4)
+
+    def test_batches(self):
+        """Check if every unique identity is affiliated when there are several batches"""
+
+        api.add_identity(self.db, 'scm', 'janedoe@it.u.example.com')
+
+        with unittest.mock.patch('sortinghat.cmd.affiliate.AFFILIATE_BATCH_SIZE', 1), \
+                unittest.mock.patch('sortinghat.cmd.affiliate.AFFILIATE_FETCH_SIZE', 1):
+            code = self.cmd.affiliate()
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_OUTPUT_ALT)
+
+        enrollments = api.enrollments(self.db, '108f508fea9861d86c8d07a197489cc630bec446')
+        self.assertEqual(len(enrollments), 1)
+        self.assertEqual(enrollments[0].organization.name, 'Example Alt')
+
+        enrollments = api.enrollments(self.db, '17ab00ed3825ec2f50483e33c88df223264182ba')
+        self.assertEqual(len(enrollments), 2)
+
+        enrollments = api.enrollments(self.db, 'dc31d2afbee88a6d1dbc1ef05ec827b878067744')
+        self.assertEqual(len(enrollments), 2)
+
+    def test_domain(self):
+        """Check if only the email addresses on the given domain are affiliated"""
+
+        code = self.cmd.affiliate(domain='bitergia.com')
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_OUTPUT_DOMAIN)
+
+        # Sub-domains of a top domain are also checked
+        code = self.cmd.affiliate(domain='example.com')
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, AFFILIATE_OUTPUT_DOMAIN_TOP)
+
     def test_empty_registry(self):
         """Check output when the registry is empty"""
 
@@ -20,9 +20,16 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import http.server
 import json
+import os
+import shutil
 import sys
+import tempfile
+import threading
 import unittest
+import unittest.mock
+import urllib.parse
 
 import httpretty
 import requests
@@ -32,9 +39,17 @@ if '..' not in sys.path:
 
 from sortinghat import api
 from sortinghat.command import CMD_SUCCESS
-from sortinghat.cmd.autogender import AutoGender, genderize
+from sortinghat.exceptions import (CODE_INVALID_FORMAT_ERROR,
+                                   CODE_VALUE_ERROR,
+                                   InvalidFormatError)
+from sortinghat.cmd.autogender import (AutoGender,
+                                       GenderCache,
+                                       GenderIndex,
+                                       build_gender_index,
+                                       genderize,
+                                       genderize_names)
 
-from tests.base import TestCommandCaseBase
+from tests.base import TestCommandCaseBase, datadir
 
 
 GENDERIZE_API_URL = "https://api.genderize.io/"
@@ -48,6 +63,52 @@ unique identity 3e1eccdb1e52ea56225f419d3e532fe9133c7821 (Jane R) gender profile
 unique identity 539acca35c2e8502951a97d2d5af8b0857440b50 (John Smith) gender profile updated to male (acc: 99)
 unique identity a39ac334be9f17bfc7f9f21bbb25f389388f8e18 (John D) gender profile updated to male (acc: 99)"""
 
+PROFILE_AUTOGENDER_OFFLINE = """unique identity 2a9ec221b8dd5d5a85ae0e3276b8b2c3618ee15e (Jane Roe) \
+gender profile updated to female (acc: 99)
+unique identity 539acca35c2e8502951a97d2d5af8b0857440b50 (John Smith) gender profile updated to male (acc: 99)
+unique identity a39ac334be9f17bfc7f9f21bbb25f389388f8e18 (John D) gender profile updated to male (acc: 99)"""
+
+PROFILE_AUTOGENDER_OFFLINE_ALL = """unique identity 2a9ec221b8dd5d5a85ae0e3276b8b2c3618ee15e (Jane Roe) \
+gender profile updated to female (acc: 99)
+unique identity 3e1eccdb1e52ea56225f419d3e532fe9133c7821 (Jane R) gender profile updated to female (acc: 99)
+unique identity 539acca35c2e8502951a97d2d5af8b0857440b50 (John Smith) gender profile updated to male (acc: 99)
+unique identity a39ac334be9f17bfc7f9f21bbb25f389388f8e18 (John D) gender profile updated to male (acc: 99)"""
+
+JOBS_ERROR = "Error: number of jobs must be greater than 0"
+NAMES_FILE_ERROR = "Error: names file is required by the offline backend"
+INDEX_NAMES_FILE_ERROR = "Error: names file is required to build a gender index"
+BUILD_INDEX_OUTPUT = "gender index %(path)s built with 4 names"
+INVALID_ROW_ERROR = "invalid row in %(path)s, line 2"
+INVALID_GENDER_ERROR = "invalid gender X in %(path)s, line 1"
+INVALID_INDEX_ERROR = "%(path)s is not a gender index"
+
+RETRY_WARNING = r"Warning: Skipping 'error' name \(316b78ff088c2a825defacb802013fa670fccb48\) due to a connection error"
+INVALID_NAME_WARNING = r"Warning: Skipping 'invalid' name \(%s\) due to a connection error"
+
+
+def genderize_result(name):
+    """Return the data genderize.io would return for `name`"""
+
+    if name.lower() == 'john':
+        data = {
+            'gender': 'male',
+            'probability': 0.99
+        }
+    elif name.lower() == 'jane':
+        data = {
+            'gender': 'female',
+            'probability': 1.0
+        }
+    else:
+        data = {
+            'gender': None,
+            'probability': None
+        }
+
+    data['name'] = name
+
+    return data
+
 
 def setup_genderize_server():
     """Setup a mock HTTP server for genderize.io"""
@@ -59,26 +120,17 @@ def setup_genderize_server():
         http_requests.append(last_request)
 
         params = last_request.querystring
-        name = params['name'][0].lower()
+        names = params.get('name[]', params.get('name'))
 
-        if name == 'error':
+        if 'error' in [name.lower() for name in names]:
             return 502, headers, 'Bad Gateway'
+        if 'invalid' in [name.lower() for name in names]:
+            return 422, headers, 'Unprocessable Entity'
 
-        if name == 'john':
-            data = {
-                'gender': 'male',
-                'probability': 0.99
-            }
-        elif name == 'jane':
-            data = {
-                'gender': 'female',
-                'probability': 1.0
-            }
+        if 'name[]' in params:
+            data = [genderize_result(name) for name in names]
         else:
-            data = {
-                'gender': None,
-                'probability': None
-            }
+            data = genderize_result(names[0])
 
         body = json.dumps(data)
 
@@ -93,6 +145,73 @@ def setup_genderize_server():
     return http_requests
 
 
+class GenderizeRequestHandler(http.server.BaseHTTPRequestHandler):
+    """Reply genderize.io requests using `genderize_result`"""
+
+    def do_GET(self):
+        query = urllib.parse.urlparse(self.path).query
+        params = urllib.parse.parse_qs(query)
+        self.server.http_requests.append(params)
+
+        names = params.get('name[]', params.get('name'))
+
+        if 'error' in [name.lower() for name in names]:
+            self.send_error(502, 'Bad Gateway')
+            return
+        if 'invalid' in [name.lower() for name in names]:
+            self.send_error(422, 'Unprocessable Entity')
+            return
+
+        if 'name[]' in params:
+            data = [genderize_result(name) for name in names]
+        else:
+            data = genderize_result(names[0])
+
+        body = json.dumps(data).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class GenderizeServer:
+    """Local HTTP server that mocks genderize.io.
+
+    While the server is running, the command sends its
+    requests to this server. Requests are stored in
+    `http_requests` as dicts of query parameters.
+    """
+    def __init__(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      GenderizeRequestHandler)
+        self.server.daemon_threads = True
+        self.server.http_requests = []
+        self.url = "http://127.0.0.1:%s/" % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.patcher = unittest.mock.patch('sortinghat.cmd.autogender.GENDERIZE_API_URL',
+                                           self.url)
+
+    @property
+    def http_requests(self):
+        return self.server.http_requests
+
+    def __enter__(self):
+        self.thread.start()
+        self.patcher.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.patcher.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
 class TestAutoGenderCaseBase(TestCommandCaseBase):
     """Defines common setup and teardown methods on autogender unit tests"""
 
@@ -120,57 +239,68 @@ class TestAutoGenderCaseBase(TestCommandCaseBase):
 class TestAutoGender(TestAutoGenderCaseBase):
     """Unit tests for autogender command"""
 
-    @httpretty.activate
+    def setUp(self):
+        super().setUp()
+        self.tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+        super().tearDown()
+
     def test_command(self):
         """Test autogender command"""
 
-        setup_genderize_server()
-
-        code = self.cmd.run()
+        with GenderizeServer():
+            code = self.cmd.run()
 
         self.assertEqual(code, CMD_SUCCESS)
         output = sys.stdout.getvalue().strip()
         self.assertEqual(output, PROFILE_AUTOGENDER)
 
-    @httpretty.activate
     def test_command_token(self):
         """Test if autogender is called with token parameter"""
 
-        setup_genderize_server()
-
-        code = self.cmd.run('--api-token', 'abcdefghi')
+        with GenderizeServer() as server:
+            code = self.cmd.run('--api-token', 'abcdefghi')
 
         self.assertEqual(code, CMD_SUCCESS)
         output = sys.stdout.getvalue().strip()
         self.assertEqual(output, PROFILE_AUTOGENDER)
 
         expected = {
-            'name': ['john'],
+            'name[]': ['jane', 'john'],
             'apikey': ['abcdefghi']
         }
 
-        req = httpretty.last_request()
-        self.assertEqual(req.querystring, expected)
+        self.assertEqual(len(server.http_requests), 1)
+        self.assertDictEqual(server.http_requests[0], expected)
 
-    @httpretty.activate
     def test_command_all(self):
         """Test if data about gender is overwritten for all the unique identities"""
 
-        setup_genderize_server()
-
-        code = self.cmd.run('--all')
+        with GenderizeServer():
+            code = self.cmd.run('--all')
 
         self.assertEqual(code, CMD_SUCCESS)
         output = sys.stdout.getvalue().strip()
         self.assertEqual(output, PROFILE_AUTOGENDER_ALL)
 
-    @httpretty.activate
+    def test_command_invalid_jobs(self):
+        """Test if it fails when the number of jobs is not valid"""
+
+        with GenderizeServer() as server:
+            code = self.cmd.run('--jobs', '0')
+
+        self.assertEqual(code, CODE_VALUE_ERROR)
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, JOBS_ERROR)
+        self.assertEqual(len(server.http_requests), 0)
+
     def test_autogender(self):
         """Test autogender method"""
 
-        http_requests = setup_genderize_server()
-
-        self.cmd.autogender(api_token='abcdefghi')
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi')
 
         uids = api.unique_identities(self.db)
 
@@ -195,30 +325,21 @@ class TestAutoGender(TestAutoGenderCaseBase):
         self.assertEqual(prf.gender, 'male')
         self.assertEqual(prf.gender_acc, 99)
 
-        # Check requests
+        # Check requests; names are sent in a single batch
         expected = [
             {
-                'name': ['jane'],
-                'apikey': ['abcdefghi']
-            },
-            {
-                'name': ['john'],
+                'name[]': ['jane', 'john'],
                 'apikey': ['abcdefghi']
-            },
+            }
         ]
 
-        self.assertEqual(len(http_requests), len(expected))
-
-        for i in range(len(expected)):
-            self.assertDictEqual(http_requests[i].querystring, expected[i])
+        self.assertListEqual(server.http_requests, expected)
 
-    @httpretty.activate
     def test_autogender_all(self):
         """Test whether all gener info is overwritten"""
 
-        http_requests = setup_genderize_server()
-
-        self.cmd.autogender(api_token='abcdefghi', genderize_all=True)
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi', genderize_all=True)
 
         uids = api.unique_identities(self.db)
 
@@ -245,32 +366,23 @@ class TestAutoGender(TestAutoGenderCaseBase):
         # Check requests
         expected = [
             {
-                'name': ['jane'],
+                'name[]': ['jane', 'john'],
                 'apikey': ['abcdefghi']
-            },
-            {
-                'name': ['john'],
-                'apikey': ['abcdefghi']
-            },
+            }
         ]
 
-        self.assertEqual(len(http_requests), len(expected))
+        self.assertListEqual(server.http_requests, expected)
 
-        for i in range(len(expected)):
-            self.assertDictEqual(http_requests[i].querystring, expected[i])
-
-    @httpretty.activate
     def test_autogender_name_not_found(self):
         """Test if no gender is set when a name is not found"""
 
-        http_requests = setup_genderize_server()
-
         # This name won't be found
         uuid = api.add_identity(self.db, 'scm', 'random@example.com',
                                 'Random Name')
         api.edit_profile(self.db, uuid, name="Random Name")
 
-        self.cmd.autogender(api_token='abcdefghi')
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi')
 
         uids = api.unique_identities(self.db)
 
@@ -304,30 +416,16 @@ class TestAutoGender(TestAutoGenderCaseBase):
         # Check requests
         expected = [
             {
-                'name': ['jane'],
-                'apikey': ['abcdefghi']
-            },
-            {
-                'name': ['john'],
+                'name[]': ['jane', 'john', 'random'],
                 'apikey': ['abcdefghi']
-            },
-            {
-                'name': ['random'],
-                'apikey': ['abcdefghi']
-            },
+            }
         ]
 
-        self.assertEqual(len(http_requests), len(expected))
+        self.assertListEqual(server.http_requests, expected)
 
-        for i in range(len(expected)):
-            self.assertDictEqual(http_requests[i].querystring, expected[i])
-
-    @httpretty.activate
     def test_autogender_ignore_name_not_well_formed(self):
         """Test if no gender is set when a name is invalid"""
 
-        http_requests = setup_genderize_server()
-
         # These names are invalid so they will be ignored
         uuid = api.add_identity(self.db, 'scm', 'random@example.com',
                                 'Random Name')
@@ -337,7 +435,8 @@ class TestAutoGender(TestAutoGenderCaseBase):
                                 'Another Random Name')
         api.edit_profile(self.db, uuid, name="ARadomName")
 
-        self.cmd.autogender(api_token='abcdefghi')
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi')
 
         uids = api.unique_identities(self.db)
 
@@ -377,47 +476,97 @@ class TestAutoGender(TestAutoGenderCaseBase):
         # Only two valid names were checked
         expected = [
             {
-                'name': ['jane'],
-                'apikey': ['abcdefghi']
-            },
-            {
-                'name': ['john'],
+                'name[]': ['jane', 'john'],
                 'apikey': ['abcdefghi']
-            },
+            }
         ]
 
-        self.assertEqual(len(http_requests), len(expected))
+        self.assertListEqual(server.http_requests, expected)
 
-        for i in range(len(expected)):
-            self.assertDictEqual(http_requests[i].querystring, expected[i])
+    def test_autogender_batches(self):
+        """Test if names are requested in batches running concurrently"""
+
+        names = ['Name%s Surname' % i for i in range(23)]
+
+        for i, name in enumerate(names):
+            email = 'name%s@example.com' % i
+            uuid = api.add_identity(self.db, 'scm', email, name)
+            api.edit_profile(self.db, uuid, name=name)
+
+        with GenderizeServer() as server:
+            self.cmd.autogender(jobs=2)
+
+        # 25 different names in batches of up to 10 names
+        self.assertEqual(len(server.http_requests), 3)
+
+        requested = []
+        for params in server.http_requests:
+            self.assertLessEqual(len(params['name[]']), 10)
+            requested.extend(params['name[]'])
+
+        expected = ['jane', 'john'] + [name.split()[0].lower() for name in names]
+        self.assertListEqual(sorted(requested), sorted(expected))
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER)
+
+    def test_autogender_cache_file(self):
+        """Test if names stored in the cache file are not requested again"""
+
+        cache_file = os.path.join(self.tmp_path, 'genders.jsonl')
+
+        # This name won't be found but it will be cached anyway
+        uuid = api.add_identity(self.db, 'scm', 'random@example.com',
+                                'Random Name')
+        api.edit_profile(self.db, uuid, name="Random Name")
+
+        with GenderizeServer() as server:
+            code = self.cmd.run('--cache-file', cache_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        self.assertEqual(len(server.http_requests), 1)
+
+        with GenderCache(cache_file) as cache:
+            self.assertEqual(len(cache), 3)
+            self.assertDictEqual(cache.get('jane'),
+                                 {'gender': 'female', 'gender_acc': 100})
+            self.assertDictEqual(cache.get('john'),
+                                 {'gender': 'male', 'gender_acc': 99})
+            self.assertDictEqual(cache.get('random'),
+                                 {'gender': None, 'gender_acc': None})
+
+        # Run it again on every unique identity; no request is sent
+        with GenderizeServer() as server:
+            code = self.cmd.run('--all', '--cache-file', cache_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        self.assertEqual(len(server.http_requests), 0)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER + '\n' + PROFILE_AUTOGENDER_ALL)
 
-    @httpretty.activate
     def test_retry(self):
-        """Test if a name is skipped when a connection error is returned"""
+        """Test if the names of a batch are skipped when a connection error is returned"""
 
-        http_requests = setup_genderize_server()
+        cache_file = os.path.join(self.tmp_path, 'genders.jsonl')
 
-        # This profile won't be updated due to connection errors
-        # In this case, a 502 HTTP error
+        # The batch with this name won't be updated due to connection
+        # errors. In this case, a 502 HTTP error
         uuid = api.add_identity(self.db, 'scm', 'error@example.com',
                                 'Error Name')
         api.edit_profile(self.db, uuid, name="Error Name")
 
         # Tests
-        self.cmd.autogender(api_token='abcdefghi')
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi', cache_file=cache_file)
 
         uids = api.unique_identities(self.db)
 
-        prf = uids[0].profile
-        self.assertEqual(prf.uuid, '2a9ec221b8dd5d5a85ae0e3276b8b2c3618ee15e')
-        self.assertEqual(prf.gender, 'female')
-        self.assertEqual(prf.gender_acc, 100)
-
-        # Error Name profile was not updated due to connection errors
-        prf = uids[1].profile
-        self.assertEqual(prf.uuid, '316b78ff088c2a825defacb802013fa670fccb48')
-        self.assertEqual(prf.gender, None)
-        self.assertEqual(prf.gender_acc, None)
+        # None of the profiles of the batch were updated
+        for i in [0, 1, 3, 4]:
+            prf = uids[i].profile
+            self.assertEqual(prf.gender, None)
+            self.assertEqual(prf.gender_acc, None)
 
         # Jane Rae gender is not updated because it was already set
         prf = uids[2].profile
@@ -425,45 +574,353 @@ class TestAutoGender(TestAutoGenderCaseBase):
         self.assertEqual(prf.gender, 'unknown')
         self.assertEqual(prf.gender_acc, 100)
 
-        prf = uids[3].profile
-        self.assertEqual(prf.uuid, '539acca35c2e8502951a97d2d5af8b0857440b50')
-        self.assertEqual(prf.gender, 'male')
-        self.assertEqual(prf.gender_acc, 99)
+        output = sys.stderr.getvalue().strip()
+        self.assertRegex(output, RETRY_WARNING)
 
-        prf = uids[4].profile
-        self.assertEqual(prf.uuid, 'a39ac334be9f17bfc7f9f21bbb25f389388f8e18')
-        self.assertEqual(prf.gender, 'male')
-        self.assertEqual(prf.gender_acc, 99)
+        # The batch is retried but names are not requested one by one
+        expected = {
+            'name[]': ['jane', 'error', 'john'],
+            'apikey': ['abcdefghi']
+        }
+
+        http_requests = server.http_requests
+        self.assertEqual(len(http_requests), 6)
 
+        for http_request in http_requests:
+            self.assertDictEqual(http_request, expected)
+
+        # Names with errors are not cached
+        with GenderCache(cache_file) as cache:
+            self.assertEqual(len(cache), 0)
+
+    def test_invalid_name(self):
+        """Test if names are requested one by one when a name of the batch is invalid"""
+
+        cache_file = os.path.join(self.tmp_path, 'genders.jsonl')
+
+        # This profile won't be updated because genderize.io
+        # returns a 422 HTTP error for this name
+        uuid = api.add_identity(self.db, 'scm', 'invalid@example.com',
+                                'Invalid Name')
+        api.edit_profile(self.db, uuid, name="Invalid Name")
+
+        # Tests
+        with GenderizeServer() as server:
+            self.cmd.autogender(api_token='abcdefghi', cache_file=cache_file)
+
+        prf = api.unique_identities(self.db, uuid)[0].profile
+        self.assertEqual(prf.gender, None)
+        self.assertEqual(prf.gender_acc, None)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertRegex(output, INVALID_NAME_WARNING % uuid)
+
+        # The batch is not retried; after it, names
+        # are requested one by one
         expected = [
             {
-                'name': ['jane'],
+                'name[]': ['jane', 'john', 'invalid'],
                 'apikey': ['abcdefghi']
             },
             {
-                'name': ['error'],
+                'name': ['jane'],
                 'apikey': ['abcdefghi']
             },
             {
                 'name': ['john'],
                 'apikey': ['abcdefghi']
+            },
+            {
+                'name': ['invalid'],
+                'apikey': ['abcdefghi']
             }
         ]
 
-        self.assertEqual(len(http_requests), 8)
+        self.assertListEqual(server.http_requests, expected)
 
-        req = http_requests[0]
-        self.assertEqual(req.method, 'GET')
-        self.assertEqual(req.querystring, expected[0])
+        # Names with errors are not cached
+        with GenderCache(cache_file) as cache:
+            self.assertEqual(len(cache), 2)
+            self.assertNotIn('invalid', cache)
 
-        for i in range(1, 7):
-            req = http_requests[i]
-            self.assertEqual(req.method, 'GET')
-            self.assertEqual(req.querystring, expected[1])
 
-        req = http_requests[7]
-        self.assertEqual(req.method, 'GET')
-        self.assertEqual(req.querystring, expected[2])
+class TestAutoGenderOffline(TestAutoGenderCaseBase):
+    """Unit tests for autogender command using the offline backend"""
+
+    def setUp(self):
+        super().setUp()
+        self.tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.names_file = datadir('gender_names.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+        super().tearDown()
+
+    def test_command(self):
+        """Test autogender command with the offline backend"""
+
+        with GenderizeServer() as server:
+            code = self.cmd.run('--backend', 'offline',
+                                '--names-file', self.names_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER_OFFLINE)
+
+        # genderize.io is never called
+        self.assertEqual(len(server.http_requests), 0)
+
+    def test_command_all(self):
+        """Test if gender is overwritten for all the unique identities"""
+
+        code = self.cmd.run('--backend', 'offline', '--all',
+                            '--names-file', self.names_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER_OFFLINE_ALL)
+
+    def test_gender_index(self):
+        """Test if a prebuilt gender index is used"""
+
+        index_file = os.path.join(self.tmp_path, 'genders.idx')
+        build_gender_index([self.names_file], index_file)
+
+        # Neither unknown nor tied names are updated
+        uuid = api.add_identity(self.db, 'scm', 'alex@example.com',
+                                'Alex Name')
+        api.edit_profile(self.db, uuid, name="Alex Name")
+
+        uuid = api.add_identity(self.db, 'scm', 'random@example.com',
+                                'Random Name')
+        api.edit_profile(self.db, uuid, name="Random Name")
+
+        code = self.cmd.autogender(backend='offline', names_file=index_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOGENDER_OFFLINE)
+
+        prf = api.unique_identities(self.db, uuid=uuid)[0].profile
+        self.assertEqual(prf.gender, None)
+        self.assertEqual(prf.gender_acc, None)
+
+    def test_command_build_index(self):
+        """Test if the command writes the gender index of a dataset"""
+
+        index_file = os.path.join(self.tmp_path, 'genders.idx')
+
+        code = self.cmd.run('--names-file', self.names_file,
+                            '--build-index', index_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, BUILD_INDEX_OUTPUT % {'path': index_file})
+
+        # No profile was updated
+        uids = api.unique_identities(self.db)
+        self.assertEqual(uids[0].profile.gender, None)
+
+        with GenderIndex(index_file) as index:
+            self.assertEqual(len(index), 4)
+            self.assertEqual(index.lookup('jane'), ('female', 99))
+
+        # The index is used by the offline backend
+        code = self.cmd.run('--backend', 'offline',
+                            '--names-file', index_file)
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, (BUILD_INDEX_OUTPUT % {'path': index_file}) + '\n' + PROFILE_AUTOGENDER_OFFLINE)
+
+    def test_build_index_names_file_not_given(self):
+        """Test if it fails building an index when the names file is not given"""
+
+        index_file = os.path.join(self.tmp_path, 'genders.idx')
+
+        code = self.cmd.run('--build-index', index_file)
+
+        self.assertEqual(code, CODE_VALUE_ERROR)
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, INDEX_NAMES_FILE_ERROR)
+        self.assertFalse(os.path.exists(index_file))
+
+    def test_names_file_not_given(self):
+        """Test if it fails when the names file is not given"""
+
+        code = self.cmd.run('--backend', 'offline')
+
+        self.assertEqual(code, CODE_VALUE_ERROR)
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, NAMES_FILE_ERROR)
+
+    def test_invalid_names_file(self):
+        """Test if it fails when the names file is not valid"""
+
+        names_file = os.path.join(self.tmp_path, 'names.csv')
+
+        with open(names_file, 'w') as fd:
+            fd.write("John,M,100\nJane,F\n")
+
+        code = self.cmd.run('--backend', 'offline', '--names-file', names_file)
+
+        self.assertEqual(code, CODE_INVALID_FORMAT_ERROR)
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, "Error: " + INVALID_ROW_ERROR % {'path': names_file})
+
+
+class TestGenderIndex(unittest.TestCase):
+    """Unit tests for GenderIndex and build_gender_index"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.index_file = os.path.join(self.tmp_path, 'genders.idx')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_lookup(self):
+        """Test if the gender of the names is found"""
+
+        nnames = build_gender_index([datadir('gender_names.csv')], self.index_file)
+        self.assertEqual(nnames, 4)
+
+        with GenderIndex(self.index_file) as index:
+            self.assertEqual(len(index), 4)
+
+            # Counts of the same name are added
+            self.assertEqual(index.lookup('john'), ('male', 99))
+            self.assertEqual(index.lookup('Jane'), ('female', 99))
+            self.assertEqual(index.lookup('ÁNGELA'), ('female', 100))
+
+            # Tied, unknown and too long names
+            self.assertEqual(index.lookup('alex'), (None, None))
+            self.assertEqual(index.lookup('jack'), (None, None))
+            self.assertEqual(index.lookup('a'), (None, None))
+            self.assertEqual(index.lookup('z' * 40), (None, None))
+
+    def test_several_datasets(self):
+        """Test if counts of several datasets are added"""
+
+        dataset = os.path.join(self.tmp_path, 'names.csv')
+
+        with open(dataset, 'w') as fd:
+            fd.write("Alex,male,10\n\nJack,M,1\n" + "x" * 40 + ",F,1\n")
+
+        nnames = build_gender_index([datadir('gender_names.csv'), dataset],
+                                    self.index_file)
+        self.assertEqual(nnames, 5)
+
+        with GenderIndex(self.index_file) as index:
+            self.assertEqual(index.lookup('alex'), ('male', 50))
+            self.assertEqual(index.lookup('jack'), ('male', 100))
+
+    def test_empty_index(self):
+        """Test if an index without names can be looked up"""
+
+        dataset = os.path.join(self.tmp_path, 'names.csv')
+        open(dataset, 'w').close()
+
+        nnames = build_gender_index([dataset], self.index_file)
+        self.assertEqual(nnames, 0)
+
+        with GenderIndex(self.index_file) as index:
+            self.assertEqual(len(index), 0)
+            self.assertEqual(index.lookup('john'), (None, None))
+
+    def test_invalid_gender(self):
+        """Test if it fails when a gender is not valid"""
+
+        dataset = os.path.join(self.tmp_path, 'names.csv')
+
+        with open(dataset, 'w') as fd:
+            fd.write("John,X,100\n")
+
+        expected = INVALID_GENDER_ERROR % {'path': dataset}
+
+        with self.assertRaisesRegex(InvalidFormatError, expected):
+            build_gender_index([dataset], self.index_file)
+
+    def test_invalid_index(self):
+        """Test if it fails when the file is not an index"""
+
+        expected = INVALID_INDEX_ERROR % {'path': datadir('gender_names.csv')}
+
+        with self.assertRaisesRegex(InvalidFormatError, expected):
+            GenderIndex(datadir('gender_names.csv'))
+
+        # Empty files are not valid either
+        open(self.index_file, 'w').close()
+        expected = INVALID_INDEX_ERROR % {'path': self.index_file}
+
+        with self.assertRaisesRegex(InvalidFormatError, expected):
+            GenderIndex(self.index_file)
+
+
+class TestGenderCache(unittest.TestCase):
+    """Unit tests for GenderCache"""
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.cache_file = os.path.join(self.tmp_path, 'genders.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def test_memory_cache(self):
+        """Test if entries are kept in memory when no file is given"""
+
+        with GenderCache() as cache:
+            self.assertEqual(len(cache), 0)
+            self.assertIsNone(cache.get('john'))
+
+            cache.add('john', {'gender': 'male', 'gender_acc': 99})
+
+            self.assertIn('john', cache)
+            self.assertNotIn('jane', cache)
+            self.assertDictEqual(cache.get('john'),
+                                 {'gender': 'male', 'gender_acc': 99})
+
+    def test_persistent_cache(self):
+        """Test if entries are stored and read from the cache file"""
+
+        with GenderCache(self.cache_file) as cache:
+            cache.add('john', {'gender': 'male', 'gender_acc': 99})
+            cache.add('jack', {'gender': None, 'gender_acc': None})
+
+        with GenderCache(self.cache_file) as cache:
+            self.assertEqual(len(cache), 2)
+            self.assertDictEqual(cache.get('john'),
+                                 {'gender': 'male', 'gender_acc': 99})
+            self.assertDictEqual(cache.get('jack'),
+                                 {'gender': None, 'gender_acc': None})
+
+            cache.add('jane', {'gender': 'female', 'gender_acc': 100})
+
+        with GenderCache(self.cache_file) as cache:
+            self.assertEqual(len(cache), 3)
+            self.assertDictEqual(cache.get('jane'),
+                                 {'gender': 'female', 'gender_acc': 100})
+
+    def test_incomplete_entries(self):
+        """Test if incomplete lines of the cache file are ignored"""
+
+        with open(self.cache_file, 'w') as fd:
+            fd.write('{"gender": "male", "gender_acc": 99, "name": "john"}\n')
+            fd.write('{"gender": "female", "gender_ac')
+
+        with GenderCache(self.cache_file) as cache:
+            self.assertEqual(len(cache), 1)
+            self.assertIn('john', cache)
+
+            cache.add('jane', {'gender': 'female', 'gender_acc': 100})
+
+        with GenderCache(self.cache_file) as cache:
+            self.assertEqual(len(cache), 2)
+            self.assertIn('jane', cache)
 
 
 class TestGenderize(unittest.TestCase):
@@ -525,6 +982,81 @@ class TestGenderize(unittest.TestCase):
             self.assertEqual(req.method, 'GET')
             self.assertEqual(req.querystring, expected)
 
+    @httpretty.activate
+    def test_genderize_names(self):
+        """Test if the gender of several names is obtained with one request"""
+
+        http_requests = setup_genderize_server()
+
+        result = genderize_names(['John', 'Jack', 'Jane'])
+        expected = [('male', 99), (None, None), ('female', 100)]
+        self.assertListEqual(result, expected)
+
+        expected = {
+            'name[]': ['John', 'Jack', 'Jane']
+        }
+
+        self.assertEqual(len(http_requests), 1)
+
+        req = http_requests[0]
+        self.assertEqual(req.method, 'GET')
+        self.assertEqual(req.querystring, expected)
+
+    @httpretty.activate
+    def test_genderize_names_retry(self):
+        """Test if the request is retried when an error is returned"""
+
+        http_requests = setup_genderize_server()
+
+        with self.assertRaises(requests.exceptions.RetryError):
+            genderize_names(['John', 'error'], api_token='abcdefghi')
+
+        expected = {
+            'name[]': ['John', 'error'],
+            'apikey': ['abcdefghi']
+        }
+
+        self.assertEqual(len(http_requests), 6)
+
+        for req in http_requests:
+            self.assertEqual(req.querystring, expected)
+
+    @httpretty.activate
+    def test_genderize_names_unordered(self):
+        """Test if the results are matched to the names by their name"""
+
+        body = json.dumps([genderize_result('Jane'),
+                           genderize_result('Jack'),
+                           genderize_result('John')])
+        httpretty.register_uri(httpretty.GET,
+                               GENDERIZE_API_URL,
+                               body=body)
+
+        result = genderize_names(['John', 'Jack', 'Jane'])
+        expected = [('male', 99), (None, None), ('female', 100)]
+        self.assertListEqual(result, expected)
+
+    @httpretty.activate
+    def test_genderize_names_missing_results(self):
+        """Test if an error is raised when the result of a name is not returned"""
+
+        body = json.dumps([genderize_result('John')])
+        httpretty.register_uri(httpretty.GET,
+                               GENDERIZE_API_URL,
+                               body=body)
+
+        with self.assertRaisesRegex(ValueError, "1 results returned for 2 names"):
+            genderize_names(['John', 'Jane'])
+
+        body = json.dumps([genderize_result('John'),
+                           genderize_result('Jack')])
+        httpretty.register_uri(httpretty.GET,
+                               GENDERIZE_API_URL,
+                               body=body)
+
+        with self.assertRaisesRegex(ValueError, "result for name Jane not returned"):
+            genderize_names(['John', 'Jane'])
+
     @httpretty.activate
     def test_api_token(self):
         """Test if the api token is set in the request"""
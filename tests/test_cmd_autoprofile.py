@@ -20,8 +20,10 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import datetime
 import sys
 import unittest
+import unittest.mock
 
 if '..' not in sys.path:
     sys.path.insert(0, '..')
@@ -29,7 +31,7 @@ if '..' not in sys.path:
 from sortinghat import api
 from sortinghat.command import CMD_SUCCESS
 from sortinghat.cmd.autoprofile import AutoProfile
-from sortinghat.db.model import Country
+from sortinghat.db.model import Country, Profile
 
 from tests.base import TestCommandCaseBase
 
@@ -37,6 +39,9 @@ from tests.base import TestCommandCaseBase
 PROFILE_AUTOCOMPLETE = """unique identity eb10fb9519d69d75a6cdcd76707943a513685c09 profile updated using its source
 unique identity ffefc2e3f2a255e9450ac9e2d36f37c28f51bd73 profile updated using mls source"""
 
+PROFILE_AUTOCOMPLETE_CASE = """unique identity eb10fb9519d69d75a6cdcd76707943a513685c09 profile updated using its source
+unique identity ffefc2e3f2a255e9450ac9e2d36f37c28f51bd73 profile updated using its source"""
+
 
 class TestAutoProfileCaseBase(TestCommandCaseBase):
     """Defines common setup and teardown methods on autoprofile unit tests"""
@@ -124,6 +129,22 @@ class TestAutoProfileCommand(TestAutoProfileCaseBase):
         self.assertEqual(uids[2].profile.name, 'John Smith')
         self.assertEqual(uids[2].profile.email, 'jsmith@example.com')
 
+    def test_sources_case(self):
+        """Check whether sources must match exactly, including their case"""
+
+        code = self.cmd.autocomplete(['MLS', 'its'])
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOCOMPLETE_CASE)
+
+        uids = api.unique_identities(self.db)
+
+        # Identities from 'mls' source are not used
+        self.assertEqual(uids[2].uuid, 'ffefc2e3f2a255e9450ac9e2d36f37c28f51bd73')
+        self.assertEqual(uids[2].profile.name, 'jsmith')
+        self.assertEqual(uids[2].profile.email, 'jsmith@example.net')
+
     def test_no_email_on_name_field(self):
         """Check whether an email address is not set as the name in the profile"""
 
@@ -168,6 +189,47 @@ class TestAutoProfileCommand(TestAutoProfileCaseBase):
         self.assertEqual(uid.profile.name, None)
         self.assertEqual(uid.profile.email, 'jrae@example.net')
 
+    def test_missing_profiles(self):
+        """Check whether profiles are created when they do not exist"""
+
+        jsmith_uuid = 'ffefc2e3f2a255e9450ac9e2d36f37c28f51bd73'
+
+        with self.db.connect() as session:
+            session.query(Profile).filter(Profile.uuid == jsmith_uuid).delete()
+
+        code = self.cmd.autocomplete(['mls', 'its'])
+        self.assertEqual(code, CMD_SUCCESS)
+
+        uids = api.unique_identities(self.db, uuid=jsmith_uuid)
+        uid = uids[0]
+
+        self.assertEqual(uid.profile.name, 'John Smith')
+        self.assertEqual(uid.profile.email, 'jsmith@example.com')
+        self.assertEqual(uid.profile.is_bot, False)
+
+    def test_batches(self):
+        """Check whether profiles are updated in batches"""
+
+        before = datetime.datetime.utcnow()
+
+        with unittest.mock.patch('sortinghat.cmd.autoprofile.AUTOPROFILE_BATCH_SIZE', 1):
+            code = self.cmd.autocomplete(['mls', 'its'])
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, PROFILE_AUTOCOMPLETE)
+
+        uids = api.unique_identities(self.db)
+
+        self.assertEqual(uids[1].profile.name, 'jdoe')
+        self.assertEqual(uids[2].profile.name, 'John Smith')
+        self.assertEqual(uids[2].profile.email, 'jsmith@example.com')
+
+        # Only updated unique identities are modified
+        self.assertLess(uids[0].last_modified, before)
+        self.assertGreaterEqual(uids[1].last_modified, before)
+        self.assertGreaterEqual(uids[2].last_modified, before)
+
 
 if __name__ == "__main__":
     unittest.main(buffer=True, exit=False)
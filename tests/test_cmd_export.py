@@ -21,8 +21,12 @@
 #
 
 import datetime
+import glob
+import gzip
+import io
 import json
 import os
+import shutil
 import sys
 import tempfile
 import unittest
@@ -32,12 +36,22 @@ if '..' not in sys.path:
 
 from sortinghat import api
 from sortinghat.command import CMD_SUCCESS
+from sortinghat.exceptions import CODE_VALUE_ERROR, CODE_INVALID_DATE_ERROR
 from sortinghat.cmd.export import Export,\
-    SortingHatIdentitiesExporter, SortingHatOrganizationsExporter
+    SortingHatIdentitiesExporter, SortingHatOrganizationsExporter, \
+    _merge_by_uuid
 from sortinghat.db.model import Country
+from sortinghat.writer import msgpack
 
 from tests.base import TestCommandCaseBase, datadir
 
+JOBS_ERROR = "Error: number of jobs must be greater than 0"
+JOBS_OUTFILE_ERROR = "Error: '--jobs' requires an output file"
+JOBS_MAX_ERROR = "Error: number of jobs must be lower or equal than 8"
+ORGS_FORMAT_ERROR = "Error: organizations can only be exported to a single JSON file"
+ORGS_SINCE_ERROR = "Error: '--since' can only be used exporting identities"
+SINCE_INVALID_DATE_ERROR = "Error: 2001-13-01 is not a valid date"
+
 
 class TestExportCaseBase(TestCommandCaseBase):
     """Defines common setup and teardown methods on export unit tests"""
@@ -171,6 +185,134 @@ class TestExportCommand(TestExportCaseBase):
 
         self.assertEqual(a, b)
 
+    def test_export_identities_formats(self):
+        """Test to export identities as records"""
+
+        expected = self.read_json(datadir('sortinghat_identities_valid.json'))
+        expected.pop('time')
+
+        readers = {
+            'jsonl': lambda f: [json.loads(line) for line in open(f, 'r')],
+            'jsonl.gz': lambda f: [json.loads(line) for line in gzip.open(f, 'rt')]
+        }
+
+        if msgpack:
+            readers['msgpack'] = lambda f: list(msgpack.Unpacker(open(f, 'rb'), raw=False))
+
+        for fmt, reader in readers.items():
+            code = self.cmd.run('--identities', '--format', fmt, self.tmpfile)
+            self.assertEqual(code, CMD_SUCCESS)
+
+            records = reader(self.tmpfile)
+            self.assertEqual(len(records), 4)
+
+            header = records[0]
+            self.assertIn('time', header)
+            self.assertEqual(header['blacklist'], expected['blacklist'])
+
+            uidentities = {r['uuid']: r for r in records[1:]}
+            self.assertDictEqual(uidentities, expected['uidentities'])
+
+    def test_export_identities_jobs(self):
+        """Test to export identities to several part files"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        outfile = os.path.join(tmp_path, 'backup.jsonl')
+
+        code = self.cmd.run('--identities', '--format', 'jsonl',
+                            '--jobs', '2', outfile)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        parts = sorted(glob.glob(os.path.join(tmp_path, '*')))
+        self.assertListEqual(parts, [os.path.join(tmp_path, 'backup.part-0000.jsonl'),
+                                     os.path.join(tmp_path, 'backup.part-0001.jsonl')])
+
+        expected = self.read_json(datadir('sortinghat_identities_valid.json'))
+
+        uidentities = {}
+
+        for i, part in enumerate(parts):
+            with open(part, 'r') as fd:
+                records = [json.loads(line) for line in fd]
+
+            # The blacklist is only written on the first part
+            if i == 0:
+                self.assertEqual(records[0]['blacklist'], expected['blacklist'])
+            else:
+                self.assertEqual(records[0]['blacklist'], [])
+
+            # Each part has, at least, one unique identity
+            self.assertGreater(len(records), 1)
+
+            for record in records[1:]:
+                self.assertNotIn(record['uuid'], uidentities)
+                uidentities[record['uuid']] = record
+
+        self.assertDictEqual(uidentities, expected['uidentities'])
+
+    def test_export_identities_since(self):
+        """Test to export the changes made since a given date"""
+
+        since = datetime.datetime.utcnow()
+
+        api.edit_profile(self.db, 'a9b403e150dd4af8953a52a4bb841051e4b705d9',
+                         gender='male', gender_acc=100)
+        api.delete_unique_identity(self.db, '0000000000000000000000000000000000000000')
+
+        code = self.cmd.run('--identities', '--since', str(since), self.tmpfile)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        obj = self.read_json(self.tmpfile)
+
+        self.assertEqual(obj['since'], since.isoformat())
+        self.assertGreaterEqual(obj['until'], obj['since'])
+        self.assertListEqual(list(obj['uidentities'].keys()),
+                             ['a9b403e150dd4af8953a52a4bb841051e4b705d9'])
+
+        deleted = obj['deleted']
+        self.assertEqual(len(deleted), 1)
+        self.assertEqual(deleted[0]['uuid'], '0000000000000000000000000000000000000000')
+        self.assertEqual(deleted[0]['merged_into'], None)
+
+    def test_invalid_since(self):
+        """Check if it fails when '--since' is not valid"""
+
+        code = self.cmd.run('--identities', '--since', '2001-13-01', self.tmpfile)
+        self.assertEqual(code, CODE_INVALID_DATE_ERROR)
+
+        code = self.cmd.run('--orgs', '--since', '2001-01-01', self.tmpfile)
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip().split('\n')
+        self.assertListEqual(output, [SINCE_INVALID_DATE_ERROR, ORGS_SINCE_ERROR])
+
+    def test_invalid_jobs(self):
+        """Check if it fails when the number of jobs is not valid"""
+
+        code = self.cmd.run('--identities', '--jobs', '0', self.tmpfile)
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        code = self.cmd.run('--identities', '--jobs', '2')
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        # Each job needs four connections from the pool
+        code = self.cmd.run('--identities', '--jobs', '9', self.tmpfile)
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip().split('\n')
+        self.assertListEqual(output, [JOBS_ERROR, JOBS_OUTFILE_ERROR, JOBS_MAX_ERROR])
+
+    def test_invalid_organizations_format(self):
+        """Check if it fails when organizations are not exported to JSON"""
+
+        code = self.cmd.run('--orgs', '--format', 'jsonl', self.tmpfile)
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, ORGS_FORMAT_ERROR)
+
 
 class TestExportIdentities(TestExportCaseBase):
     """Test export_identities method with some inputs"""
@@ -208,6 +350,23 @@ class TestExportIdentities(TestExportCaseBase):
 
         self.assertEqual(a, b)
 
+    def test_export_identities_parts_max_jobs(self):
+        """Check if it fails when the jobs need more connections than the pool has"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        outfile = os.path.join(tmp_path, 'backup.jsonl')
+
+        code = self.cmd.export_identities_parts(outfile, fmt='jsonl', jobs=9)
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, JOBS_MAX_ERROR)
+
+        # No part file was written
+        self.assertListEqual(os.listdir(tmp_path), [])
+
     def test_export_identities_empty_registry(self):
         """Check the output when registry is empty"""
 
@@ -404,6 +563,110 @@ class TestSortingHatIdentitiesExporter(TestExportCaseBase):
         bl1 = blacklist[1]
         self.assertEqual(bl1, 'jroe@example.com')
 
+    def test_outfile(self):
+        """Check if the document is written to the given file"""
+
+        exporter = SortingHatIdentitiesExporter(self.db)
+
+        # Documents generated before streaming the identities
+        expected_files = {
+            None: 'sortinghat_identities_valid.json',
+            'unknown': 'sortinghat_identities_source.json'
+        }
+
+        for source, filename in expected_files.items():
+            outfile = io.StringIO()
+            result = exporter.export(source=source, outfile=outfile)
+            self.assertEqual(result, None)
+
+            obj = json.loads(outfile.getvalue())
+            expected = self.read_json(datadir(filename))
+
+            # Documents are identical but their creation time
+            self.assertNotEqual(obj.pop('time'), None)
+            expected.pop('time')
+            self.assertDictEqual(obj, expected)
+
+            # Keys and identities are sorted like 'json.dumps'
+            # with sorted keys did
+            uidentities = list(obj['uidentities'].keys())
+            self.assertListEqual(uidentities, sorted(uidentities))
+
+            for uid in obj['uidentities'].values():
+                ids = [identity['id'] for identity in uid['identities']]
+                self.assertListEqual(ids, sorted(ids))
+
+    def test_since(self):
+        """Check if only the changes made since a date are exported"""
+
+        jsmith_uuid = 'a9b403e150dd4af8953a52a4bb841051e4b705d9'
+        jroe_uuid = '17ab00ed3825ec2f50483e33c88df223264182ba'
+        empty_uuid = '0000000000000000000000000000000000000000'
+
+        exporter = SortingHatIdentitiesExporter(self.db)
+
+        before_dt = datetime.datetime.utcnow()
+
+        # Nothing changed yet
+        obj = json.loads(exporter.export(since=before_dt))
+        self.assertEqual(obj['since'], before_dt.isoformat())
+        self.assertDictEqual(obj['uidentities'], {})
+        self.assertListEqual(obj['deleted'], [])
+        self.assertEqual(len(obj['blacklist']), 2)
+
+        # Merge the empty unique identity into Jane Roe and
+        # add a new identity to John Smith
+        api.merge_unique_identities(self.db, empty_uuid, jroe_uuid)
+        api.add_identity(self.db, 'mls', 'jsmith@example.com', uuid=jsmith_uuid)
+
+        obj = json.loads(exporter.export(since=before_dt))
+        self.assertListEqual(sorted(obj['uidentities'].keys()), [jroe_uuid, jsmith_uuid])
+        self.assertEqual(len(obj['uidentities'][jsmith_uuid]['identities']), 3)
+
+        deleted = obj['deleted']
+        self.assertEqual(len(deleted), 1)
+        self.assertEqual(deleted[0]['uuid'], empty_uuid)
+        self.assertEqual(deleted[0]['merged_into'], jroe_uuid)
+
+        # Only the identities of the unique identities
+        # modified on the given source are exported
+        obj = json.loads(exporter.export(source='mls', since=before_dt))
+        self.assertListEqual(list(obj['uidentities'].keys()), [jsmith_uuid])
+
+        # Changes made after 'until' are not exported
+        obj = json.loads(exporter.export(since=datetime.datetime.utcnow()))
+        self.assertDictEqual(obj['uidentities'], {})
+        self.assertListEqual(obj['deleted'], [])
+
+        # Full exports do not include deletions
+        obj = json.loads(exporter.export())
+        self.assertNotIn('deleted', obj)
+        self.assertNotIn('since', obj)
+
+    def test_uuid_ranges(self):
+        """Check if unique identities are split in ranges of UUIDs"""
+
+        exporter = SortingHatIdentitiesExporter(self.db)
+
+        ranges = exporter.uuid_ranges(1)
+        self.assertListEqual(ranges, [(None, None)])
+
+        ranges = exporter.uuid_ranges(3)
+        expected = [(None, '17ab00ed3825ec2f50483e33c88df223264182ba'),
+                    ('17ab00ed3825ec2f50483e33c88df223264182ba',
+                     'a9b403e150dd4af8953a52a4bb841051e4b705d9'),
+                    ('a9b403e150dd4af8953a52a4bb841051e4b705d9', None)]
+        self.assertListEqual(ranges, expected)
+
+        # There are less unique identities than ranges
+        ranges = exporter.uuid_ranges(10, source='unknown')
+        self.assertListEqual(ranges, [(None, None)])
+
+        for uuid_range in expected:
+            dump = exporter.export(uuid_range=uuid_range)
+            obj = json.loads(dump)
+            self.assertEqual(len(obj['uidentities']), 1)
+
     def test_empty_registry(self):
         """Check output when the registry is empty"""
 
@@ -420,6 +683,57 @@ class TestSortingHatIdentitiesExporter(TestExportCaseBase):
         self.assertEqual(len(obj['blacklist']), 0)
 
 
+class TestMergeByUUID(unittest.TestCase):
+    """Unit tests for _merge_by_uuid"""
+
+    def test_merge(self):
+        """Check if the items of each stream are grouped by UUID"""
+
+        uuids = ['a', 'b', 'c']
+        profiles = [('a', 'pa'), ('c', 'pc')]
+        identities = [('a', 'ia1'), ('a', 'ia2'), ('b', 'ib'), ('c', 'ic')]
+
+        result = list(_merge_by_uuid(uuids, profiles, identities))
+        self.assertListEqual(result, [('a', [['pa'], ['ia1', 'ia2']]),
+                                      ('b', [[], ['ib']]),
+                                      ('c', [['pc'], ['ic']])])
+
+    def test_unmatched_items(self):
+        """Check if items without a unique identity do not stop the merge"""
+
+        uuids = ['a', 'c', 'e']
+        identities = [('a', 'ia'), ('b', 'ib'), ('c', 'ic'),
+                      ('d', 'id'), ('e', 'ie'), ('f', 'if')]
+
+        with self.assertLogs('sortinghat.cmd.export', level='WARNING') as logs:
+            result = list(_merge_by_uuid(uuids, identities))
+
+        self.assertListEqual(result, [('a', [['ia']]),
+                                      ('c', [['ic']]),
+                                      ('e', [['ie']])])
+        self.assertEqual(len(logs.output), 3)
+
+    def test_collation(self):
+        """Check if UUIDs are compared ignoring case and trailing spaces"""
+
+        uuids = ['a', 'b ', 'C']
+        identities = [('A', 'ia'), ('b', 'ib'), ('c ', 'ic')]
+
+        result = list(_merge_by_uuid(uuids, identities))
+        self.assertListEqual(result, [('a', [['ia']]),
+                                      ('b ', [['ib']]),
+                                      ('C', [['ic']])])
+
+    def test_unsorted_streams(self):
+        """Check if it fails when the streams are not sorted"""
+
+        with self.assertRaises(ValueError):
+            list(_merge_by_uuid(['b', 'a'], [('a', 'ia')]))
+
+        with self.assertRaises(ValueError):
+            list(_merge_by_uuid(['a', 'b'], [('b', 'ib'), ('a', 'ia')]))
+
+
 class TestExportOrganizations(TestExportCaseBase):
     """Test export_organizations method with some inputs"""
 
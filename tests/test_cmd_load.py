@@ -21,8 +21,15 @@
 #
 
 import datetime
+import gzip
+import json
+import lzma
+import os
+import shutil
 import sys
+import tempfile
 import unittest
+import unittest.mock
 import warnings
 
 if '..' not in sys.path:
@@ -32,8 +39,9 @@ from sortinghat import api
 from sortinghat.command import CMD_SUCCESS
 from sortinghat.cmd.load import Load
 from sortinghat.db.model import Country
-from sortinghat.parsing.sh import SortingHatParser
-from sortinghat.exceptions import CODE_MATCHER_NOT_SUPPORTED_ERROR, CODE_INVALID_FORMAT_ERROR
+from sortinghat.parsing.sh import SortingHatParser, msgpack
+from sortinghat.exceptions import CODE_MATCHER_NOT_SUPPORTED_ERROR, CODE_INVALID_FORMAT_ERROR, \
+    CODE_VALUE_ERROR, CODE_LOAD_ERROR
 
 from tests.base import TestCommandCaseBase, datadir
 
@@ -174,6 +182,14 @@ Domain example.net added to organization Bitergia
 Domain example.com added to organization Example
 Domain example.net added to organization Example"""
 
+LOAD_ORGS_OUTPUT_SECOND_FILE_WARNING = """Warning: Domain 'example.net' already exists in the registry. Not updated.
+Warning: Domain 'api.bitergia.com' already exists in the registry. Not updated.
+Warning: Domain 'bitergia.com' already exists in the registry. Not updated.
+Warning: Domain 'bitergia.net' already exists in the registry. Not updated.
+Warning: Domain 'test.bitergia.com' already exists in the registry. Not updated.
+Warning: Domain 'example.com' already exists in the registry. Not updated.
+Warning: Domain 'example.net' already exists in the registry. Not updated."""
+
 LOAD_ORGS_OUTPUT_WARNING = """Warning: Domain 'example.net' already exists in the registry. Not updated."""
 
 
@@ -238,6 +254,341 @@ class TestLoadCommand(TestLoadCaseBase):
         output = sys.stderr.getvalue().strip()
         self.assertEqual(output, LOAD_IDENTITIES_OUTPUT_ERROR)
 
+    def test_load_compressed_files(self):
+        """Test to load several compressed files using a glob pattern"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        inputs = [('sortinghat_orgs_valid.json', '01.json.gz', gzip.open),
+                  ('sortinghat_valid.json', '02.json.xz', lzma.open)]
+
+        for filename, target, opener in inputs:
+            with open(datadir(filename), 'rb') as fd:
+                content = fd.read()
+            with opener(os.path.join(tmp_path, target), 'wb') as fd:
+                fd.write(content)
+
+        code = self.cmd.run(os.path.join(tmp_path, '*.json.*'))
+        self.assertEqual(code, CMD_SUCCESS)
+
+        uids = api.unique_identities(self.db)
+        self.assertEqual(len(uids), 2)
+
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs), 3)
+
+    def test_load_records(self):
+        """Test to load records in JSON lines and MessagePack formats"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        with open(datadir('sortinghat_valid.json'), 'r') as fd:
+            header = json.load(fd)
+        records = [header] + list(header.pop('uidentities').values())
+
+        jsonl_gz = os.path.join(tmp_path, 'identities.jsonl.gz')
+        with gzip.open(jsonl_gz, 'wt') as fd:
+            fd.writelines(json.dumps(r) + '\n' for r in records)
+
+        code = self.cmd.run(jsonl_gz, '--verbose')
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, LOAD_OUTPUT)
+
+        # The format can be set when the extension is unknown
+        self.db.clear()
+        self.load_test_dataset()
+
+        jsonl = os.path.join(tmp_path, 'identities.txt')
+        with open(jsonl, 'w') as fd:
+            fd.writelines(json.dumps(r) + '\n' for r in records)
+
+        code = self.cmd.run('--format', 'jsonl', jsonl)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        uids = api.unique_identities(self.db)
+        self.assertEqual(len(uids), 2)
+
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs), 3)
+
+        if not msgpack:
+            return
+
+        self.db.clear()
+        self.load_test_dataset()
+
+        msgpack_file = os.path.join(tmp_path, 'identities.msgpack')
+        with open(msgpack_file, 'wb') as fd:
+            for record in records:
+                fd.write(msgpack.packb(record))
+
+        code = self.cmd.run(msgpack_file)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        uids = api.unique_identities(self.db)
+        self.assertEqual(len(uids), 2)
+
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs), 3)
+
+    def test_load_several_files(self):
+        """Test to load several files"""
+
+        code = self.cmd.run('--orgs', datadir('sortinghat_orgs_valid.json'),
+                            datadir('sortinghat_valid.json'))
+        self.assertEqual(code, CMD_SUCCESS)
+
+        orgs = api.registry(self.db)
+        self.assertEqual(len(orgs), 3)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, LOAD_SH_ORGS_OUTPUT)
+
+        # Domains from the second file were already loaded
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, LOAD_ORGS_OUTPUT_SECOND_FILE_WARNING)
+
+    def test_load_several_identities_files(self):
+        """Test if the identities of several files are loaded on a single import"""
+
+        load_stored_ids = Load._Load__load_stored_ids
+
+        with unittest.mock.patch.object(Load, '_Load__load_stored_ids',
+                                        autospec=True,
+                                        side_effect=load_stored_ids) as mock_load:
+            code = self.cmd.run('--identities',
+                                datadir('sortinghat_valid.json'),
+                                datadir('sortinghat_identities_valid.json'))
+            self.assertEqual(code, CMD_SUCCESS)
+
+        # Stored identities are read only once
+        self.assertEqual(mock_load.call_count, 1)
+
+        # The filter grew to make room for the identities of the second file
+        self.assertEqual(len(self.cmd.stored_ids), 2)
+
+        result = [(uid.uuid, sorted(identity.id for identity in uid.identities))
+                  for uid in api.unique_identities(self.db)]
+
+        # The result is the same of loading the files one by one
+        self.db.clear()
+
+        for filename in ('sortinghat_valid.json', 'sortinghat_identities_valid.json'):
+            code = self.cmd.run('--identities', datadir(filename))
+            self.assertEqual(code, CMD_SUCCESS)
+
+        expected = [(uid.uuid, sorted(identity.id for identity in uid.identities))
+                    for uid in api.unique_identities(self.db)]
+        self.assertListEqual(result, expected)
+
+    def test_load_journal(self):
+        """Test if the progress of the load is recorded on the journal"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        journal_path = os.path.join(tmp_path, 'load.journal')
+        filename = datadir('sortinghat_valid.json')
+
+        code = self.cmd.run('--journal', journal_path, filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        with open(journal_path, 'r') as fd:
+            entries = [json.loads(line) for line in fd]
+
+        # The unique identities created are recorded first
+        new_uids = [entry['new_uid'] for entry in entries[:-1]]
+        self.assertListEqual(sorted(new_uids),
+                             ['17ab00ed3825ec2f50483e33c88df223264182ba',
+                              'a9b403e150dd4af8953a52a4bb841051e4b705d9'])
+
+        entries = entries[-1:]
+        self.assertDictEqual(entries[0],
+                             {'file': os.path.abspath(filename),
+                              'position': 3,
+                              'uuid': '52e0aa0a14826627e633fd15332988686b730ab3',
+                              'completed': True})
+
+        # Running it again without '--resume' starts a new journal
+        code = self.cmd.run('--journal', journal_path, filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        with open(journal_path, 'r') as fd:
+            self.assertEqual(len(fd.readlines()), 1)
+
+    def test_load_resume(self):
+        """Test if an interrupted load is resumed using the journal"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        journal_path = os.path.join(tmp_path, 'load.journal')
+        filename = datadir('sortinghat_valid.json')
+
+        # The last line was not completely written
+        with open(journal_path, 'w') as fd:
+            entry = {
+                'file': os.path.abspath(filename),
+                'position': 2,
+                'uuid': '03e12d00e37fd45593c49a5a5a1652deca4cf302',
+                'completed': False
+            }
+            fd.write(json.dumps(entry) + '\n')
+            fd.write('{"file": "')
+
+        code = self.cmd.run('--identities', '--journal', journal_path, '--resume', filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        # Only the last unique identity was loaded
+        uids = api.unique_identities(self.db)
+        self.assertEqual(len(uids), 1)
+        self.assertEqual(uids[0].uuid, '17ab00ed3825ec2f50483e33c88df223264182ba')
+
+        output = sys.stdout.getvalue().strip().split('\n')
+        self.assertEqual(output[1], "Resuming load after unique identity "
+                                    "03e12d00e37fd45593c49a5a5a1652deca4cf302 (2/3)")
+        self.assertEqual(output[-1], "1/3 unique identities loaded")
+
+        # Files already loaded are skipped
+        code = self.cmd.run('--journal', journal_path, '--resume', filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip().split('\n')
+        self.assertEqual(output[-1], "%s already loaded. Skipping." % filename)
+
+    def test_load_resume_new_uids(self):
+        """Test if unique identities created before an interruption are still new"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        journal_path = os.path.join(tmp_path, 'load.journal')
+        filename = datadir('sortinghat_valid.json')
+
+        # The load is killed before matching the first unique identity
+        with unittest.mock.patch.object(Load, '_merge_on_matching',
+                                        side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.cmd.run('--identities', '--matching', 'default', '--match-new',
+                             '--journal', journal_path, filename)
+
+        code = self.cmd.run('--identities', '--matching', 'default', '--match-new',
+                            '--journal', journal_path, '--resume', filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        # The unique identity created before the interruption is new too
+        self.assertSetEqual(self.cmd.new_uids,
+                            {'17ab00ed3825ec2f50483e33c88df223264182ba',
+                             'a9b403e150dd4af8953a52a4bb841051e4b705d9'})
+
+        result = [(uid.uuid, sorted(identity.id for identity in uid.identities))
+                  for uid in api.unique_identities(self.db)]
+
+        # The result is the same of an uninterrupted load
+        self.db.clear()
+
+        code = self.cmd.run('--identities', '--matching', 'default', '--match-new', filename)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        expected = [(uid.uuid, sorted(identity.id for identity in uid.identities))
+                    for uid in api.unique_identities(self.db)]
+        self.assertListEqual(result, expected)
+
+    def test_load_resume_journal_mismatch(self):
+        """Test if it fails when the journal does not match with the input"""
+
+        tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+        self.addCleanup(shutil.rmtree, tmp_path)
+
+        journal_path = os.path.join(tmp_path, 'load.journal')
+        filename = datadir('sortinghat_valid.json')
+
+        with open(journal_path, 'w') as fd:
+            entry = {
+                'file': os.path.abspath(filename),
+                'position': 2,
+                'uuid': '52e0aa0a14826627e633fd15332988686b730ab3',
+                'completed': False
+            }
+            fd.write(json.dumps(entry) + '\n')
+
+        code = self.cmd.run('--identities', '--journal', journal_path, '--resume', filename)
+        self.assertEqual(code, CODE_LOAD_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, "Error: %s does not match with its contents"
+                                 % ("journal entry for " + os.path.abspath(filename)))
+
+    def test_resume_without_journal(self):
+        """Check if it fails when '--resume' is set without a journal"""
+
+        code = self.cmd.run('--resume', datadir('sortinghat_valid.json'))
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, "Error: '--resume' requires a journal file ('--journal')")
+
+    def test_load_existing_identities(self):
+        """Test to load identities already stored using the prefilter"""
+
+        for fp_rate in ['0.01', '0']:
+            self.db.clear()
+
+            code = self.cmd.run('--identities', datadir('sortinghat_valid.json'))
+            self.assertEqual(code, CMD_SUCCESS)
+
+            # Identities are found on the filter
+            code = self.cmd.run('--identities', '--prefilter-fp-rate', fp_rate,
+                                '--verbose', datadir('sortinghat_valid.json'))
+            self.assertEqual(code, CMD_SUCCESS)
+
+            uids = api.unique_identities(self.db)
+            self.assertEqual(len(uids), 2)
+            self.assertEqual(len(uids[0].identities), 3)
+            self.assertEqual(len(uids[1].identities), 2)
+
+            output = sys.stderr.getvalue().strip()
+            self.assertIn("Identity '880b3dfcb3a08712e5831bddc3dfe81fc5d7b331' "
+                          "already exists in the registry", output)
+
+    def test_load_existing_identities_lookups(self):
+        """Check how many times existing identities are looked up on the registry"""
+
+        import sortinghat.cmd.load
+
+        for fp_rate, nlookups in [('0.01', 5), ('0', 0)]:
+            self.db.clear()
+
+            code = self.cmd.run('--identities', datadir('sortinghat_valid.json'))
+            self.assertEqual(code, CMD_SUCCESS)
+
+            with unittest.mock.patch('sortinghat.cmd.load.find_identity',
+                                     wraps=sortinghat.cmd.load.find_identity) as mock_find:
+                code = self.cmd.run('--identities', '--prefilter-fp-rate', fp_rate,
+                                    datadir('sortinghat_valid.json'))
+                self.assertEqual(code, CMD_SUCCESS)
+
+            # Each stored identity is looked up once at most; with
+            # an exact map, none of them is
+            self.assertEqual(mock_find.call_count, nlookups)
+
+            uids = api.unique_identities(self.db)
+            self.assertEqual(len(uids), 2)
+
+    def test_invalid_prefilter_fp_rate(self):
+        """Check if it fails when the false positive rate is not valid"""
+
+        code = self.cmd.run('--identities', '--prefilter-fp-rate', '1',
+                            datadir('sortinghat_valid.json'))
+        self.assertEqual(code, CODE_VALUE_ERROR)
+
+        output = sys.stderr.getvalue().strip()
+        self.assertEqual(output, "Error: false positive rate must be in the range [0, 1)")
+
     def test_load_identities_with_default_matching(self):
         """Test to load identities from a file using default matching"""
 
@@ -859,6 +1210,46 @@ class TestLoadIdentities(TestLoadCaseBase):
         enrollments = api.enrollments(self.db, uid.uuid)
         self.assertEqual(len(enrollments), 1)
 
+    def test_reset_not_loaded_identities(self):
+        """Check if identities not found on the input are also split"""
+
+        uuid = api.add_identity(self.db, 'unknown', email='jdoe@example.com')
+        jdoe_uuid = api.add_identity(self.db, 'git', email='jdoe@example.com',
+                                     name='John Doe', uuid=uuid)
+
+        api.add_organization(self.db, 'LibreSoft')
+        api.add_enrollment(self.db, uuid, 'LibreSoft',
+                           datetime.datetime(2000, 1, 1, 0, 0),
+                           datetime.datetime(2100, 1, 1, 0, 0))
+
+        parser = self.get_parser(datadir('sortinghat_valid.json'))
+
+        code = self.cmd.import_identities(parser, reset=True)
+        self.assertEqual(code, CMD_SUCCESS)
+
+        # A new unique identity with an empty profile was created
+        uids = api.unique_identities(self.db, jdoe_uuid)
+        self.assertEqual(len(uids), 1)
+
+        uid = uids[0]
+        self.assertEqual(len(uid.identities), 1)
+        self.assertEqual(uid.identities[0].id, jdoe_uuid)
+        self.assertEqual(uid.profile.uuid, jdoe_uuid)
+        self.assertEqual(uid.profile.is_bot, False)
+
+        uids = api.unique_identities(self.db, uuid)
+        uid = uids[0]
+        self.assertEqual(len(uid.identities), 1)
+        self.assertEqual(uid.identities[0].id, uuid)
+
+        enrollments = api.enrollments(self.db, uuid)
+        self.assertEqual(len(enrollments), 0)
+
+        output = sys.stdout.getvalue().strip().split('\n')
+        self.assertIn("1 unique identities created", output)
+        self.assertIn("Relationships cleared for 1 identities", output)
+        self.assertIn("1 enrollments cleared", output)
+
     def test_dates_out_of_bounds(self):
         """Check dates when they are out of bounds"""
 
@@ -42,6 +42,9 @@ REGISTRY_DOM_NOT_FOUND_ERROR = "Error: example.com not found in the registry"
 REGISTRY_DOM_NOT_FOUND_ERROR_ALT = "Error: bitergia.com not found in the registry"
 REGISTRY_EMPTY_OUTPUT = ""
 
+REGISTRY_AFFILIATE_OUTPUT = """Unique identity 4490b47f24a5090e57689052081d9bb94ef72e33 (jsmith@eu.bitergia.org) \
+affiliated to Bitergia"""
+
 REGISTRY_OUTPUT = """Bitergia\tbitergia.com *
 Bitergia\tbitergia.net
 Example\texample.com
@@ -188,6 +191,25 @@ class TestOrgsCommand(TestOrgsCaseBase):
         output = sys.stdout.getvalue().strip()
         self.assertEqual(output, REGISTRY_OUTPUT_ALT)
 
+    def test_add_with_affiliate_option(self):
+        """Check if the unique identities on the new domain are affiliated"""
+
+        jsmith_uuid = api.add_identity(self.db, 'scm', 'jsmith@eu.bitergia.org')
+        api.add_identity(self.db, 'scm', 'jsmith@example.com', uuid=jsmith_uuid)
+        api.add_identity(self.db, 'scm', 'jdoe@bitergia.org.com')
+
+        code = self.cmd.run('--add', '--top-domain', '--affiliate', 'Bitergia', 'bitergia.org')
+        self.assertEqual(code, CMD_SUCCESS)
+
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, REGISTRY_AFFILIATE_OUTPUT)
+
+        # Only the identities on the new domain were affiliated
+        enrollments = api.enrollments(self.db)
+        self.assertEqual(len(enrollments), 1)
+        self.assertEqual(enrollments[0].uuid, jsmith_uuid)
+        self.assertEqual(enrollments[0].organization.name, 'Bitergia')
+
     def test_delete_with_args(self):
         """Test delete action"""
 
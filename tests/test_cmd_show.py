@@ -23,6 +23,7 @@
 import datetime
 import sys
 import unittest
+import unittest.mock
 
 if '..' not in sys.path:
     sys.path.insert(0, '..')
@@ -256,6 +257,16 @@ class TestShow(TestShowCaseBase):
         output = sys.stdout.getvalue().strip()
         self.assertEqual(output, SHOW_OUTPUT)
 
+    def test_show_batches(self):
+        "Check if the output is the same when it is printed in batches"
+
+        with unittest.mock.patch('sortinghat.cmd.show.SHOW_BATCH_SIZE', 1):
+            code = self.cmd.show()
+
+        self.assertEqual(code, CMD_SUCCESS)
+        output = sys.stdout.getvalue().strip()
+        self.assertEqual(output, SHOW_OUTPUT)
+
     def test_show_uuid(self):
         """Check show using a UUID"""
 
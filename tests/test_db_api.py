@@ -21,12 +21,14 @@
 
 import datetime
 import unittest
+import unittest.mock
 
 from sortinghat.db import api
 from sortinghat.db.model import (MAX_PERIOD_DATE,
                                  MIN_PERIOD_DATE,
                                  UniqueIdentity,
                                  Identity,
+                                 IdentityNgram,
                                  Profile,
                                  Organization,
                                  Domain,
@@ -536,6 +538,142 @@ class TestAddIdentity(TestDBAPICaseBase):
                                  name=None, email='', username=None)
 
 
+class TestIdentitiesNgrams(TestDBAPICaseBase):
+    """Unit tests for the n-grams index of identities"""
+
+    def load_identities(self, session):
+        uidentity = UniqueIdentity(uuid='AAAA')
+        session.add(uidentity)
+
+        api.add_identity(session, uidentity, '0001', 'scm',
+                         name='John Smith', email='jsmith@example.org')
+        api.add_identity(session, uidentity, '0002', 'mls',
+                         name='Jöhn Doe', username='jdoe')
+        api.add_identity(session, uidentity, '0003', 'scm',
+                         username='jsmith')
+
+    def search(self, session, term):
+        query = api.search_identities_ngrams(session, term)
+
+        if query is None:
+            return None
+
+        return sorted([row.identity_id for row in query])
+
+    def test_add_identity(self):
+        """Check if the n-grams of new identities are indexed"""
+
+        with self.db.connect() as session:
+            self.load_identities(session)
+
+        with self.db.connect() as session:
+            keys = [row.ngram for row in session.query(IdentityNgram).
+                    filter(IdentityNgram.identity_id == '0001')]
+
+            expected = api.identity_ngrams('scm', 'John Smith', 'jsmith@example.org')
+            self.assertSetEqual(set(keys), expected)
+            self.assertEqual(len(keys), len(expected))
+
+    def test_identity_ngrams(self):
+        """Check if values are indexed together ignoring empty ones"""
+
+        keys = api.identity_ngrams('scm', None, 'jsmith', '')
+        self.assertSetEqual(keys, api.identity_ngrams('scm') | api.identity_ngrams('jsmith'))
+        self.assertEqual(len(keys), 5)
+
+        # Keys are signed 32 bits integers
+        for key in api.identity_ngrams('jsmith@example.org'):
+            self.assertGreaterEqual(key, -2 ** 31)
+            self.assertLess(key, 2 ** 31)
+
+        self.assertSetEqual(api.identity_ngrams(None, 'jo'), set())
+
+    def test_search_identities_ngrams(self):
+        """Check if it finds the identities with all the n-grams of a term"""
+
+        with self.db.connect() as session:
+            self.load_identities(session)
+
+        with self.db.connect() as session:
+            self.assertListEqual(self.search(session, 'smith'), ['0001', '0003'])
+            self.assertListEqual(self.search(session, 'SMITH@EXAMPLE'), ['0001'])
+            self.assertListEqual(self.search(session, 'john'), ['0001', '0002'])
+            self.assertListEqual(self.search(session, 'mls'), ['0002'])
+            self.assertListEqual(self.search(session, 'jsmith.org'), [])
+
+            # The n-grams can be on different fields
+            self.assertListEqual(self.search(session, 'scmjohn'), [])
+            self.assertListEqual(self.search(session, 'jdo'), ['0002'])
+
+    def test_search_folded_terms(self):
+        """Check if terms are folded like the database collation does"""
+
+        with self.db.connect() as session:
+            self.load_identities(session)
+
+            uidentity = api.find_unique_identity(session, 'AAAA')
+            api.add_identity(session, uidentity, '0004', 'scm',
+                             name='ｊｏｈｎ Roe')
+            api.add_identity(session, uidentity, '0005', 'scm',
+                             name='Julius Cæsar')
+
+        with self.db.connect() as session:
+            self.assertListEqual(self.search(session, 'john'), ['0001', '0002', '0004'])
+            self.assertListEqual(self.search(session, 'ＪＯＨＮ'), ['0001', '0002', '0004'])
+            self.assertListEqual(self.search(session, 'ｊｏｈｎ r'), ['0004'])
+
+            # Expanded letters match their expansion
+            self.assertListEqual(self.search(session, 'aes'), ['0005'])
+            self.assertListEqual(self.search(session, 'CÆSAR'), ['0005'])
+
+    def test_search_not_indexed_terms(self):
+        """Check if it returns None when the term cannot use the index"""
+
+        with self.db.connect() as session:
+            self.assertIsNone(self.search(session, None))
+            self.assertIsNone(self.search(session, ''))
+            self.assertIsNone(self.search(session, 'jo'))
+            self.assertIsNone(self.search(session, 'j_smith'))
+            self.assertIsNone(self.search(session, 'jsmith%'))
+            self.assertIsNone(self.search(session, 'jsmith\\'))
+
+    def test_delete_identity(self):
+        """Check if the n-grams of deleted identities are removed"""
+
+        with self.db.connect() as session:
+            self.load_identities(session)
+
+        with self.db.connect() as session:
+            api.delete_identity(session, api.find_identity(session, '0001'))
+
+        with self.db.connect() as session:
+            self.assertListEqual(self.search(session, 'smith'), ['0003'])
+
+            nrows = session.query(IdentityNgram).\
+                filter(IdentityNgram.identity_id == '0001').count()
+            self.assertEqual(nrows, 0)
+
+    def test_build_identities_ngrams(self):
+        """Check if the index is built from scratch"""
+
+        with self.db.connect() as session:
+            self.load_identities(session)
+
+        with self.db.connect() as session:
+            expected = sorted((row.ngram, row.identity_id) for row in session.query(IdentityNgram))
+            session.query(IdentityNgram).filter(IdentityNgram.identity_id == '0002').delete()
+
+        # Identities are read in several batches
+        with self.db.connect() as session:
+            with unittest.mock.patch('sortinghat.db.api.NGRAMS_FETCH_SIZE', 2):
+                nids = api.build_identities_ngrams(session)
+            self.assertEqual(nids, 3)
+
+        with self.db.connect() as session:
+            rows = sorted((row.ngram, row.identity_id) for row in session.query(IdentityNgram))
+            self.assertListEqual(rows, expected)
+
+
 class TestDeleteIdentity(TestDBAPICaseBase):
     """Unit tests for delete identity"""
 
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import threading
+import unittest
+import unittest.mock
+
+from sortinghat.db.cache import LRUCache, DatabaseCache, DEFAULT_CACHE_SIZES
+
+
+class TestLRUCache(unittest.TestCase):
+    """Unit tests for LRUCache"""
+
+    def test_get(self):
+        """Check if values are loaded only when they are not cached"""
+
+        loader = unittest.mock.Mock(side_effect=['a', 'b'])
+        cache = LRUCache(10, 60)
+
+        self.assertEqual(cache.get(1, loader), 'a')
+        self.assertEqual(cache.get(1, loader), 'a')
+        self.assertEqual(cache.get(2, loader), 'b')
+        self.assertEqual(cache.get(2, loader), 'b')
+
+        self.assertEqual(loader.call_count, 2)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 2)
+
+    def test_evict_least_recently_used(self):
+        """Check if the least recently used entry is removed when the cache is full"""
+
+        cache = LRUCache(2, 60)
+
+        cache.get('a', lambda: 1)
+        cache.get('b', lambda: 2)
+
+        # 'a' is used, so 'b' will be removed
+        cache.get('a', lambda: None)
+        cache.get('c', lambda: 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('a', lambda: None), 1)
+        self.assertEqual(cache.get('c', lambda: None), 3)
+        self.assertEqual(cache.get('b', lambda: 4), 4)
+
+    def test_expired_entries(self):
+        """Check if expired entries are loaded again"""
+
+        cache = LRUCache(10, 60)
+
+        with unittest.mock.patch('sortinghat.db.cache.time.monotonic', return_value=100):
+            cache.get('a', lambda: 1)
+
+        with unittest.mock.patch('sortinghat.db.cache.time.monotonic', return_value=159):
+            self.assertEqual(cache.get('a', lambda: 2), 1)
+
+        with unittest.mock.patch('sortinghat.db.cache.time.monotonic', return_value=160):
+            self.assertEqual(cache.get('a', lambda: 2), 2)
+
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+
+    def test_loader_error(self):
+        """Check if nothing is stored when the loader fails"""
+
+        cache = LRUCache(10, 60)
+        loader = unittest.mock.Mock(side_effect=KeyError('a'))
+
+        self.assertRaises(KeyError, cache.get, 'a', loader)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.misses, 1)
+
+    def test_clear(self):
+        """Check if all the entries are removed"""
+
+        cache = LRUCache(10, 60)
+        cache.get('a', lambda: 1)
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a', lambda: 2), 2)
+
+    def test_clear_while_loading(self):
+        """Check if values loaded while the cache is cleared are not stored"""
+
+        cache = LRUCache(10, 60)
+        loading = threading.Event()
+        cleared = threading.Event()
+        results = []
+
+        def stale_loader():
+            loading.set()
+            cleared.wait(10)
+            return 'stale'
+
+        thread = threading.Thread(target=lambda: results.append(cache.get('a', stale_loader)))
+        thread.start()
+
+        # The cache is invalidated while the value is loaded
+        loading.wait(10)
+        cache.clear()
+        cleared.set()
+        thread.join(10)
+
+        # The stale value is returned but it is not stored
+        self.assertListEqual(results, ['stale'])
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.get('a', lambda: 'fresh'), 'fresh')
+
+        # Values loaded after clearing the cache are stored
+        self.assertEqual(cache.get('a', lambda: None), 'fresh')
+
+    def test_invalid_arguments(self):
+        """Check if it fails when size or ttl are not valid"""
+
+        self.assertRaisesRegex(ValueError, "'size' must be greater than 0",
+                               LRUCache, 0, 60)
+        self.assertRaisesRegex(ValueError, "'ttl' must be greater than 0",
+                               LRUCache, 10, 0)
+
+
+class TestDatabaseCache(unittest.TestCase):
+    """Unit tests for DatabaseCache"""
+
+    def test_entities(self):
+        """Check if each type of entity has its own cache"""
+
+        cache = DatabaseCache(sizes={'organizations': 1})
+
+        cache.get('organizations', 'a', lambda: 1)
+        cache.get('organizations', 'b', lambda: 2)
+        cache.get('domains', 'a', lambda: 3)
+
+        self.assertEqual(cache.get('organizations', 'b', lambda: None), 2)
+        self.assertEqual(cache.get('domains', 'a', lambda: None), 3)
+
+        stats = cache.stats()
+        self.assertListEqual(sorted(stats), sorted(DEFAULT_CACHE_SIZES))
+        self.assertDictEqual(stats['organizations'], {'hits': 1, 'misses': 2, 'entries': 1})
+        self.assertDictEqual(stats['domains'], {'hits': 1, 'misses': 1, 'entries': 1})
+        self.assertDictEqual(stats['blacklist'], {'hits': 0, 'misses': 0, 'entries': 0})
+
+    def test_invalidate(self):
+        """Check if the entries of the given types are removed"""
+
+        cache = DatabaseCache()
+
+        cache.get('organizations', 'a', lambda: 1)
+        cache.get('domains', 'a', lambda: 2)
+        cache.get('blacklist', 'a', lambda: 3)
+
+        cache.invalidate('organizations', 'domains')
+
+        stats = cache.stats()
+        self.assertEqual(stats['organizations']['entries'], 0)
+        self.assertEqual(stats['domains']['entries'], 0)
+        self.assertEqual(stats['blacklist']['entries'], 1)
+
+        # No types means every type
+        cache.invalidate()
+
+        stats = cache.stats()
+        self.assertEqual(stats['blacklist']['entries'], 0)
+
+    def test_invalid_entity(self):
+        """Check if it fails when the size of an unknown entity is given"""
+
+        self.assertRaisesRegex(ValueError, "'countries' is not a cacheable entity",
+                               DatabaseCache, sizes={'countries': 10})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -28,13 +28,14 @@ import unittest
 if '..' not in sys.path:
     sys.path.insert(0, '..')
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, Table, MetaData, Column, Integer, String
 from sqlalchemy.engine.url import URL
 from sqlalchemy.exc import IntegrityError, InternalError, StatementError
 from sqlalchemy.orm import sessionmaker
 
 from sortinghat.db.model import ModelBase, Organization, Domain, Country,\
-    UniqueIdentity, Identity, Profile, Enrollment, MatchingBlacklist
+    UniqueIdentity, Identity, Profile, Enrollment, MatchingBlacklist, \
+    MetricsGrimoireIdentity
 
 from tests.base import Database, CONFIG_FILE
 
@@ -654,5 +655,38 @@ class TestMatchingBlacklist(TestCaseBase):
             self.session.commit()
 
 
+class TestMetricsGrimoireIdentity(unittest.TestCase):
+    """Unit tests for MetricsGrimoireIdentity class"""
+
+    def test_map_columns(self):
+        """Check if the attributes are mapped to the columns of a table"""
+
+        table = Table('people', MetaData(),
+                      Column('id', Integer, primary_key=True),
+                      Column('name', String(64)),
+                      Column('email', String(64)),
+                      Column('user_id', String(64)))
+
+        columns = MetricsGrimoireIdentity.map_columns(table)
+        self.assertIs(columns['mg_id'], table.c.id)
+        self.assertIs(columns['name'], table.c.name)
+        self.assertIs(columns['email'], table.c.email)
+        self.assertIs(columns['username'], table.c.user_id)
+
+    def test_map_columns_not_found(self):
+        """Check if attributes are mapped to None when their columns are not found"""
+
+        table = Table('irclog', MetaData(),
+                      Column('id', Integer, primary_key=True),
+                      Column('nick', String(64)),
+                      Column('message', String(64)))
+
+        columns = MetricsGrimoireIdentity.map_columns(table)
+        self.assertIs(columns['mg_id'], table.c.nick)
+        self.assertIsNone(columns['name'])
+        self.assertIsNone(columns['email'])
+        self.assertIs(columns['username'], table.c.nick)
+
+
 if __name__ == "__main__":
     unittest.main()
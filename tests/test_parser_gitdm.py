@@ -22,14 +22,17 @@
 #
 
 import datetime
+import io
 import re
 import sys
+import tempfile
 import unittest
 
 if '..' not in sys.path:
     sys.path.insert(0, '..')
 
 from sortinghat.db.model import UniqueIdentity, Identity, Enrollment, Organization, Domain
+from sortinghat.exceptions import InvalidFormatError
 from sortinghat.parsing.gitdm import GitdmParser
 
 from tests.base import datadir
@@ -140,6 +143,40 @@ class TestGidmParser(TestBaseCase):
 
         self.assertEqual(len(uid.enrollments), 0)
 
+    def test_file_object_streams(self):
+        """Check if identities and organizations are parsed from file objects"""
+
+        filenames = ['gitdm_email_aliases_valid.txt',
+                     'gitdm_email_to_employer_valid.txt',
+                     'gitdm_orgs_valid.txt']
+
+        streams = [self.read_file(datadir(filename)) for filename in filenames]
+        expected = GitdmParser(*streams, source='unknown')
+
+        files = [open(datadir(filename), 'r', encoding='UTF-8') for filename in filenames]
+
+        try:
+            parser = GitdmParser(*files, source='unknown')
+        finally:
+            for f in files:
+                f.close()
+
+        uids = parser.identities
+        self.assertEqual(len(uids), len(expected.identities))
+
+        for uid, exp in zip(uids, expected.identities):
+            self.assertDictEqual(uid.to_dict(), exp.to_dict())
+            self.assertListEqual([rol.to_dict() for rol in uid.enrollments],
+                                 [rol.to_dict() for rol in exp.enrollments])
+
+        orgs = parser.organizations
+        self.assertEqual(len(orgs), len(expected.organizations))
+
+        for org, exp in zip(orgs, expected.organizations):
+            self.assertEqual(org.name, exp.name)
+            self.assertListEqual([dom.domain for dom in org.domains],
+                                 [dom.domain for dom in exp.domains])
+
     def test_email_validation(self):
         aliases = self.read_file(datadir('gitdm_email_aliases_valid.txt'))
         email_to_employer = self.read_file(datadir('gitdm_email_to_employer_invalid.txt'))
@@ -167,6 +204,25 @@ class TestGidmParser(TestBaseCase):
             self.assertEqual(captured.records[4].getMessage(), expected_log[4])
             self.assertEqual(captured.records[5].getMessage(), expected_log[5])
 
+    def test_invalid_enrollment_date(self):
+        """Check whether it skips enrollments with invalid dates"""
+
+        email_to_employer = "jsmith@example.com\tExample < 2015-13-01\n" \
+                            "jdoe@example.com\tExample < 2015-01-01\n"
+
+        expected_log = "Skip: 'jsmith@example.com\tExample < 2015-13-01' ->" \
+                       " line 1: invalid date: '2015-13-01'"
+
+        with self.assertLogs() as captured:
+            parser = GitdmParser(email_to_employer=email_to_employer,
+                                 source='unknown')
+            self.assertEqual(len(captured.records), 1)
+            self.assertEqual(captured.records[0].getMessage(), expected_log)
+
+        uids = parser.identities
+        self.assertEqual(len(uids), 1)
+        self.assertEqual(uids[0].uuid, 'jdoe@example.com')
+
     def test_supress_email_validation(self):
         email_to_employer = self.read_file(datadir('gitdm_email_to_employer_invalid.txt'))
 
@@ -448,6 +504,20 @@ class TestGidmParser(TestBaseCase):
         self.assertEqual(dom.domain, 'gsyc.es')
         self.assertEqual(dom.is_top_domain, False)
 
+    def test_empty_streams(self):
+        """Check whether it raises an error when a stream is empty"""
+
+        for key in ('aliases', 'email_to_employer', 'domain_to_employer'):
+            with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                GitdmParser(**{key: ''})
+
+            with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                GitdmParser(**{key: io.StringIO()})
+
+            with tempfile.TemporaryFile('w+', encoding='UTF-8') as f:
+                with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                    GitdmParser(**{key: f})
+
     def test_not_valid_organizations_stream(self):
         """Check whether it skips an error when parsing invalid organization streams"""
 
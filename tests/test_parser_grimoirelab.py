@@ -197,6 +197,80 @@ class TestGrimoreLabParser(TestBaseCase):
         self.assertEqual(id0.source, 'grimoirelab')
         self.assertEqual(id0.uuid, None)
 
+    def test_parallel_parser(self):
+        """Check if parsing in parallel returns the same data"""
+
+        stream_ids = self.read_file(datadir('grimoirelab_valid.yml'))
+        stream_orgs = self.read_file(datadir('grimoirelab_orgs_valid.yml'))
+
+        expected = GrimoireLabParser(stream_ids, stream_orgs)
+        parser = GrimoireLabParser(stream_ids, stream_orgs, jobs=2)
+
+        uids = parser.identities
+        self.assertEqual(len(uids), 3)
+        self.assertEqual(len(uids), len(expected.identities))
+
+        for uid, exp in zip(uids, expected.identities):
+            self.assertDictEqual(uid.to_dict(), exp.to_dict())
+            self.assertListEqual([rol.to_dict() for rol in uid.enrollments],
+                                 [rol.to_dict() for rol in exp.enrollments])
+
+        self.assertListEqual([b.excluded for b in parser.blacklist],
+                             [b.excluded for b in expected.blacklist])
+        self.assertListEqual([o.name for o in parser.organizations],
+                             [o.name for o in expected.organizations])
+
+    def test_parallel_parser_invalid_stream(self):
+        """Check if errors are raised when parsing in parallel"""
+
+        stream_ids = self.read_file(datadir('grimoirelab_invalid_email.yml'))
+        with self.assertRaisesRegex(InvalidFormatError, '^.+Invalid email address: lcanas__at__bitergia.com$'):
+            GrimoireLabParser(stream_ids, jobs=2)
+
+        stream_ids = self.read_file(datadir('grimoirelab_invalid_blacklist_empty_entry.yml'))
+        with self.assertRaisesRegex(InvalidFormatError, '^.+Blacklist entries cannot be null or empty'):
+            GrimoireLabParser(stream_ids, jobs=2)
+
+    def test_parallel_parser_aliases(self):
+        """Check if streams with anchors and aliases are parsed in parallel"""
+
+        stream = "- profile:\n" \
+                 "    name: John Smith\n" \
+                 "  email: &emails [jsmith@example.com]\n" \
+                 "- profile:\n" \
+                 "    name: John Doe\n" \
+                 "  email: [jdoe@example.com]\n" \
+                 "- profile:\n" \
+                 "    name: J Smith\n" \
+                 "  email: *emails\n"
+
+        expected = GrimoireLabParser(stream)
+        parser = GrimoireLabParser(stream, jobs=2)
+
+        uids = parser.identities
+        self.assertEqual(len(uids), 3)
+
+        for uid, exp in zip(uids, expected.identities):
+            self.assertDictEqual(uid.to_dict(), exp.to_dict())
+
+        self.assertEqual(uids[2].identities[1].email, 'jsmith@example.com')
+
+    def test_malformed_yml(self):
+        """Check if malformed YAML raises the same error in sequential and parallel modes"""
+
+        stream = "- profile:\n" \
+                 "    name: John Smith\n" \
+                 "  email: [jsmith@example.com\n" \
+                 "- profile:\n" \
+                 "    name: John Doe\n"
+
+        for jobs in (1, 2):
+            with self.assertRaisesRegex(InvalidFormatError, '^invalid yml format. while parsing a flow sequence'):
+                GrimoireLabParser(stream, jobs=jobs)
+
+        with self.assertRaisesRegex(InvalidFormatError, '^invalid yml format. while parsing a flow sequence'):
+            GrimoireLabParser(organizations=stream)
+
     def test_organizations_parser(self):
         """Check whether it parses a valid organizations file"""
 
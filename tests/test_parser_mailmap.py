@@ -21,7 +21,9 @@
 #
 
 import datetime
+import io
 import sys
+import tempfile
 import unittest
 
 if '..' not in sys.path:
@@ -156,6 +158,21 @@ class TestMailmapParser(TestBaseCase):
         orgs = parser.organizations
         self.assertEqual(len(orgs), 0)
 
+    def test_file_object_stream(self):
+        """Check if identities are parsed from a file object"""
+
+        stream = self.read_file(datadir('mailmap_identities.txt'))
+        expected = MailmapParser(stream, source='unknown')
+
+        with open(datadir('mailmap_identities.txt'), 'r', encoding='UTF-8') as f:
+            parser = MailmapParser(f, source='unknown')
+
+        uids = parser.identities
+        self.assertEqual(len(uids), 3)
+
+        for uid, exp in zip(uids, expected.identities):
+            self.assertDictEqual(uid.to_dict(), exp.to_dict())
+
     def test_valid_organizations_stream(self):
         """Check parsed orgs and identities from a valid file"""
 
@@ -256,6 +273,20 @@ class TestMailmapParser(TestBaseCase):
         self.assertEqual(rol.start, datetime.datetime(1900, 1, 1, 0, 0, 0))
         self.assertEqual(rol.end, datetime.datetime(2100, 1, 1, 0, 0, 0))
 
+    def test_empty_stream(self):
+        """Check whether it raises an error when the stream is empty"""
+
+        for has_orgs in (False, True):
+            with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                MailmapParser('', has_orgs=has_orgs)
+
+            with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                MailmapParser(io.StringIO(), has_orgs=has_orgs)
+
+            with tempfile.TemporaryFile('w+', encoding='UTF-8') as f:
+                with self.assertRaisesRegex(InvalidFormatError, 'stream cannot be empty'):
+                    MailmapParser(f, has_orgs=has_orgs)
+
     def test_not_valid_stream(self):
         """Check whether it prints an error when parsing invalid streams"""
 
@@ -21,6 +21,8 @@
 #
 
 import datetime
+import io
+import json
 import sys
 import unittest
 
@@ -29,7 +31,7 @@ if '..' not in sys.path:
 
 from sortinghat.db.model import UniqueIdentity, Organization, Domain, MatchingBlacklist
 from sortinghat.exceptions import InvalidFormatError
-from sortinghat.parsing.sh import SortingHatParser
+from sortinghat.parsing.sh import SortingHatParser, msgpack
 
 from tests.base import datadir
 
@@ -48,6 +50,10 @@ ORGS_INVALID_JSON_FORMAT_ERROR = "invalid json format. Expecting object"
 ORGS_MISSING_KEYS_ERROR = "Attribute is_top not found"
 ORGS_IS_TOP_ERROR = "'is_top' must have a bool value"
 ORGS_STREAM_INVALID_ERROR = "stream cannot be empty or None"
+RECORDS_JSON_LINES_ERROR = "invalid json lines format. Line 2: Expecting"
+RECORDS_HEADER_ERROR = "invalid records format. Header must be an object"
+RECORDS_RECORD_ERROR = "invalid records format. Record 1 must be an object"
+RECORDS_MSGPACK_ERROR = "invalid msgpack format. Unexpected end of data"
 
 
 class TestBaseCase(unittest.TestCase):
@@ -373,5 +379,73 @@ class TestSortingHatParser(TestBaseCase):
             SortingHatParser(None)
 
 
+class TestSortingHatParserRecords(TestBaseCase):
+    """Test SortingHat parser with records"""
+
+    def setUp(self):
+        content = self.read_file(datadir('sortinghat_valid.json'))
+        self.document = json.loads(content)
+        self.expected = SortingHatParser(content)
+
+        self.header = dict(self.document)
+        self.records = list(self.header.pop('uidentities').values())
+
+    def assertParserEqual(self, parser):
+        self.assertListEqual([str(u) for u in parser.identities],
+                             [str(u) for u in self.expected.identities])
+        self.assertListEqual([u.to_dict() for u in parser.identities],
+                             [u.to_dict() for u in self.expected.identities])
+        self.assertListEqual([b.excluded for b in parser.blacklist],
+                             [b.excluded for b in self.expected.blacklist])
+        self.assertListEqual([o.name for o in parser.organizations],
+                             [o.name for o in self.expected.organizations])
+
+    def test_json_lines(self):
+        """Check whether records in JSON lines format are parsed"""
+
+        lines = [json.dumps(self.header)] + [json.dumps(r) for r in self.records]
+        stream = io.StringIO('\n'.join(lines) + '\n\n')
+
+        parser = SortingHatParser.from_json_lines(stream)
+        self.assertParserEqual(parser)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        """Check whether records in MessagePack format are parsed"""
+
+        data = b''.join(msgpack.packb(r) for r in [self.header] + self.records)
+
+        parser = SortingHatParser.from_msgpack(io.BytesIO(data))
+        self.assertParserEqual(parser)
+
+        # Truncated streams are not valid
+        with self.assertRaisesRegex(InvalidFormatError, RECORDS_MSGPACK_ERROR):
+            SortingHatParser.from_msgpack(io.BytesIO(data[:-1]))
+
+    def test_invalid_json_lines(self):
+        """Check whether it raises an exception when a line is not valid"""
+
+        stream = io.StringIO(json.dumps(self.header) + '\n{"uuid": \n')
+
+        with self.assertRaisesRegex(InvalidFormatError, RECORDS_JSON_LINES_ERROR):
+            SortingHatParser.from_json_lines(stream)
+
+    def test_invalid_records(self):
+        """Check whether it raises an exception when records are not objects"""
+
+        with self.assertRaisesRegex(InvalidFormatError, RECORDS_HEADER_ERROR):
+            SortingHatParser.from_records([[]])
+
+        with self.assertRaisesRegex(InvalidFormatError, RECORDS_RECORD_ERROR):
+            SortingHatParser.from_records([self.header, 'uuid'])
+
+    def test_empty_records(self):
+        """Check whether it raises an exception when there are no records"""
+
+        with self.assertRaisesRegex(InvalidFormatError,
+                                    ORGS_STREAM_INVALID_ERROR):
+            SortingHatParser.from_json_lines(io.StringIO(''))
+
+
 if __name__ == "__main__":
     unittest.main(buffer=True, exit=False)
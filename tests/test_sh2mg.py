@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import io
+import sys
+import unittest
+import unittest.mock
+
+if '..' not in sys.path:
+    sys.path.insert(0, '..')
+
+from sortinghat.bin.sh2mg import Identity, find_matches
+
+
+class TestFindMatches(unittest.TestCase):
+    """Unit tests for find_matches"""
+
+    def setUp(self):
+        self.mg_ids = [
+            Identity('1', 'a9b403e150dd4af8953a52a4bb841051e4b705d9'),
+            Identity('2', '880b3dfcb3a08712e5831bddc3dfe81fc5d7b331'),
+            Identity('3', 'a9b403e150dd4af8953a52a4bb841051e4b705d9'),
+            Identity('4', '17ab00ed3825ec2f50483e33c88df223264182ba')
+        ]
+
+    def find_matches(self, sh_ids):
+        with unittest.mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+            matches = list(find_matches(sh_ids, self.mg_ids))
+
+        return matches, stderr.getvalue()
+
+    def test_matches(self):
+        """Check if identities are matched using their ids"""
+
+        sh_ids = [
+            Identity('a9b403e150dd4af8953a52a4bb841051e4b705d9', 'John Smith'),
+            Identity('17ab00ed3825ec2f50483e33c88df223264182ba', 'John Doe'),
+            Identity('0000000000000000000000000000000000000000', 'Jane Roe')
+        ]
+
+        matches, warnings = self.find_matches(sh_ids)
+
+        expected = [
+            {'uuid': 'John Smith', 'people_id': '1'},
+            {'uuid': 'John Smith', 'people_id': '3'},
+            {'uuid': 'John Doe', 'people_id': '4'}
+        ]
+        self.assertListEqual(matches, expected)
+        self.assertEqual(warnings, '')
+
+    def test_duplicated_identities(self):
+        """Check if duplicated identities are reported and matched once"""
+
+        sh_ids = [
+            Identity('880b3dfcb3a08712e5831bddc3dfe81fc5d7b331', 'John Smith'),
+            Identity('880b3dfcb3a08712e5831bddc3dfe81fc5d7b331', 'John Doe')
+        ]
+
+        matches, warnings = self.find_matches(sh_ids)
+
+        self.assertListEqual(matches, [{'uuid': 'John Smith', 'people_id': '2'}])
+        self.assertEqual(warnings,
+                         "Warning: duplicated identity 880b3dfcb3a08712e5831bddc3dfe81fc5d7b331 "
+                         "found on unique identity John Doe. Skipping.\n")
+
+    def test_no_matches(self):
+        """Check if nothing is returned when there are no matches"""
+
+        sh_ids = [Identity('0000000000000000000000000000000000000000', 'Jane Roe')]
+
+        matches, warnings = self.find_matches(sh_ids)
+        self.assertListEqual(matches, [])
+        self.assertEqual(warnings, '')
+
+        matches, warnings = self.find_matches([])
+        self.assertListEqual(matches, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
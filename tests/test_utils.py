@@ -20,8 +20,15 @@
 #     Santiago Dueñas <sduenas@bitergia.com>
 #
 
+import argparse
+import bz2
 import datetime
+import gzip
+import lzma
+import os
+import shutil
 import sys
+import tempfile
 import unittest
 
 if '..' not in sys.path:
@@ -29,7 +36,8 @@ if '..' not in sys.path:
 
 from sortinghat.exceptions import InvalidDateError
 from sortinghat.utils import merge_date_ranges, str_to_datetime, \
-    to_unicode, uuid
+    to_unicode, ngrams, uuid, BloomFilter, DomainsTrie, EnrollmentsIndex, \
+    open_file, InputFileType
 
 DATE_OUT_OF_BOUNDS_ERROR = "%(type)s %(date)s is out of bounds"
 SOURCE_NONE_OR_EMPTY_ERROR = "source cannot be"
@@ -209,11 +217,42 @@ class TestStrToDatetime(unittest.TestCase):
         self.assertIsInstance(date, datetime.datetime)
         self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32))
 
+    def test_iso_dates(self):
+        """Check if it converts ISO 8601 dates to datetime objects"""
+
+        date = str_to_datetime('2100-01-01T00:00:00')
+        self.assertIsInstance(date, datetime.datetime)
+        self.assertEqual(date, datetime.datetime(2100, 1, 1))
+
+        date = str_to_datetime('2001-12-01T23:15:32.25')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32, 250000))
+
+        date = str_to_datetime('2001-12-01T23:15:32.123456')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32, 123456))
+
+        date = str_to_datetime('2001-12-01T23:15')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15))
+
+        # Timezone information is discarded
+        date = str_to_datetime('2001-12-01T23:15:32Z')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32))
+        self.assertEqual(date.tzinfo, None)
+
+        date = str_to_datetime('2001-12-01T23:15:32+02:00')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32))
+        self.assertEqual(date.tzinfo, None)
+
+        date = str_to_datetime('2001-12-01 23:15:32-0500')
+        self.assertEqual(date, datetime.datetime(2001, 12, 1, 23, 15, 32))
+        self.assertEqual(date.tzinfo, None)
+
     def test_invalid_date(self):
         """Check whether it fails with an invalid date"""
 
         self.assertRaises(InvalidDateError, str_to_datetime, '2001-13-01')
         self.assertRaises(InvalidDateError, str_to_datetime, '2001-04-31')
+        self.assertRaises(InvalidDateError, str_to_datetime, '2001-04-31T00:00:00')
+        self.assertRaises(InvalidDateError, str_to_datetime, '2001-04-01T25:00:00')
 
     def test_invalid_format(self):
         """Check whether it fails with invalid formats"""
@@ -265,6 +304,54 @@ class TestToUnicode(unittest.TestCase):
         self.assertEqual(result, '1234')
 
 
+class TestNgrams(unittest.TestCase):
+    """Unit tests for ngrams function"""
+
+    def test_ngrams(self):
+        """Check if it returns the set of n-grams of a string"""
+
+        result = ngrams('jsmith')
+        self.assertSetEqual(result, {'jsm', 'smi', 'mit', 'ith'})
+
+        result = ngrams('aaaa')
+        self.assertSetEqual(result, {'aaa'})
+
+        result = ngrams('jsmith', n=5)
+        self.assertSetEqual(result, {'jsmit', 'smith'})
+
+    def test_case_and_accents(self):
+        """Check if n-grams are case and accent insensitive"""
+
+        result = ngrams('Jöhn SMITH')
+        self.assertSetEqual(result, ngrams('john smith'))
+
+    def test_database_folding(self):
+        """Check if n-grams fold characters like the database collation"""
+
+        # Compatibility characters
+        self.assertSetEqual(ngrams('ｊｏｈｎ'), ngrams('john'))
+        self.assertSetEqual(ngrams('ﬁnn'), ngrams('finn'))
+
+        # Case folding
+        self.assertSetEqual(ngrams('STRAẞE'), ngrams('strasse'))
+
+        # Letters with stroke, format and control characters
+        self.assertSetEqual(ngrams('Jørgen Łukasz'), ngrams('jorgen lukasz'))
+        self.assertSetEqual(ngrams('jo\u200bhn\x00'), ngrams('john'))
+
+        # Letters expanded to several letters
+        self.assertSetEqual(ngrams('Cæsar'), ngrams('caesar'))
+        self.assertSetEqual(ngrams('Œuvre'), ngrams('oeuvre'))
+        self.assertSetEqual(ngrams('Þór'), ngrams('thor'))
+        self.assertLessEqual(ngrams('aes'), ngrams('Cæsar'))
+
+    def test_short_strings(self):
+        """Check if strings shorter than n do not have n-grams"""
+
+        self.assertSetEqual(ngrams('jo'), set())
+        self.assertSetEqual(ngrams(''), set())
+
+
 class TestUUID(unittest.TestCase):
     """Unit tests for uuid function"""
 
@@ -366,5 +453,253 @@ class TestUUID(unittest.TestCase):
                                uuid, 'scm', '', '', '')
 
 
+class TestBloomFilter(unittest.TestCase):
+    """Unit tests for BloomFilter class"""
+
+    def test_contains(self):
+        """Check if added items are always found"""
+
+        items = [uuid('scm', email='user%s@example.com' % i) for i in range(1000)]
+
+        bf = BloomFilter(len(items), fp_rate=0.01)
+
+        for item in items:
+            bf.add(item)
+
+        self.assertEqual(len(bf), 1000)
+
+        for item in items:
+            self.assertIn(item, bf)
+
+    def test_false_positive_rate(self):
+        """Check if the false positive rate is close to the expected one"""
+
+        bf = BloomFilter(1000, fp_rate=0.01)
+
+        for i in range(1000):
+            bf.add(uuid('scm', email='user%s@example.com' % i))
+
+        fps = 0
+        for i in range(10000):
+            if uuid('mls', email='user%s@example.com' % i) in bf:
+                fps += 1
+
+        self.assertLess(fps, 300)
+
+    def test_memory_size(self):
+        """Check if lower rates need more memory"""
+
+        bf1 = BloomFilter(1000, fp_rate=0.1)
+        bf2 = BloomFilter(1000, fp_rate=0.001)
+
+        self.assertLess(len(bf1.bits), len(bf2.bits))
+
+        # Around 1.2 bytes per item for a 1% rate
+        bf = BloomFilter(1000, fp_rate=0.01)
+        self.assertEqual(len(bf.bits), 1199)
+        self.assertEqual(bf.nhashes, 7)
+
+    def test_empty_filter(self):
+        """Check if an empty filter does not contain any item"""
+
+        bf = BloomFilter(0)
+
+        self.assertEqual(len(bf), 0)
+        self.assertNotIn('jsmith@example.com', bf)
+
+    def test_invalid_params(self):
+        """Check if it fails when the parameters are not valid"""
+
+        self.assertRaises(ValueError, BloomFilter, -1)
+        self.assertRaises(ValueError, BloomFilter, 10, fp_rate=0)
+        self.assertRaises(ValueError, BloomFilter, 10, fp_rate=1)
+        self.assertRaises(ValueError, BloomFilter, 10, fp_rate=1.5)
+
+
+class TestDomainsTrie(unittest.TestCase):
+    """Unit tests for DomainsTrie class"""
+
+    def setUp(self):
+        self.trie = DomainsTrie()
+        self.trie.add('example.com', 'Example', is_top=True)
+        self.trie.add('u.example.com', 'Example U', is_top=True)
+        self.trie.add('es.u.example.com', 'Example ES')
+        self.trie.add('bitergia.com', 'Bitergia')
+
+    def test_lookup(self):
+        """Check if stored domains are found"""
+
+        self.assertListEqual(self.trie.lookup('example.com'), ['Example'])
+        self.assertListEqual(self.trie.lookup('es.u.example.com'), ['Example ES'])
+        self.assertListEqual(self.trie.lookup('bitergia.com'), ['Bitergia'])
+
+        # Names are case insensitive
+        self.assertListEqual(self.trie.lookup('Bitergia.COM'), ['Bitergia'])
+
+    def test_lookup_top_domains(self):
+        """Check if top domains are returned from the most specific to the most generic"""
+
+        self.assertListEqual(self.trie.lookup('en.u.example.com'),
+                             ['Example U', 'Example'])
+        self.assertListEqual(self.trie.lookup('a.b.es.u.example.com'),
+                             ['Example U', 'Example'])
+        self.assertListEqual(self.trie.lookup('it.example.com'), ['Example'])
+
+        # Sub-domains of domains which are not top domains are not matched
+        self.assertListEqual(self.trie.lookup('dev.bitergia.com'), [])
+
+    def test_lookup_not_found(self):
+        """Check if an empty list is returned when there are no matches"""
+
+        self.assertListEqual(self.trie.lookup('com'), [])
+        self.assertListEqual(self.trie.lookup('myexample.com'), [])
+        self.assertListEqual(self.trie.lookup('example.org'), [])
+
+    def test_add_existing_domain(self):
+        """Check if the value of an existing domain is replaced"""
+
+        self.trie.add('bitergia.com', 'Bitergia Inc', is_top=True)
+
+        self.assertEqual(len(self.trie), 4)
+        self.assertListEqual(self.trie.lookup('dev.bitergia.com'), ['Bitergia Inc'])
+
+    def test_contains(self):
+        """Check membership of domains"""
+
+        self.assertEqual(len(self.trie), 4)
+        self.assertIn('u.example.com', self.trie)
+        self.assertIn('.u.example.com', self.trie)
+        self.assertNotIn('en.u.example.com', self.trie)
+        self.assertNotIn('com', self.trie)
+
+
+class TestEnrollmentsIndex(unittest.TestCase):
+    """Unit tests for EnrollmentsIndex class"""
+
+    def test_find(self):
+        """Check if it finds the enrollment on the given dates"""
+
+        index = EnrollmentsIndex()
+        index.add('AAAA', datetime.datetime(2000, 1, 1), datetime.datetime(2005, 12, 31), 'Example')
+        index.add('AAAA', datetime.datetime(2006, 1, 1), datetime.datetime(2100, 1, 1), 'Bitergia')
+        index.add('BBBB', datetime.datetime(1900, 1, 1), datetime.datetime(2100, 1, 1), 'LibreSoft')
+
+        self.assertEqual(len(index), 2)
+
+        self.assertEqual(index.find('AAAA', datetime.datetime(1999, 12, 31)), None)
+        self.assertEqual(index.find('AAAA', datetime.datetime(2000, 1, 1)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2003, 6, 1)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2005, 12, 31)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2005, 12, 31, 12, 0, 0)), None)
+        self.assertEqual(index.find('AAAA', datetime.datetime(2006, 1, 1)), 'Bitergia')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2100, 1, 1)), 'Bitergia')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2100, 1, 2)), None)
+        self.assertEqual(index.find('BBBB', datetime.datetime(2003, 6, 1)), 'LibreSoft')
+
+        # Unique identities not indexed
+        self.assertEqual(index.find('CCCC', datetime.datetime(2003, 6, 1)), None)
+
+    def test_find_overlapped_periods(self):
+        """Check if the first period added is selected when several overlap"""
+
+        index = EnrollmentsIndex()
+        index.add('AAAA', datetime.datetime(2000, 1, 1), datetime.datetime(2010, 1, 1), 'Bitergia')
+        index.add('AAAA', datetime.datetime(1900, 1, 1), datetime.datetime(2100, 1, 1), 'Example')
+        index.add('AAAA', datetime.datetime(2005, 1, 1), datetime.datetime(2015, 1, 1), 'LibreSoft')
+
+        self.assertEqual(index.find('AAAA', datetime.datetime(1999, 1, 1)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2000, 1, 1)), 'Bitergia')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2007, 1, 1)), 'Bitergia')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2010, 1, 1)), 'Bitergia')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2012, 1, 1)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2050, 1, 1)), 'Example')
+
+    def test_add_after_find(self):
+        """Check if new periods are taken into account after a search"""
+
+        index = EnrollmentsIndex()
+        index.add('AAAA', datetime.datetime(2000, 1, 1), datetime.datetime(2010, 1, 1), 'Bitergia')
+
+        self.assertEqual(index.find('AAAA', datetime.datetime(2012, 1, 1)), None)
+
+        index.add('AAAA', datetime.datetime(2011, 1, 1), datetime.datetime(2100, 1, 1), 'Example')
+
+        self.assertEqual(index.find('AAAA', datetime.datetime(2012, 1, 1)), 'Example')
+        self.assertEqual(index.find('AAAA', datetime.datetime(2005, 1, 1)), 'Bitergia')
+
+
+class TestOpenFile(unittest.TestCase):
+    """Unit tests for open_file"""
+
+    CONTENT = "Jöhn Smith <jsmith@example.com>\nJane Rae <jrae@example.com>\n"
+
+    def setUp(self):
+        self.tmp_path = tempfile.mkdtemp(prefix='sortinghat_')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_path)
+
+    def write_file(self, filename, opener=open):
+        filepath = os.path.join(self.tmp_path, filename)
+
+        with opener(filepath, 'wt', encoding='utf-8') as fd:
+            fd.write(self.CONTENT)
+
+        return filepath
+
+    def test_uncompressed(self):
+        """Check if plain text files are read"""
+
+        filepath = self.write_file('data.txt')
+
+        with open_file(filepath) as fd:
+            self.assertEqual(fd.read(), self.CONTENT)
+
+    def test_compressed_by_extension(self):
+        """Check if compressed files are read using their extension"""
+
+        for ext, opener in [('gz', gzip.open), ('bz2', bz2.open), ('xz', lzma.open)]:
+            filepath = self.write_file('data.json.' + ext, opener)
+
+            with open_file(filepath) as fd:
+                self.assertEqual(fd.read(), self.CONTENT)
+
+    def test_compressed_by_magic_bytes(self):
+        """Check if compressed files are read using their magic bytes"""
+
+        for ext, opener in [('gz', gzip.open), ('bz2', bz2.open), ('xz', lzma.open)]:
+            filepath = self.write_file('data_%s.json' % ext, opener)
+
+            with open_file(filepath) as fd:
+                self.assertEqual(fd.read(), self.CONTENT)
+
+    def test_file_not_found(self):
+        """Check if it fails when the file does not exist"""
+
+        filepath = os.path.join(self.tmp_path, 'notfound.json.gz')
+
+        with self.assertRaises(IOError):
+            open_file(filepath)
+
+    def test_input_file_type(self):
+        """Check if the argparse type opens the files"""
+
+        filepath = self.write_file('data.json.gz', gzip.open)
+
+        parser = argparse.ArgumentParser()
+        parser.add_argument('infile', type=InputFileType())
+
+        args = parser.parse_args([filepath])
+
+        with args.infile as fd:
+            self.assertEqual(fd.read(), self.CONTENT)
+
+        file_type = InputFileType()
+        filepath = os.path.join(self.tmp_path, 'notfound.json')
+
+        with self.assertRaisesRegex(argparse.ArgumentTypeError, "can't open"):
+            file_type(filepath)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2014-2021 Bitergia
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+import datetime
+import io
+import json
+import sys
+import unittest
+
+if '..' not in sys.path:
+    sys.path.insert(0, '..')
+
+from sortinghat.writer import SortingHatJSONWriter, \
+    SortingHatJSONLinesWriter, SortingHatMessagePackWriter, msgpack
+
+
+UIDENTITIES_HEADER_ERROR = "'uidentities' cannot be part of the header"
+UIDENTITIES_ORDER_ERROR = "unique identities must be written in order; %(uuid)s after %(last)s"
+
+
+def json_encoder(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError(repr(obj))
+
+
+class TestSortingHatJSONWriter(unittest.TestCase):
+    """Unit tests for SortingHatJSONWriter"""
+
+    def setUp(self):
+        self.header = {
+            'time': '2021-01-01 00:00:00.000000',
+            'source': 'unknown',
+            'blacklist': ['root', 'John Smith'],
+            'organizations': {
+                'Example': [{'domain': 'example.com', 'is_top': True}],
+                'Bitergia': []
+            }
+        }
+        self.uids = {
+            'a9b403e150dd4af8953a52a4bb841051e4b705d9': {
+                'uuid': 'a9b403e150dd4af8953a52a4bb841051e4b705d9',
+                'profile': {'name': 'John Smith', 'email': None, 'is_bot': False},
+                'enrollments': [{
+                    'organization': 'Example',
+                    'start': datetime.datetime(1900, 1, 1),
+                    'end': datetime.datetime(2100, 1, 1)
+                }],
+                'identities': [{'email': 'jsmith@example.com', 'source': 'scm'}]
+            },
+            'jdoe@example.com': {
+                'uuid': 'jdoe@example.com',
+                'profile': None,
+                'enrollments': [],
+                'identities': []
+            }
+        }
+
+    def write_document(self, header, uids, compact=False):
+        output = io.StringIO()
+
+        with SortingHatJSONWriter(output, header, compact=compact,
+                                  default=json_encoder) as writer:
+            for uuid in sorted(uids):
+                writer.write(uuid, uids[uuid])
+
+        return output.getvalue()
+
+    def test_write(self):
+        """Check if the document is the same generated by json.dumps"""
+
+        result = self.write_document(self.header, self.uids)
+
+        obj = dict(self.header)
+        obj['uidentities'] = self.uids
+        expected = json.dumps(obj, indent=4, sort_keys=True,
+                              default=json_encoder)
+
+        self.assertEqual(result, expected)
+
+    def test_write_compact(self):
+        """Check if the document is written using the compact format"""
+
+        result = self.write_document(self.header, self.uids, compact=True)
+
+        obj = dict(self.header)
+        obj['uidentities'] = self.uids
+        expected = json.dumps(obj, separators=(',', ':'), sort_keys=True,
+                              default=json_encoder)
+
+        self.assertEqual(result, expected)
+        self.assertNotIn('\n', result)
+
+    def test_write_empty(self):
+        """Check the output when no unique identities are written"""
+
+        for compact in (False, True):
+            result = self.write_document(self.header, {}, compact=compact)
+            obj = json.loads(result)
+            self.assertDictEqual(obj['uidentities'], {})
+
+        result = self.write_document({}, {})
+        self.assertEqual(result, json.dumps({'uidentities': {}}, indent=4))
+
+    def test_header_keys_after_uidentities(self):
+        """Check if header keys that go after 'uidentities' are written at the end"""
+
+        header = {
+            'zzz': [1, 2, 3],
+            'source': 'unknown'
+        }
+
+        for compact in (False, True):
+            result = self.write_document(header, self.uids, compact=compact)
+
+            obj = dict(header)
+            obj['uidentities'] = self.uids
+
+            if compact:
+                expected = json.dumps(obj, separators=(',', ':'), sort_keys=True,
+                                      default=json_encoder)
+            else:
+                expected = json.dumps(obj, indent=4, sort_keys=True,
+                                      default=json_encoder)
+
+            self.assertEqual(result, expected)
+
+    def test_uidentities_in_header(self):
+        """Check if it fails when the header includes unique identities"""
+
+        header = {'uidentities': {}}
+
+        with self.assertRaisesRegex(ValueError, UIDENTITIES_HEADER_ERROR):
+            SortingHatJSONWriter(io.StringIO(), header)
+
+    def test_unordered_uidentities(self):
+        """Check if it fails when unique identities are not given in order"""
+
+        writer = SortingHatJSONWriter(io.StringIO(), self.header)
+        writer.write('bbb', {})
+
+        expected = UIDENTITIES_ORDER_ERROR % {'uuid': 'aaa', 'last': 'bbb'}
+
+        with self.assertRaisesRegex(ValueError, expected):
+            writer.write('aaa', {})
+
+        # Duplicated unique identities are not allowed either
+        expected = UIDENTITIES_ORDER_ERROR % {'uuid': 'bbb', 'last': 'bbb'}
+
+        with self.assertRaisesRegex(ValueError, expected):
+            writer.write('bbb', {})
+
+
+class TestSortingHatJSONLinesWriter(unittest.TestCase):
+    """Unit tests for SortingHatJSONLinesWriter"""
+
+    def setUp(self):
+        self.header = {
+            'time': '2021-01-01 00:00:00.000000',
+            'source': 'unknown',
+            'blacklist': ['root'],
+            'organizations': {}
+        }
+        self.uids = [
+            {
+                'uuid': 'jdoe@example.com',
+                'profile': None,
+                'enrollments': [{
+                    'organization': 'Example',
+                    'start': datetime.datetime(1900, 1, 1),
+                    'end': datetime.datetime(2100, 1, 1)
+                }],
+                'identities': []
+            },
+            {
+                'uuid': 'a9b403e150dd4af8953a52a4bb841051e4b705d9',
+                'profile': {'name': 'John Smith', 'email': None, 'is_bot': False},
+                'enrollments': [],
+                'identities': [{'email': 'jsmith@example.com', 'source': 'scm'}]
+            }
+        ]
+
+    def test_write(self):
+        """Check if the header and each unique identity are written in their own line"""
+
+        output = io.StringIO()
+
+        with SortingHatJSONLinesWriter(output, self.header,
+                                       default=json_encoder) as writer:
+            for uid in self.uids:
+                writer.write(uid['uuid'], uid)
+
+        self.assertEqual(writer.nuids, 2)
+
+        lines = output.getvalue().split('\n')
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[-1], '')
+
+        # Records are written using a compact format
+        expected = json.dumps(self.header, separators=(',', ':'), sort_keys=True)
+        self.assertEqual(lines[0], expected)
+
+        record = json.loads(lines[1])
+        self.assertEqual(record['uuid'], 'jdoe@example.com')
+        self.assertEqual(record['enrollments'][0]['start'], '1900-01-01T00:00:00')
+
+        record = json.loads(lines[2])
+        self.assertDictEqual(record, self.uids[1])
+
+    def test_write_empty(self):
+        """Check if the header is written when there are no unique identities"""
+
+        output = io.StringIO()
+
+        writer = SortingHatJSONLinesWriter(output, self.header)
+        writer.close()
+
+        self.assertEqual(json.loads(output.getvalue()), self.header)
+
+    def test_uidentities_in_header(self):
+        """Check if it fails when the header includes unique identities"""
+
+        header = {'uidentities': {}}
+
+        with self.assertRaisesRegex(ValueError, UIDENTITIES_HEADER_ERROR):
+            SortingHatJSONLinesWriter(io.StringIO(), header)
+
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestSortingHatMessagePackWriter(unittest.TestCase):
+    """Unit tests for SortingHatMessagePackWriter"""
+
+    def test_write(self):
+        """Check if the header and the unique identities are written as records"""
+
+        header = {'source': None, 'blacklist': [], 'organizations': {}}
+        uid = {
+            'uuid': 'jdoe@example.com',
+            'profile': None,
+            'enrollments': [{
+                'organization': 'Example',
+                'start': datetime.datetime(1900, 1, 1),
+                'end': datetime.datetime(2100, 1, 1)
+            }],
+            'identities': []
+        }
+
+        output = io.BytesIO()
+
+        with SortingHatMessagePackWriter(output, header,
+                                         default=json_encoder) as writer:
+            writer.write(uid['uuid'], uid)
+
+        output.seek(0)
+        records = list(msgpack.Unpacker(output, raw=False))
+
+        self.assertEqual(len(records), 2)
+        self.assertDictEqual(records[0], header)
+
+        self.assertEqual(records[1]['uuid'], 'jdoe@example.com')
+        self.assertEqual(records[1]['enrollments'][0]['end'], '2100-01-01T00:00:00')
+
+
+if __name__ == "__main__":
+    unittest.main()